@@ -17,7 +17,7 @@ packages = [
     "rembg>=2.0.50",
     "Pillow>=10.0.0",
     "numpy>=1.24.0",
-    "replicate>=0.25.0",
+    "httpx>=0.24.0",
 ]
 
 print("[1/2] Installing dependencies...")
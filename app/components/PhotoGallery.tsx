@@ -1,14 +1,19 @@
 'use client';
 
 import { motion } from 'framer-motion';
+import { getResponsiveImage, largestSource, toSrcSet } from '../lib/images';
 
+// public/pic 파일명 (크기별 이미지와 블러 미리보기는 image-manifest.json에서 조회)
 const photos = [
-  { id: 1, src: 'https://picsum.photos/seed/wed2/400/600', tall: true },
-  { id: 2, src: 'https://picsum.photos/seed/wed3/400/400', tall: false },
-  { id: 3, src: 'https://picsum.photos/seed/wed4/400/400', tall: false },
-  { id: 4, src: 'https://picsum.photos/seed/wed5/400/600', tall: true },
+  { id: 1, file: 'w1.jpg', tall: true },
+  { id: 2, file: 'w2.jpg', tall: false },
+  { id: 3, file: 'w3.jpg', tall: false },
+  { id: 4, file: 'w4.jpg', tall: true },
 ];
 
+// 2열 그리드에서 사진 한 장이 차지하는 너비
+const SIZES = '(max-width: 448px) 50vw, 224px';
+
 export default function PhotoGallery() {
   return (
     <section className="section bg-slate-50/50">
@@ -23,23 +28,43 @@ export default function PhotoGallery() {
         </h2>
 
         <div className="grid grid-cols-2 gap-3">
-          {photos.map((photo, index) => (
-            <motion.img
-              key={photo.id}
-              src={photo.src}
-              alt={`Gallery ${index + 1}`}
-              className={`rounded-2xl object-cover w-full ${
-                index === 0 ? 'h-64 row-span-2' :
-                index === 1 ? 'h-32 mt-auto' :
-                index === 2 ? 'h-32 mb-auto' :
-                'h-64 row-span-2'
-              }`}
-              initial={{ opacity: 0, scale: 0.9 }}
-              whileInView={{ opacity: 1, scale: 1 }}
-              viewport={{ once: true }}
-              transition={{ delay: index * 0.1 }}
-            />
-          ))}
+          {photos.map((photo, index) => {
+            const image = getResponsiveImage(photo.file);
+            const fallback = image?.sources.webp ?? image?.sources.avif;
+
+            return (
+              <motion.picture
+                key={photo.id}
+                className={`block rounded-2xl overflow-hidden bg-cover bg-center ${
+                  index === 0 ? 'h-64 row-span-2' :
+                  index === 1 ? 'h-32 mt-auto' :
+                  index === 2 ? 'h-32 mb-auto' :
+                  'h-64 row-span-2'
+                }`}
+                style={image ? { backgroundImage: `url("${image.placeholder}")` } : undefined}
+                initial={{ opacity: 0, scale: 0.9 }}
+                whileInView={{ opacity: 1, scale: 1 }}
+                viewport={{ once: true }}
+                transition={{ delay: index * 0.1 }}
+              >
+                {image?.sources.avif && (
+                  <source type="image/avif" srcSet={toSrcSet(image.sources.avif)} sizes={SIZES} />
+                )}
+                {image?.sources.webp && (
+                  <source type="image/webp" srcSet={toSrcSet(image.sources.webp)} sizes={SIZES} />
+                )}
+                <img
+                  src={largestSource(fallback) ?? `/pic/${photo.file}`}
+                  width={image?.width}
+                  height={image?.height}
+                  alt={`Gallery ${index + 1}`}
+                  loading="lazy"
+                  decoding="async"
+                  className="object-cover w-full h-full"
+                />
+              </motion.picture>
+            );
+          })}
         </div>
       </motion.div>
     </section>
@@ -0,0 +1,19 @@
+import manifest from './image-manifest.json';
+import type { ResponsiveImage, ResponsiveImageSource } from '@/types';
+
+// public/pic 사진/영상의 미리 생성된 파생 파일 (python build_responsive_images.py)
+// (영상 항목은 manifest의 "videos"에 ResponsiveVideo 형식으로 기록됨)
+const { images } = manifest as { images: Record<string, ResponsiveImage> };
+
+export function getResponsiveImage(file: string): ResponsiveImage | undefined {
+  return images[file];
+}
+
+export function toSrcSet(sources: ResponsiveImageSource[] = []): string {
+  return sources.map((source) => `${source.src} ${source.width}w`).join(', ');
+}
+
+// srcset 중 가장 큰 파일 (<img src> 대체용)
+export function largestSource(sources: ResponsiveImageSource[] = []): string | undefined {
+  return sources[sources.length - 1]?.src;
+}
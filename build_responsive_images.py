@@ -0,0 +1,641 @@
+#!/usr/bin/env python3
+"""
+Responsive Image Builder
+========================
+Pre-generates the image widths the site serves, so the first visitor of
+each size does not wait for Next to resize a multi-megabyte JPEG.
+Videos get a poster frame and a lightweight preview clip, so pages can
+show those and fetch the full phone video only on demand.
+
+For every photo in public/pic this writes WebP and AVIF derivatives at
+the widths in next.config.js (deviceSizes), and records the intrinsic
+size and a tiny blur placeholder. Everything goes into a JSON manifest
+that the gallery imports:
+
+    app/lib/image-manifest.json
+    {
+      "version": 1,
+      "images": {
+        "w1.jpg": {
+          "width": 3024, "height": 4032,
+          "placeholder": "data:image/webp;base64,...",
+          "sources": {"avif": [{"width": 400, "src": "/pic/_responsive/w1-1a2b3c4d-400.avif"}, ...],
+                      "webp": [...]},
+          ...
+        }
+      },
+      "videos": {
+        "1000004139.mp4": {
+          "src": "/pic/1000004139.mp4", "width": 1080, "height": 1920, "duration": 14.2,
+          "poster": {"placeholder": "...", "sources": {...}},   # same shape as images
+          "preview": {"src": "/pic/_responsive/1000004139-9f8e7d6c-preview.mp4", "bytes": 412345},
+          ...
+        }
+      }
+    }
+
+Derivative names carry a short content hash, so they can be cached
+forever. Files are processed in parallel, and only files whose source
+changed since the last run are rebuilt. Derivatives nothing refers to
+any more are removed. Videos need ffmpeg and ffprobe on PATH; without
+them, video entries from earlier runs are kept as they are.
+
+Usage:
+    python build_responsive_images.py
+    python build_responsive_images.py --formats webp --widths 640,1280
+    python build_responsive_images.py --force
+    python build_responsive_images.py --no-videos
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from PIL import Image, ImageOps, features
+
+from convert_images import collect_images, stat_matches
+from wedding_bg_cache import FILE_MODE, atomic_write_bytes, atomic_write_image, file_digest
+from wedding_bg_dedupe import select_representatives
+
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+DEFAULT_SOURCE_DIR = "public/pic"
+DEFAULT_OUTPUT_DIR = "public/pic/_responsive"
+DEFAULT_MANIFEST = "app/lib/image-manifest.json"
+
+# URL prefix under which `public/` is served
+PUBLIC_DIR = "public"
+
+# Matches images.deviceSizes in next.config.js
+DEFAULT_WIDTHS = (400, 800, 1920)
+
+# Output formats: name -> (file extension, Pillow format, default quality)
+FORMATS = {
+    "avif": (".avif", "AVIF", 50),
+    "webp": (".webp", "WEBP", 80),
+}
+DEFAULT_FORMATS = ("avif", "webp")
+
+# Blur placeholder: long side (px) and WebP quality; a few hundred bytes each
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 40
+
+# Videos: poster frame chosen among the first frames after POSTER_OFFSET
+# of the duration, and a muted, downscaled preview clip for autoplay
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".m4v", ".webm"}
+POSTER_OFFSET = 0.1
+POSTER_CANDIDATES = 60
+PREVIEW_WIDTH = 480
+PREVIEW_CRF = 30
+PREVIEW_MAXRATE = "600k"
+PREVIEW_SECONDS = 10
+
+MANIFEST_VERSION = 1
+
+
+# =============================================================================
+# DERIVATIVES
+# =============================================================================
+
+def derivative_stem(name: str, sha256: str) -> str:
+    """
+    URL-safe base name for a photo's derivatives.
+
+    Non-ASCII characters and spaces are dropped (srcset splits on
+    whitespace); the content hash keeps names unique and cache-busting.
+    """
+    stem = re.sub(r"[^A-Za-z0-9_-]+", "-", Path(name).stem).strip("-")
+    return f"{stem or 'img'}-{sha256[:8]}"
+
+
+def public_url(path: Path) -> str:
+    """URL of a file under public/ (e.g. public/pic/a.webp -> /pic/a.webp)."""
+    return "/" + path.resolve().relative_to(Path(PUBLIC_DIR).resolve()).as_posix()
+
+
+def placeholder_data_uri(image: Image.Image) -> str:
+    """Tiny WebP data URI to show blurred while the real image loads."""
+    tiny = image.copy()
+    tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BILINEAR)
+    buffer = io.BytesIO()
+    tiny.save(buffer, format="WEBP", quality=PLACEHOLDER_QUALITY)
+    return "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def build_one(
+    source: str,
+    output_dir: str,
+    widths: Sequence[int],
+    formats: Sequence[str],
+    qualities: Dict[str, int],
+) -> dict:
+    """
+    Build every derivative of one photo (runs in a worker process).
+
+    The photo is decoded once, at the smallest draft scale that still
+    covers the largest width. Each smaller width is resized from the
+    previous one instead of from the full-size original.
+
+    Args:
+        source: Source image path
+        output_dir: Directory for derivative files
+        widths: Target widths in pixels
+        formats: Keys of FORMATS
+        qualities: Encoder quality per format
+
+    Returns:
+        Manifest entry (width, height, placeholder, sources, sha256)
+    """
+    source_path = Path(source)
+    sha256 = file_digest(source_path)
+    stem = derivative_stem(source_path.name, sha256)
+
+    with Image.open(source_path) as opened:
+        # draft() sizes are pre-rotation, so cover the largest width on both axes
+        largest = max(widths)
+        opened.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(opened)
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    icc = image.info.get("icc_profile")
+
+    # Intrinsic size as seen by the browser (after EXIF rotation)
+    with Image.open(source_path) as header:
+        width, height = header.size
+        if header.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            width, height = height, width
+
+    entry = {"width": width, "height": height}
+    entry.update(write_derivatives(image, width, stem, output_dir, widths, formats, qualities, icc))
+    entry["sha256"] = sha256
+    return entry
+
+
+def write_derivatives(
+    image: Image.Image,
+    width: int,
+    stem: str,
+    output_dir: str,
+    widths: Sequence[int],
+    formats: Sequence[str],
+    qualities: Dict[str, int],
+    icc: Optional[bytes] = None,
+) -> dict:
+    """
+    Encode `image` at each target width, largest first.
+
+    Args:
+        image: Decoded image (may be smaller than `width` after draft())
+        width: Intrinsic width the targets are capped at
+        stem: Base file name (see derivative_stem)
+        output_dir: Directory for derivative files
+        widths: Target widths in pixels
+        formats: Keys of FORMATS
+        qualities: Encoder quality per format
+        icc: ICC profile to embed, if any
+
+    Returns:
+        {"placeholder": data URI, "sources": {format: [{"width", "src"}, ...]}}
+    """
+    # Never upscale: widths at or above the source collapse into one full-width file
+    targets = sorted({min(w, width) for w in widths}, reverse=True)
+    sources: Dict[str, List[dict]] = {fmt: [] for fmt in formats}
+    current = image
+    for target in targets:
+        target_height = max(1, round(image.height * target / image.width))
+        if current.width != target:
+            current = current.resize((target, target_height), Image.Resampling.LANCZOS)
+        for fmt in formats:
+            ext, pil_format, _ = FORMATS[fmt]
+            path = Path(output_dir) / f"{stem}-{target}{ext}"
+            params = {"quality": qualities[fmt]}
+            if icc:
+                params["icc_profile"] = icc
+            atomic_write_image(current, path, pil_format, **params)
+            sources[fmt].append({"width": target, "src": public_url(path)})
+
+    for fmt in formats:
+        sources[fmt].reverse()
+    return {"placeholder": placeholder_data_uri(current), "sources": sources}
+
+
+# =============================================================================
+# VIDEOS
+# =============================================================================
+
+def collect_videos(source_dir: Path) -> List[Path]:
+    """Video files directly under `source_dir`, sorted."""
+    return sorted(
+        p for p in source_dir.iterdir()
+        if p.is_file() and p.suffix.lower() in VIDEO_EXTENSIONS and not p.name.startswith(".")
+    )
+
+
+def _run(command: List[str]) -> str:
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(f"{command[0]} failed: {lines[-1] if lines else result.returncode}")
+    return result.stdout
+
+
+def probe_video(path: Path) -> dict:
+    """
+    Duration and display size of a video, via ffprobe.
+
+    Phone videos are usually stored landscape with a rotation flag, so
+    width and height are swapped for +-90 degree rotations.
+    """
+    info = json.loads(_run([
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=width,height:stream_tags=rotate:stream_side_data=rotation"
+                         ":format=duration",
+        "-of", "json", str(path),
+    ]))
+    if not info.get("streams"):
+        raise ValueError("no video stream")
+    stream = info["streams"][0]
+    width, height = int(stream["width"]), int(stream["height"])
+
+    rotation = int(float(stream.get("tags", {}).get("rotate", 0) or 0))
+    for side_data in stream.get("side_data_list", []):
+        rotation = int(float(side_data.get("rotation", rotation) or 0))
+    if abs(rotation) % 180 == 90:
+        width, height = height, width
+
+    return {
+        "width": width,
+        "height": height,
+        "duration": round(float(info.get("format", {}).get("duration", 0) or 0), 2),
+    }
+
+
+def extract_poster(source: Path, duration: float, max_width: int) -> Image.Image:
+    """
+    Representative frame, picked by ffmpeg's thumbnail filter.
+
+    The filter scores a batch of frames starting POSTER_OFFSET into the
+    clip and keeps the one closest to the batch average, which skips
+    black fade-ins and motion-blurred frames.
+    """
+    with tempfile.TemporaryDirectory(prefix="poster-") as tmp:
+        frame = Path(tmp) / "poster.png"
+        _run([
+            "ffmpeg", "-v", "error", "-y",
+            "-ss", f"{duration * POSTER_OFFSET:.3f}", "-i", str(source),
+            "-vf", f"thumbnail={POSTER_CANDIDATES},scale='min({max_width},iw)':-2",
+            "-frames:v", "1", str(frame),
+        ])
+        with Image.open(frame) as poster:
+            return poster.convert("RGB")
+
+
+def encode_preview(source: Path, output: Path, width: int, seconds: float) -> None:
+    """Muted, downscaled H.264 clip with faststart, written atomically."""
+    output.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=output.parent, prefix=".tmp-", suffix=output.suffix)
+    os.close(fd)
+    try:
+        _run([
+            "ffmpeg", "-v", "error", "-y", "-i", str(source),
+            "-t", str(seconds), "-an",
+            "-vf", f"scale='min({width},iw)':-2",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", str(PREVIEW_CRF),
+            "-maxrate", PREVIEW_MAXRATE, "-bufsize", "1200k",
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            # Files already run in parallel; one encoder thread each avoids oversubscription
+            "-threads", "1",
+            tmp_name,
+        ])
+        os.chmod(tmp_name, FILE_MODE)
+        os.replace(tmp_name, output)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def build_video(
+    source: str,
+    output_dir: str,
+    widths: Sequence[int],
+    formats: Sequence[str],
+    qualities: Dict[str, int],
+) -> dict:
+    """
+    Build the poster derivatives and preview clip of one video (runs in a worker process).
+
+    Args:
+        source: Source video path
+        output_dir: Directory for derivative files
+        widths: Poster widths in pixels
+        formats: Poster formats (keys of FORMATS)
+        qualities: Encoder quality per format
+
+    Returns:
+        Manifest entry (src, width, height, duration, poster, preview, sha256)
+    """
+    source_path = Path(source)
+    sha256 = file_digest(source_path)
+    stem = derivative_stem(source_path.name, sha256)
+    info = probe_video(source_path)
+
+    poster = extract_poster(source_path, info["duration"], max(widths))
+    preview_path = Path(output_dir) / f"{stem}-preview.mp4"
+    encode_preview(source_path, preview_path, PREVIEW_WIDTH, PREVIEW_SECONDS)
+
+    return {
+        "src": public_url(source_path),
+        **info,
+        "poster": write_derivatives(
+            poster, min(poster.width, info["width"]), stem, output_dir, widths, formats, qualities
+        ),
+        "preview": {"src": public_url(preview_path), "bytes": preview_path.stat().st_size},
+        "sha256": sha256,
+    }
+
+
+# =============================================================================
+# MANIFEST
+# =============================================================================
+
+def load_manifest(path: Path) -> dict:
+    """Previous manifest, or an empty one if missing, unreadable or outdated."""
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        data = {}
+    if data.get("version") != MANIFEST_VERSION:
+        data = {"version": MANIFEST_VERSION, "images": {}}
+    return data
+
+
+def build_directory(
+    source_dir: str = DEFAULT_SOURCE_DIR,
+    output_dir: str = DEFAULT_OUTPUT_DIR,
+    manifest_path: str = DEFAULT_MANIFEST,
+    widths: Sequence[int] = DEFAULT_WIDTHS,
+    formats: Sequence[str] = DEFAULT_FORMATS,
+    quality: Optional[int] = None,
+    workers: Optional[int] = None,
+    force: bool = False,
+    videos: bool = True,
+    dedupe: bool = False,
+) -> Dict[str, int]:
+    """
+    Build derivatives for every changed photo and video, then rewrite the manifest.
+
+    Args:
+        source_dir: Directory of source photos and videos
+        output_dir: Directory for derivatives (must be under public/)
+        manifest_path: JSON manifest to read and write
+        widths: Target widths in pixels (also used for video posters)
+        formats: Keys of FORMATS
+        quality: Encoder quality for all formats (default: per-format)
+        workers: Worker processes (default: CPU count)
+        force: Rebuild everything regardless of the manifest
+        videos: Also build video posters and previews (needs ffmpeg/ffprobe)
+        dedupe: Build one photo per cluster of identical or near-duplicate
+            photos; the others share its derivatives ("alias_of" in the manifest)
+
+    Returns:
+        Counts of built, unchanged, failed and removed files
+    """
+    sources_root = Path(source_dir)
+    if not sources_root.is_dir():
+        raise FileNotFoundError(f"Directory not found: {source_dir}")
+    out_dir = Path(output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    public_url(out_dir)  # fail early if output is not served from public/
+
+    manifest_file = Path(manifest_path)
+    manifest = load_manifest(manifest_file)
+    settings = {
+        "widths": sorted(widths),
+        "formats": list(formats),
+        "quality": {fmt: quality or FORMATS[fmt][2] for fmt in formats},
+    }
+    video_settings = {
+        "preview_width": PREVIEW_WIDTH,
+        "preview_crf": PREVIEW_CRF,
+        "preview_seconds": PREVIEW_SECONDS,
+    }
+    same_settings = manifest.get("settings") == settings
+    same_video_settings = same_settings and manifest.get("video_settings") == video_settings
+
+    video_paths = collect_videos(sources_root) if videos else []
+    if video_paths and not (shutil.which("ffmpeg") and shutil.which("ffprobe")):
+        print("[WARN] ffmpeg/ffprobe not found; keeping previous video entries "
+              "(install ffmpeg to build posters and previews)")
+        video_paths = []
+        videos = False
+
+    image_paths = collect_images(sources_root)
+    aliases: Dict[str, str] = {}
+    if dedupe:
+        _, duplicates = select_representatives([str(p) for p in image_paths], workers=workers)
+        aliases = {
+            Path(duplicate).relative_to(sources_root).as_posix():
+                Path(representative).relative_to(sources_root).as_posix()
+            for duplicate, representative in duplicates.items()
+        }
+
+    entries: Dict[str, Dict[str, dict]] = {"images": {}, "videos": {}}
+    pending = []
+    for kind, paths, reusable in (
+        ("images", image_paths, same_settings),
+        ("videos", video_paths, same_video_settings),
+    ):
+        previous = manifest.get(kind, {}) if reusable else {}
+        for source in paths:
+            name = source.relative_to(sources_root).as_posix()
+            if name in aliases:
+                continue
+            entry = previous.get(name)
+            # Aliases are re-resolved every run, so never reuse one blindly
+            if not force and entry and "alias_of" not in entry and stat_matches(entry, source):
+                entries[kind][name] = entry
+            else:
+                pending.append((kind, name, source))
+    if not videos:
+        # Without ffmpeg, keep what an earlier run built rather than dropping it
+        entries["videos"] = {
+            name: entry for name, entry in manifest.get("videos", {}).items()
+            if (sources_root / name).exists()
+        }
+
+    unchanged = len(entries["images"]) + (len(entries["videos"]) if videos else 0)
+    counts = {"built": 0, "unchanged": unchanged, "failed": 0, "removed": 0}
+    print(f"Source: {sources_root}")
+    print(f"Output: {out_dir}")
+    print(f"Widths: {', '.join(map(str, settings['widths']))} | Formats: {', '.join(formats)}")
+    print(f"To build: {len(pending)} file(s), {counts['unchanged']} unchanged")
+    print()
+
+    if pending:
+        max_workers = min(workers or os.cpu_count() or 1, len(pending))
+        builders = {"images": build_one, "videos": build_video}
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                pool.submit(
+                    builders[kind], str(source), str(out_dir), settings["widths"], formats,
+                    settings["quality"],
+                ): (kind, name, source)
+                for kind, name, source in pending
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                kind, name, source = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    counts["failed"] += 1
+                    print(f"  [ERROR] ({done}/{len(pending)}) {name} - {e}")
+                    continue
+                stat = source.stat()
+                entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                entries[kind][name] = entry
+                counts["built"] += 1
+                detail = f"{entry['width']}x{entry['height']}"
+                if kind == "videos":
+                    detail += f", {entry['duration']}s, preview {entry['preview']['bytes'] // 1024} KB"
+                print(f"  [OK] ({done}/{len(pending)}) {name} - {detail}")
+
+    for name, representative in aliases.items():
+        if representative in entries["images"]:
+            stat = (sources_root / name).stat()
+            entries["images"][name] = {
+                **entries["images"][representative],
+                "alias_of": representative,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+            }
+    if aliases:
+        print(f"  {len(aliases)} duplicate photo(s) share their representative's files")
+
+    # Drop derivatives that no manifest entry refers to any more
+    referenced = {
+        Path(item["src"]).name
+        for entry in entries["images"].values()
+        for items in entry["sources"].values()
+        for item in items
+    }
+    for entry in entries["videos"].values():
+        referenced.add(Path(entry["preview"]["src"]).name)
+        referenced.update(
+            Path(item["src"]).name for items in entry["poster"]["sources"].values() for item in items
+        )
+    for path in out_dir.iterdir():
+        if path.is_file() and path.name not in referenced and not path.name.startswith(".tmp-"):
+            path.unlink()
+            counts["removed"] += 1
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "settings": settings,
+        "video_settings": video_settings if videos else manifest.get("video_settings"),
+        "images": dict(sorted(entries["images"].items())),
+        "videos": dict(sorted(entries["videos"].items())),
+    }
+    atomic_write_bytes(
+        (json.dumps(manifest, indent=2, ensure_ascii=False) + "\n").encode("utf-8"), manifest_file
+    )
+
+    print()
+    print(
+        f"[DONE] {counts['built']} built, {counts['unchanged']} unchanged, "
+        f"{counts['failed']} failed, {counts['removed']} stale file(s) removed"
+    )
+    print(f"  Manifest: {manifest_file}")
+    return counts
+
+
+# =============================================================================
+# CLI INTERFACE
+# =============================================================================
+
+def main() -> int:
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description="Pre-generate responsive WebP/AVIF images, video posters/previews "
+                    "and a placeholder manifest",
+    )
+    parser.add_argument("source_dir", nargs="?", default=DEFAULT_SOURCE_DIR,
+                        help=f"Directory of source photos (default: {DEFAULT_SOURCE_DIR})")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR,
+                        help=f"Derivative directory under public/ (default: {DEFAULT_OUTPUT_DIR})")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST,
+                        help=f"Manifest path (default: {DEFAULT_MANIFEST})")
+    parser.add_argument("--widths", default=",".join(map(str, DEFAULT_WIDTHS)),
+                        help=f"Comma-separated widths (default: {','.join(map(str, DEFAULT_WIDTHS))})")
+    parser.add_argument("--formats", default=",".join(DEFAULT_FORMATS),
+                        help=f"Comma-separated formats from: {', '.join(FORMATS)} "
+                             f"(default: {','.join(DEFAULT_FORMATS)})")
+    parser.add_argument("-q", "--quality", type=int, default=None,
+                        help="Encoder quality 1-100 for all formats "
+                             f"(default: {', '.join(f'{k} {v[2]}' for k, v in FORMATS.items())})")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true",
+                        help="Rebuild every photo and video regardless of the manifest")
+    parser.add_argument("--no-videos", action="store_true",
+                        help="Skip video posters and previews (keeps existing entries)")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="Build one photo per cluster of identical or near-duplicate photos")
+    args = parser.parse_args()
+
+    try:
+        widths = [int(w) for w in args.widths.split(",") if w.strip()]
+    except ValueError:
+        print(f"[ERROR] Invalid --widths: {args.widths}")
+        return 1
+    if not widths or min(widths) < 16:
+        print("[ERROR] --widths needs at least one width of 16 or more")
+        return 1
+
+    formats = [f.strip().lower() for f in args.formats.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown or not formats:
+        print(f"[ERROR] Unknown format(s): {', '.join(unknown) or '(none)'}")
+        return 1
+    if "avif" in formats and not features.check("avif"):
+        print("[WARN] This Pillow build cannot write AVIF; building WebP only")
+        formats = [f for f in formats if f != "avif"] or ["webp"]
+
+    if args.quality is not None and not 1 <= args.quality <= 100:
+        print(f"[ERROR] Quality must be between 1 and 100, got: {args.quality}")
+        return 1
+
+    try:
+        counts = build_directory(
+            source_dir=args.source_dir,
+            output_dir=args.output_dir,
+            manifest_path=args.manifest,
+            widths=widths,
+            formats=formats,
+            quality=args.quality,
+            workers=args.workers,
+            force=args.force,
+            videos=not args.no_videos,
+            dedupe=args.dedupe,
+        )
+    except (FileNotFoundError, ValueError) as e:
+        print(f"[ERROR] {e}")
+        return 1
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
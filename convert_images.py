@@ -1,43 +1,479 @@
-from PIL import Image
-from pillow_heif import register_heif_opener
+#!/usr/bin/env python3
+"""
+Image Converter
+===============
+Converts HEIF/HEIC (and any other Pillow-readable) photos to web formats.
+
+Phone exports often arrive as HEIF data behind a .jpg name, which browsers
+cannot display. The converter scans a directory, detects each file's real
+format and re-encodes the ones that need it on a process pool.
+
+A manifest of content hashes records what each file was converted from
+and with which settings, so re-runs skip unchanged files without decoding
+them. It lives in a per-user cache directory (or at --manifest), never in
+the output directory: public/pic is served as is. Every output is written to a temp
+file and renamed into place, so an interrupted run never leaves a
+truncated image behind.
+
+Usage:
+    python convert_images.py                         # public/pic, in place, JPEG q95
+    python convert_images.py pic/ --output-dir public/pic --format webp --quality 82
+    python convert_images.py public/pic --max-size 2560 --workers 4
+    python convert_images.py public/pic --force      # ignore the manifest
+
+In place (no --output-dir), only files whose content is not already in
+the target format are converted. When a converted file keeps its name,
+the original is kept next to it as <name>.<format>.bak.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
 import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from PIL import Image, ImageOps
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_AVAILABLE = True
+except ImportError:
+    HEIF_AVAILABLE = False
+
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
 
-# HEIF 지원 활성화
-register_heif_opener()
+DEFAULT_INPUT_DIR = "public/pic"
 
-# 변환할 파일 목록
-files_to_convert = ['3.jpg']
+# Output formats: name -> (file extension, Pillow format)
+OUTPUT_FORMATS = {
+    "jpeg": (".jpg", "JPEG"),
+    "webp": (".webp", "WEBP"),
+    "png": (".png", "PNG"),
+    "avif": (".avif", "AVIF"),
+}
+DEFAULT_FORMAT = "jpeg"
+DEFAULT_QUALITY = 95
 
-for filename in files_to_convert:
-    input_path = f'public/pic/{filename}'
-    backup_path = f'public/pic/{filename}.heif.bak'
+# Files considered for conversion (matched case-insensitively)
+IMAGE_EXTENSIONS = {
+    ".jpg", ".jpeg", ".png", ".webp", ".heic", ".heif", ".avif",
+    ".tif", ".tiff", ".bmp", ".gif",
+}
 
+# Manifests are kept per output directory under here (or at --manifest)
+DEFAULT_MANIFEST_DIR = Path(
+    os.environ.get("CONVERT_IMAGES_CACHE_DIR", Path.home() / ".cache" / "convert_images")
+)
+MANIFEST_VERSION = 1
+
+# Where earlier versions kept the manifest (inside the output directory)
+LEGACY_MANIFEST_NAME = ".convert_manifest.json"
+
+# mkstemp creates files as 0600; published files should be world-readable
+FILE_MODE = 0o644
+
+
+# =============================================================================
+# FILE HELPERS
+# =============================================================================
+
+def file_digest(path: Path, chunk_size: int = 2**20) -> str:
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def atomic_write(path: Path, write: Callable) -> None:
+    """Call write(file) on a temp file next to `path`, then rename it into place."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=path.suffix)
     try:
-        # 백업 생성 (이미 존재하면 건너뛰기)
-        if os.path.exists(input_path) and not os.path.exists(backup_path):
-            os.rename(input_path, backup_path)
-            print(f'백업 생성: {backup_path}')
-
-        # 백업 파일이 있는지 확인
-        if not os.path.exists(backup_path):
-            print(f'[SKIP] {filename} - 변환할 파일 없음')
-            continue
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.chmod(tmp_name, FILE_MODE)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def atomic_copy(src: Path, dst: Path) -> None:
+    """Copy a file into place atomically."""
+    with open(src, "rb") as source:
+        atomic_write(dst, lambda f: shutil.copyfileobj(source, f))
+
+
+# =============================================================================
+# MANIFEST
+# =============================================================================
+
+def default_manifest_path(target_dir: Path) -> Path:
+    """Manifest for an output directory, named after its resolved path."""
+    resolved = target_dir.resolve()
+    tag = hashlib.sha256(str(resolved).encode("utf-8")).hexdigest()[:16]
+    return DEFAULT_MANIFEST_DIR / f"{resolved.name or 'root'}-{tag}.json"
+
+
+def load_manifest(path: Path) -> Dict[str, dict]:
+    """Entries from a previous run, or an empty dict if missing or unreadable."""
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        return {}
+    return data.get("files", {})
+
+
+def save_manifest(path: Path, entries: Dict[str, dict]) -> None:
+    """Write the manifest atomically, sorted for stable diffs."""
+    payload = {"version": MANIFEST_VERSION, "files": dict(sorted(entries.items()))}
+    data = json.dumps(payload, indent=2, ensure_ascii=False).encode("utf-8")
+    atomic_write(path, lambda f: f.write(data))
+
+
+def settings_key(fmt: str, quality: int, max_size: int) -> str:
+    """Compact description of the encode settings an entry was made with."""
+    return f"{fmt}:q{quality}:max{max_size}"
+
+
+def stat_matches(entry: dict, path: Path) -> bool:
+    """True if the file still has the size and mtime recorded in `entry`."""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return False
+    return entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns
+
+
+def _stat_fields(path: Path) -> dict:
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+# =============================================================================
+# CONVERSION
+# =============================================================================
 
-        # HEIF 파일 열기 및 JPEG로 변환
-        img = Image.open(backup_path)
+def collect_images(input_dir: Path, recursive: bool = False) -> List[Path]:
+    """Image files under `input_dir`, sorted (backups and temp files excluded)."""
+    pattern = "**/*" if recursive else "*"
+    return sorted(
+        p for p in input_dir.glob(pattern)
+        if p.is_file()
+        and p.suffix.lower() in IMAGE_EXTENSIONS
+        and not p.name.startswith(".")
+    )
 
-        # RGB 모드로 변환 (JPEG는 RGBA를 지원하지 않음)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            img = img.convert('RGB')
 
-        # JPEG로 저장 (품질 95)
-        img.save(input_path, 'JPEG', quality=95, optimize=True)
-        print(f'[OK] 변환 완료: {filename} (HEIF -> JPEG)')
+def output_path_for(source: Path, input_dir: Path, output_dir: Path, fmt: str) -> Path:
+    """
+    Where a source file's conversion is written.
 
+    In place, a file already carrying the target extension keeps its name
+    (HEIF data behind a .jpg name stays at that URL); other files get the
+    target extension next to them.
+    """
+    ext = OUTPUT_FORMATS[fmt][0]
+    relative = source.relative_to(input_dir)
+    if output_dir == input_dir and source.suffix.lower() in _extensions_for(fmt):
+        return source
+    return output_dir / relative.with_suffix(ext)
+
+
+def _extensions_for(fmt: str) -> set:
+    return {".jpg", ".jpeg"} if fmt == "jpeg" else {OUTPUT_FORMATS[fmt][0]}
+
+
+def _prepare(image: Image.Image, pil_format: str, max_size: int) -> Image.Image:
+    """Apply EXIF orientation, downscale and convert to a mode the format can store."""
+    if max_size:
+        # Let JPEG decode at reduced scale instead of full size
+        image.draft("RGB", (max_size, max_size))
+    image = ImageOps.exif_transpose(image)
+    if max_size and max(image.size) > max_size:
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    if pil_format == "JPEG" or not has_alpha:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+    elif image.mode != "RGBA":
+        image = image.convert("RGBA")
+    return image
+
+
+def _save_params(image: Image.Image, pil_format: str, quality: int) -> dict:
+    params: dict = {}
+    exif = image.info.get("exif")
+    icc = image.info.get("icc_profile")
+    if exif:
+        params["exif"] = exif
+    if icc:
+        params["icc_profile"] = icc
+
+    if pil_format == "JPEG":
+        params.update(quality=quality, optimize=True, progressive=True)
+    elif pil_format == "WEBP":
+        params.update(quality=quality, method=4)
+    elif pil_format == "AVIF":
+        params.update(quality=quality)
+    elif pil_format == "PNG":
+        params.update(optimize=True)
+    return params
+
+
+def convert_one(
+    source: str,
+    output: str,
+    fmt: str,
+    quality: int,
+    max_size: int,
+    known_sha256: Optional[str],
+    in_place: bool,
+    backup: bool,
+) -> dict:
+    """
+    Convert one file (runs in a worker process).
+
+    Args:
+        source: Input image path
+        output: Output image path (may equal `source` in place)
+        fmt: Key of OUTPUT_FORMATS
+        quality: Encoder quality (JPEG/WebP/AVIF)
+        max_size: Downscale to this long side (0 = keep size)
+        known_sha256: Source hash recorded by the last run, if any
+        in_place: Skip files already stored in the target format
+        backup: Keep the original as <name>.<format>.bak when overwriting it
+
+    Returns:
+        Dict with status ("converted", "unchanged", "skipped" or "error"),
+        sha256 of the source, and message
+    """
+    source_path, output_path = Path(source), Path(output)
+    result = {"source": source, "output": output, "status": "error", "sha256": None, "message": ""}
+    try:
+        result["sha256"] = file_digest(source_path)
+        if known_sha256 == result["sha256"] and output_path.exists():
+            result["status"] = "unchanged"
+            return result
+
+        ext, pil_format = OUTPUT_FORMATS[fmt]
+        with Image.open(source_path) as image:
+            detected = image.format or "unknown"
+            if in_place and detected == pil_format and not max_size:
+                result["status"] = "skipped"
+                result["message"] = f"already {detected}"
+                return result
+
+            prepared = _prepare(image, pil_format, max_size)
+            params = _save_params(prepared, pil_format, quality)
+
+            if output_path == source_path and backup:
+                backup_path = source_path.with_name(f"{source_path.name}.{detected.lower()}.bak")
+                if not backup_path.exists():
+                    atomic_copy(source_path, backup_path)
+
+            atomic_write(output_path, lambda f: prepared.save(f, format=pil_format, **params))
+
+        if output_path == source_path:
+            # The output replaced the source, so the manifest tracks the new bytes
+            result["sha256"] = file_digest(output_path)
+        result["status"] = "converted"
+        result["message"] = f"{detected} -> {pil_format} {prepared.size[0]}x{prepared.size[1]}"
     except Exception as e:
-        print(f'[ERROR] 변환 실패: {filename} - {e}')
-        # 실패 시 백업 복원
-        if os.path.exists(backup_path):
-            os.rename(backup_path, input_path)
+        result["message"] = str(e)
+        if not HEIF_AVAILABLE and "cannot identify image file" in str(e):
+            result["message"] += " (HEIF input needs: pip install pillow-heif)"
+    return result
+
+
+# =============================================================================
+# DIRECTORY RUN
+# =============================================================================
+
+def convert_directory(
+    input_dir: str = DEFAULT_INPUT_DIR,
+    output_dir: Optional[str] = None,
+    fmt: str = DEFAULT_FORMAT,
+    quality: int = DEFAULT_QUALITY,
+    max_size: int = 0,
+    workers: Optional[int] = None,
+    recursive: bool = False,
+    force: bool = False,
+    backup: bool = True,
+    manifest_path: Optional[str] = None,
+) -> Dict[str, int]:
+    """
+    Convert every image in a directory that changed since the last run.
+
+    Args:
+        input_dir: Directory to scan
+        output_dir: Where outputs go (default: in place)
+        fmt: Output format (key of OUTPUT_FORMATS)
+        quality: Encoder quality (1-100)
+        max_size: Downscale to this long side (0 = keep size)
+        workers: Conversion processes (default: CPU count)
+        recursive: Also scan subdirectories
+        force: Ignore the manifest and reconvert everything
+        backup: Keep originals overwritten in place as .bak files
+        manifest_path: Manifest file (default: under DEFAULT_MANIFEST_DIR,
+            see default_manifest_path)
+
+    Returns:
+        Count of files per status
+    """
+    source_dir = Path(input_dir)
+    if not source_dir.is_dir():
+        raise FileNotFoundError(f"Directory not found: {input_dir}")
+    target_dir = Path(output_dir) if output_dir else source_dir
+    in_place = target_dir.resolve() == source_dir.resolve()
+    if in_place:
+        target_dir = source_dir
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    # Older runs left the manifest in the (publicly served) output directory
+    (target_dir / LEGACY_MANIFEST_NAME).unlink(missing_ok=True)
+    manifest_file = Path(manifest_path) if manifest_path else default_manifest_path(target_dir)
+    manifest = {} if force else load_manifest(manifest_file)
+    settings = settings_key(fmt, quality, max_size)
+
+    counts = {"converted": 0, "unchanged": 0, "skipped": 0, "error": 0}
+    pending = []
+    for source in collect_images(source_dir, recursive):
+        output = output_path_for(source, source_dir, target_dir, fmt)
+        key = source.relative_to(source_dir).as_posix()
+        entry = manifest.get(key)
+        if entry and entry.get("settings") != settings:
+            entry = None
+        if entry and stat_matches(entry, source) and Path(entry["output"]).exists():
+            counts["unchanged"] += 1
+            continue
+        pending.append((key, source, output, entry["sha256"] if entry else None))
+
+    print(f"Input: {source_dir}")
+    print(f"Output: {target_dir}{' (in place)' if in_place else ''}")
+    print(f"Format: {fmt} (quality {quality}{f', max {max_size}px' if max_size else ''})")
+    print(f"To check: {len(pending)} file(s), {counts['unchanged']} unchanged")
+    print()
+
+    if pending:
+        max_workers = min(workers or os.cpu_count() or 1, len(pending))
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                futures = {
+                    pool.submit(
+                        convert_one, str(source), str(output), fmt, quality, max_size,
+                        known, in_place, backup,
+                    ): key
+                    for key, source, output, known in pending
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    key = futures[future]
+                    result = future.result()
+                    status = result["status"]
+                    counts[status] += 1
+                    tag = {"converted": "[OK]", "error": "[ERROR]"}.get(status, "[SKIP]")
+                    detail = result["message"] or status
+                    print(f"  {tag} ({done}/{len(pending)}) {key} - {detail}")
+
+                    if status == "error":
+                        manifest.pop(key, None)
+                        continue
+                    manifest[key] = {
+                        "sha256": result["sha256"],
+                        **_stat_fields(source_dir / key),
+                        "output": result["output"] if status != "skipped" else str(source_dir / key),
+                        "settings": settings,
+                    }
+        finally:
+            save_manifest(manifest_file, manifest)
+
+    print()
+    print(
+        f"[DONE] {counts['converted']} converted, {counts['unchanged']} unchanged, "
+        f"{counts['skipped']} already {fmt}, {counts['error']} failed"
+    )
+    return counts
+
+
+# =============================================================================
+# CLI INTERFACE
+# =============================================================================
+
+def main() -> int:
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description="Convert HEIF/HEIC and other photos to web formats, incrementally",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  python convert_images.py
+  python convert_images.py public/pic --format webp --quality 82 --output-dir public/pic-webp
+  python convert_images.py public/pic --max-size 2560 --workers 4
+        """,
+    )
+    parser.add_argument("input_dir", nargs="?", default=DEFAULT_INPUT_DIR,
+                        help=f"Directory to scan (default: {DEFAULT_INPUT_DIR})")
+    parser.add_argument("--output-dir", default=None,
+                        help="Output directory (default: convert in place)")
+    parser.add_argument("-f", "--format", choices=sorted(OUTPUT_FORMATS), default=DEFAULT_FORMAT,
+                        help=f"Output format (default: {DEFAULT_FORMAT})")
+    parser.add_argument("-q", "--quality", type=int, default=DEFAULT_QUALITY,
+                        help=f"Encoder quality 1-100 (default: {DEFAULT_QUALITY})")
+    parser.add_argument("--max-size", type=int, default=0,
+                        help="Downscale to this long side in pixels (default: 0 = keep size)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Conversion processes (default: CPU count)")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="Also scan subdirectories")
+    parser.add_argument("--force", action="store_true",
+                        help="Ignore the manifest and reconvert every file")
+    parser.add_argument("--no-backup", action="store_true",
+                        help="Do not keep .bak copies of originals replaced in place")
+    parser.add_argument("--manifest", default=None,
+                        help=f"Manifest file (default: one per output directory in {DEFAULT_MANIFEST_DIR})")
+    args = parser.parse_args()
+
+    if not 1 <= args.quality <= 100:
+        print(f"[ERROR] Quality must be between 1 and 100, got: {args.quality}")
+        return 1
+    if args.max_size < 0 or (args.workers is not None and args.workers < 1):
+        print("[ERROR] --max-size must be positive and --workers at least 1")
+        return 1
+
+    try:
+        counts = convert_directory(
+            input_dir=args.input_dir,
+            output_dir=args.output_dir,
+            fmt=args.format,
+            quality=args.quality,
+            max_size=args.max_size,
+            workers=args.workers,
+            recursive=args.recursive,
+            force=args.force,
+            backup=not args.no_backup,
+            manifest_path=args.manifest,
+        )
+    except FileNotFoundError as e:
+        print(f"[ERROR] {e}")
+        return 1
+    return 1 if counts["error"] else 0
+
 
-print('\n변환 작업 완료!')
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+"""The wedding_bg_* modules are top-level scripts; make them importable."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,22 @@
+"""Tests for convert_images."""
+
+from PIL import Image
+
+import convert_images
+
+
+def test_manifest_stays_out_of_the_served_directory(tmp_path, monkeypatch):
+    """In-place runs must not publish the manifest next to the photos."""
+    monkeypatch.setattr(convert_images, "DEFAULT_MANIFEST_DIR", tmp_path / "cache")
+    site = tmp_path / "public" / "pic"
+    site.mkdir(parents=True)
+    Image.new("RGB", (40, 30), "red").save(site / "a.png")
+    (site / convert_images.LEGACY_MANIFEST_NAME).write_text("{}")
+
+    counts = convert_images.convert_directory(str(site), workers=1)
+    assert counts["converted"] == 1
+    assert sorted(p.name for p in site.iterdir()) == ["a.jpg", "a.png"]
+    assert convert_images.default_manifest_path(site).exists()
+
+    again = convert_images.convert_directory(str(site), workers=1)
+    assert again["converted"] == 0 and again["unchanged"] == 1
@@ -0,0 +1,29 @@
+"""Tests for wedding_bg_cache."""
+
+import os
+
+from wedding_bg_cache import atomic_copy
+
+
+def test_atomic_copy_does_not_share_the_source(tmp_path):
+    """Editing a copied output in place must leave the cache entry alone."""
+    entry = tmp_path / "cache" / "entry.png"
+    entry.parent.mkdir()
+    entry.write_bytes(b"cached")
+    output = tmp_path / "out" / "photo.png"
+
+    atomic_copy(entry, output)
+    assert not os.path.samefile(entry, output)
+    with open(output, "r+b") as f:
+        f.write(b"edited")
+    assert entry.read_bytes() == b"cached"
+
+
+def test_atomic_copy_links_on_request(tmp_path):
+    src = tmp_path / "a.bin"
+    src.write_bytes(b"data")
+    dst = tmp_path / "b.bin"
+
+    atomic_copy(src, dst, link=True)
+    assert dst.read_bytes() == b"data"
+    assert os.path.samefile(src, dst)
@@ -0,0 +1,159 @@
+"""Tests for the AdaptiveScheduler in wedding_bg_client."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from wedding_bg_client import PRIORITY_BULK, PRIORITY_INTERACTIVE, AdaptiveScheduler
+
+
+def test_priority_order():
+    """Queued interactive jobs get slots before bulk jobs queued earlier."""
+    order = []
+
+    async def job(scheduler, name, priority):
+        async with scheduler.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        scheduler = AdaptiveScheduler(initial=1, max_limit=1, min_limit=1, rate=0)
+        tasks = [asyncio.create_task(job(scheduler, f"bulk{i}", PRIORITY_BULK)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(job(scheduler, f"ui{i}", PRIORITY_INTERACTIVE)) for i in range(2)]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    # bulk0 took the free slot at once; then interactive, then bulk in FIFO order
+    assert order == ["bulk0", "ui0", "ui1", "bulk1", "bulk2"]
+
+
+def test_cancel_while_queued_frees_nothing():
+    async def main():
+        scheduler = AdaptiveScheduler(initial=1, max_limit=1, min_limit=1, rate=0)
+        async with scheduler.slot():
+            waiter = asyncio.create_task(scheduler.slot().__aenter__())
+            await asyncio.sleep(0)
+            assert scheduler.queue_depth == 1
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            assert scheduler.queue_depth == 0
+        assert scheduler.in_flight == 0
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize("cancel_first", [True, False])
+def test_cancel_in_same_tick_as_release(cancel_first):
+    """A waiter cancelled in the tick its slot is released re-raises CancelledError, leaking nothing."""
+    async def main():
+        scheduler = AdaptiveScheduler(initial=1, max_limit=1, min_limit=1, rate=0)
+        holder = scheduler.slot()
+        await holder.__aenter__()
+
+        async def wait_for_slot():
+            async with scheduler.slot():
+                pass
+
+        waiter = asyncio.create_task(wait_for_slot())
+        await asyncio.sleep(0)
+        if cancel_first:
+            waiter.cancel()  # _wake then pops the cancelled entry
+            await holder.__aexit__(None, None, None)
+        else:
+            await holder.__aexit__(None, None, None)  # _wake grants the waiter
+            waiter.cancel()  # ... before the grant is delivered
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        assert scheduler.in_flight == 0
+        assert scheduler.queue_depth == 0
+
+        async with scheduler.slot():
+            assert scheduler.in_flight == 1
+
+    asyncio.run(main())
+
+
+def test_rate_limit():
+    """Creations are spaced at `rate` per second once the burst is used up."""
+    async def main():
+        scheduler = AdaptiveScheduler(rate=20.0, burst=1.0)
+        start = time.monotonic()
+        for _ in range(6):
+            await scheduler.acquire_token()
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(main())
+    assert 0.2 <= elapsed < 0.5
+
+
+def test_shared_across_event_loops():
+    """Clients on different threads/loops share one set of slots."""
+    scheduler = AdaptiveScheduler(initial=2, max_limit=2, min_limit=2, rate=0)
+    peak = []
+
+    async def jobs():
+        async def one():
+            async with scheduler.slot():
+                peak.append(scheduler.in_flight)
+                await asyncio.sleep(0.01)
+        await asyncio.gather(*(one() for _ in range(5)))
+
+    threads = [threading.Thread(target=asyncio.run, args=(jobs(),)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(peak) == 15
+    assert max(peak) <= 2
+    assert scheduler.in_flight == 0
+
+
+def test_best_latency_forgets_outliers():
+    scheduler = AdaptiveScheduler(initial=4, rate=0)
+    scheduler.on_success(0.01)
+    for _ in range(100):
+        scheduler.on_success(1.0)
+    assert scheduler.best_latency == 1.0
+    assert scheduler.limit > 4
+
+
+def _create_attempts(responses):
+    """Number of POSTs create_prediction sends against a scripted API."""
+    import httpx
+
+    from wedding_bg_client import AsyncInpaintingClient
+
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        status, headers = responses[min(len(calls), len(responses)) - 1]
+        return httpx.Response(status, headers=headers, json={"id": "p1", "status": "starting"})
+
+    async def main():
+        client = AsyncInpaintingClient("token", base_url="http://api.test", backoff_base=0.0)
+        client._http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        async with client:
+            return await client.create_prediction("owner/model", {"prompt": "x"})
+
+    try:
+        asyncio.run(main())
+    except Exception:
+        pass
+    return len(calls)
+
+
+@pytest.mark.parametrize("status", [500, 502, 504])
+def test_create_not_retried_on_server_errors(status):
+    """The prediction may already exist, so a retry could start a duplicate job."""
+    assert _create_attempts([(status, {})]) == 1
+
+
+def test_create_retried_when_rejected_with_retry_after():
+    assert _create_attempts([(429, {"Retry-After": "0"}), (503, {"Retry-After": "0"}), (201, {})]) == 3
+    assert _create_attempts([(429, {})]) == 1
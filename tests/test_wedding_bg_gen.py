@@ -0,0 +1,155 @@
+"""Tests for wedding_bg_gen."""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from wedding_bg_gen import refine_mask_edges
+
+
+def _photo_and_mask(height=700, width=500, seed=0):
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:height, :width]
+    subject = ((yy - height / 2) ** 2 / (height / 3) ** 2 + (xx - width / 2) ** 2 / (width / 3) ** 2) < 1
+    pixels = np.where(subject[..., None], 200, 40) + rng.integers(0, 30, (height, width, 3))
+    photo = Image.fromarray(pixels.astype(np.uint8))
+
+    small = Image.fromarray(subject.astype(np.uint8) * 255).resize((width // 8, height // 8), Image.BILINEAR)
+    coarse = np.asarray(small.resize((width, height), Image.BILINEAR))
+    return photo, coarse
+
+
+def test_refine_mask_edges_tiled_matches_untiled():
+    """Tile seams must not show: a 2*radius halo makes each tile exact."""
+    photo, coarse = _photo_and_mask()
+    whole = refine_mask_edges(photo, coarse, tile_rows=coarse.shape[0])
+    for tile_rows in (64, 100, 256):
+        tiled = refine_mask_edges(photo, coarse, tile_rows=tile_rows)
+        np.testing.assert_array_equal(tiled, whole)
+
+
+def test_refine_mask_edges_tiled_matches_untiled_large_radius():
+    photo, coarse = _photo_and_mask(seed=1)
+    whole = refine_mask_edges(photo, coarse, radius=20, tile_rows=coarse.shape[0])
+    tiled = refine_mask_edges(photo, coarse, radius=20, tile_rows=50)
+    np.testing.assert_array_equal(tiled, whole)
+
+
+def _fake_masks(images, *args, **kwargs):
+    """Stand-in for rembg: a centred rectangle per photo."""
+    masks = []
+    for image in images:
+        mask = np.zeros((image.height, image.width), np.uint8)
+        mask[image.height // 4:-image.height // 4, image.width // 4:-image.width // 4] = 255
+        masks.append(Image.fromarray(mask))
+    return masks
+
+
+def test_process_batch_resume_keeps_duplicates_skipped(tmp_path, monkeypatch):
+    import wedding_bg_gen
+
+    monkeypatch.setattr(wedding_bg_gen, "generate_masks_batch", _fake_masks)
+    photo, _ = _photo_and_mask(300, 400)
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+    for name in ("a.jpg", "a (2).jpg"):
+        photo.save(inputs / name)
+    paths = sorted(str(p) for p in inputs.iterdir())
+
+    def run():
+        return wedding_bg_gen.process_batch(
+            paths, output_dir=str(tmp_path / "out"), backend="preview", dedupe=True,
+            workers=1, cache_dir=str(tmp_path / "cache"), use_mask_cache=False,
+        )
+
+    first = run()
+    assert sum(1 for r in first if r.duplicate_of) == 1
+    second = run()
+    assert [r.duplicate_of for r in second] == [r.duplicate_of for r in first]
+    assert sum(1 for r in second if r.resumed) == 1
+    assert len(list((tmp_path / "out").glob("*_preview.png"))) == 1
+
+
+def test_inpainting_backend_requires_inpaint():
+    from wedding_bg_gen import InpaintingBackend, PreviewBackend
+
+    class Incomplete(InpaintingBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    PreviewBackend()
+
+
+def test_export_image_keeps_encoder_options_apart(tmp_path):
+    """Parallel exports of one image must each use their own format's options."""
+    from wedding_bg_gen import OutputOptions, export_image
+
+    photo, _ = _photo_and_mask(400, 600)
+    options = OutputOptions(png_compress_level=1)
+    targets = [(tmp_path / f"out{i}.png", "PNG", 0) for i in range(4)]
+    targets += [(tmp_path / f"out{i}.jpg", "JPEG", 0) for i in range(4)]
+
+    results = export_image(photo, targets, options)
+    reference = export_image(photo, [targets[0]], options)[0]
+    for result in results:
+        assert Image.open(result.path).format == result.format
+        if result.format == "PNG":
+            assert result.bytes == reference.bytes
+    assert not hasattr(photo, "encoderinfo")
+
+
+class _FakeInner:
+    """Stand-in ONNX session: the prediction is the input's first channel."""
+
+    class _Input:
+        name = "input"
+        shape = ["batch", 3, 320, 320]
+
+    def get_inputs(self):
+        return [self._Input()]
+
+    def run(self, outputs, feed):
+        return [feed["input"][:, :1]]
+
+
+def test_single_and_batched_masks_share_preprocessing(monkeypatch):
+    """A photo's mask must not depend on which path segmented it."""
+    import types
+    import wedding_bg_gen
+
+    session = types.SimpleNamespace(inner_session=_FakeInner())
+    monkeypatch.setattr(wedding_bg_gen, "get_session", lambda *args, **kwargs: session)
+    photos = [_photo_and_mask(200, 150, seed)[0] for seed in range(3)]
+
+    batched = wedding_bg_gen.generate_masks_batch(photos, "u2net", batch_size=3)
+    for photo, mask in zip(photos, batched):
+        single = wedding_bg_gen.generate_mask(photo, "u2net")
+        np.testing.assert_array_equal(np.asarray(single), np.asarray(mask))
+
+
+def test_mask_variant_records_preprocessing():
+    from wedding_bg_gen import MASK_PREPROCESSING, _mask_variant
+
+    assert MASK_PREPROCESSING in _mask_variant("u2net", 1024, 0)
+    assert MASK_PREPROCESSING not in _mask_variant("birefnet-general", 0, 0)
+
+
+def test_profile_times_generate_mask(tmp_path, monkeypatch):
+    """--profile-models must time the segmentation the pipeline runs."""
+    import types
+    import wedding_bg_gen
+
+    session = types.SimpleNamespace(inner_session=_FakeInner())
+    monkeypatch.setattr(wedding_bg_gen, "get_session", lambda *args, **kwargs: session)
+    calls = []
+    original = wedding_bg_gen.generate_mask
+    monkeypatch.setattr(
+        wedding_bg_gen, "generate_mask", lambda *args: calls.append(args) or original(*args)
+    )
+    photo = tmp_path / "photo.png"
+    _photo_and_mask(200, 150)[0].save(photo)
+
+    row = wedding_bg_gen._profile_one_model("u2net", str(photo), 2, 100)
+    assert [args[1:] for args in calls] == [("u2net", 100)] * 2
+    assert row["model"] == "u2net" and row["min_s"] <= row["median_s"]
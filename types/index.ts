@@ -25,3 +25,25 @@ export interface RSVPFormData {
   guestCount: number;
   message?: string;
 }
+
+// build_responsive_images.py가 생성하는 이미지 매니페스트 (app/lib/image-manifest.json)
+export interface ResponsiveImageSource {
+  width: number;
+  src: string;
+}
+
+export interface ResponsiveImage {
+  width: number;
+  height: number;
+  placeholder: string;
+  sources: Partial<Record<'avif' | 'webp', ResponsiveImageSource[]>>;
+}
+
+export interface ResponsiveVideo {
+  src: string;
+  width: number;
+  height: number;
+  duration: number;
+  poster: Pick<ResponsiveImage, 'placeholder' | 'sources'>;
+  preview: { src: string; bytes: number };
+}
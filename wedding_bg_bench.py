@@ -0,0 +1,896 @@
+#!/usr/bin/env python3
+"""
+Wedding BG Generator - Benchmarks
+=================================
+Benchmarks for wedding_bg_gen.
+
+`pipeline` runs every pipeline stage over synthetic photos (1, 12 and
+48 MP by default) and any real photos given, with the inpainting API
+replaced by the local fake server, and writes median / p95 / peak memory
+per stage to a JSON file. `compare` diffs two such files so a commit can
+be checked for regressions. `dilate` compares mask dilation against the
+original implementation. `load` compares full decodes with reduced
+(draft-mode) decodes and raw-cache memory maps on real photos. `upload`
+reports the peak memory of building inline request bodies as base64
+strings versus streaming them from spooled files, for concurrent jobs.
+`scheduler` runs a burst of predictions against a throttling fake API
+with fixed and adaptive concurrency, and checks priority ordering.
+`mask-batch` reports masking throughput of rembg's one-photo-per-call
+inference versus batched inference at several batch sizes. `encode`
+times each output encoder and writes a multi-format export sequentially
+and in parallel.
+
+Usage:
+    python wedding_bg_bench.py pipeline -o bench.json
+    python wedding_bg_bench.py pipeline --sizes 1mp 12mp --photos wedding.jpg --repeats 7
+    python wedding_bg_bench.py compare baseline.json bench.json --threshold 0.15
+    python wedding_bg_bench.py dilate --size 4000x3000 --radii 3 7 20 --repeats 5
+    python wedding_bg_bench.py load pic/*.jpg --sizes 768 1024 2048
+    python wedding_bg_bench.py upload --size 48mp --jobs 4
+    python wedding_bg_bench.py scheduler --jobs 60 --capacity 8 --max-queue 4
+    python wedding_bg_bench.py mask-batch --model u2netp --batch-sizes 1 4 8 16 --intra-op-threads 8
+    python wedding_bg_bench.py encode --photo wedding.jpg --exports png jpeg webp:2048 avif:1024
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import PIL
+from PIL import Image, ImageFilter
+
+import wedding_bg_metrics as metrics
+from wedding_bg_cache import RawImageCache
+from wedding_bg_client import (
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    AsyncInpaintingClient,
+    InpaintingError,
+    json_body_stream,
+)
+from wedding_bg_fake_api import FakeReplicateServer
+from wedding_bg_gen import (
+    DEFAULT_MASK_MODEL,
+    DEFAULT_NEGATIVE_PROMPT,
+    DEFAULT_POSITIVE_PROMPT,
+    OUTPUT_FORMATS,
+    OutputOptions,
+    call_flux_inpainting,
+    dilate_mask,
+    encode_flux_images,
+    export_image,
+    generate_mask,
+    generate_masks_batch,
+    get_session,
+    image_to_base64,
+    image_to_bytes,
+    image_to_data_uri,
+    load_image,
+    preview_fill,
+    parse_export,
+    save_output,
+    set_session_threads,
+)
+
+# Named sizes for --sizes / --size
+SIZE_PRESETS = {
+    "1mp": (1224, 816),
+    "12mp": (4000, 3000),
+    "48mp": (8000, 6000),
+}
+
+# Stages run by `pipeline`, in pipeline order
+PIPELINE_STAGES = (
+    "load_image",
+    "generate_mask",
+    "dilate_mask",
+    "image_to_base64",
+    "image_to_data_uri",
+    "save_output",
+    "preview_fill",
+    "inpaint_fake",
+)
+
+RESULTS_VERSION = 1
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+
+def parse_size(value: str) -> Tuple[int, int]:
+    """Parse a WIDTHxHEIGHT string or a SIZE_PRESETS name."""
+    if value.lower() in SIZE_PRESETS:
+        return SIZE_PRESETS[value.lower()]
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected WIDTHxHEIGHT, got: {value}")
+    return width, height
+
+
+def synthetic_mask(size: Tuple[int, int], seed: int = 0) -> Image.Image:
+    """A subject-like blob mask: two overlapping ellipses plus speckle."""
+    width, height = size
+    yy, xx = np.ogrid[0:height, 0:width]
+    cx, cy = width / 2, height / 2
+    body = ((xx - cx * 0.85) / (width * 0.18)) ** 2 + ((yy - cy * 1.1) / (height * 0.4)) ** 2 < 1
+    partner = ((xx - cx * 1.15) / (width * 0.16)) ** 2 + ((yy - cy * 1.05) / (height * 0.38)) ** 2 < 1
+    rng = np.random.default_rng(seed)
+    speckle = rng.random((height, width)) > 0.9995
+    return Image.fromarray(((body | partner | speckle) * 255).astype(np.uint8))
+
+
+def synthetic_photo(size: Tuple[int, int], seed: int = 0) -> Image.Image:
+    """A photo-like RGB image: dark gradient backdrop, the mask's subjects, sensor noise."""
+    width, height = size
+    yy, xx = np.ogrid[0:height, 0:width]
+    photo = np.empty((height, width, 3), dtype=np.uint8)
+    photo[..., 0] = (40 + 60 * yy / height + 0 * xx).astype(np.uint8)
+    photo[..., 1] = (30 + 40 * xx / width + 0 * yy).astype(np.uint8)
+    photo[..., 2] = 50
+    subject = np.asarray(synthetic_mask(size, seed)) > 0
+    photo[subject] = (225, 215, 205)
+    rng = np.random.default_rng(seed)
+    photo += rng.integers(0, 12, size=photo.shape, dtype=np.uint8)
+    return Image.fromarray(photo)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Linear-interpolated percentile (pct in 0-100) of a non-empty list."""
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def time_call(func: Callable[[], object], repeats: int) -> List[float]:
+    """Run func `repeats` times and return wall-clock durations in seconds."""
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+# =============================================================================
+# DILATION
+# =============================================================================
+
+def legacy_dilate_mask(mask: Image.Image, dilation_pixels: int = 7) -> Image.Image:
+    """The original implementation: MaxFilter(3) once per pixel, then Image.eval."""
+    mask_array = np.array(mask)
+    binary_mask = (mask_array > 128).astype(np.uint8) * 255
+    dilated = Image.fromarray(binary_mask)
+    for _ in range(dilation_pixels):
+        dilated = dilated.filter(ImageFilter.MaxFilter(3))
+    return Image.eval(dilated, lambda x: 255 - x)
+
+
+def bench_dilate(size: Tuple[int, int], radii: List[int], repeats: int) -> int:
+    """Compare legacy and vectorized dilation; also checks they agree."""
+    mask = synthetic_mask(size)
+    print(f"Mask: {size[0]}x{size[1]} ({size[0] * size[1] / 1e6:.1f} MP), {repeats} repeats")
+    print()
+    print(f"{'radius':>6} {'legacy s':>10} {'numpy s':>10} {'feather s':>10} {'speedup':>8} {'match':>6}")
+
+    mismatches = 0
+    for radius in radii:
+        # dilate_mask logs a step line per call; keep the table readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy = statistics.median(time_call(lambda: legacy_dilate_mask(mask, radius), repeats))
+            vectorized = statistics.median(time_call(lambda: dilate_mask(mask, radius), repeats))
+            feathered = statistics.median(time_call(lambda: dilate_mask(mask, radius, 12), repeats))
+            same = np.array_equal(
+                np.asarray(legacy_dilate_mask(mask, radius)),
+                np.asarray(dilate_mask(mask, radius)),
+            )
+        mismatches += not same
+        print(
+            f"{radius:6d} {legacy:10.3f} {vectorized:10.3f} {feathered:10.3f} "
+            f"{legacy / vectorized:7.1f}x {'yes' if same else 'NO':>6}"
+        )
+
+    return 1 if mismatches else 0
+
+
+# =============================================================================
+# IMAGE LOADING
+# =============================================================================
+
+def legacy_load_image(image_path: str, max_size: int = 0) -> Image.Image:
+    """
+    load_image as it was before reduced decoding: a full decode, then a
+    resize by the caller when a smaller image was wanted.
+    """
+    img = Image.open(image_path)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGB")
+    img.load()
+    if max_size and max(img.size) > max_size:
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    return img
+
+
+def bench_load(photos: List[str], sizes: List[int], repeats: int) -> int:
+    """Total median decode time over photos, old vs new, per target size."""
+    usable = []
+    for photo in photos:
+        try:
+            with Image.open(photo) as probe:
+                probe.size
+            usable.append(photo)
+        except OSError as e:
+            print(f"  [SKIP] {photo}: {e}")
+    if not usable:
+        print("[ERROR] No readable photos")
+        return 1
+
+    megabytes = sum(os.path.getsize(photo) for photo in usable) / 2**20
+    print(f"{len(usable)} photo(s), {megabytes:.1f} MB, {repeats} repeats, "
+          f"summed median seconds")
+    print()
+    print(f"{'size':>8} {'full decode':>12} {'load_image':>12} {'speedup':>8}")
+
+    def total(func) -> float:
+        return sum(statistics.median(time_call(lambda: func(photo), repeats)) for photo in usable)
+
+    for size in [0] + sizes:
+        old = total(lambda p: legacy_load_image(p, size))
+        new = total(lambda p: load_image(p, size))
+        print(f"{size or 'full':>8} {old:12.3f} {new:12.3f} {old / new:7.1f}x")
+
+    with tempfile.TemporaryDirectory(prefix="bench-raw-") as cache_dir:
+        raw_cache = RawImageCache(cache_dir)
+        for photo in usable:
+            load_image(photo, raw_cache=raw_cache)
+        old = total(legacy_load_image)
+        new = total(lambda p: load_image(p, raw_cache=raw_cache))
+        print(f"{'raw mmap':>8} {old:12.3f} {new:12.3f} {old / new:7.1f}x")
+    return 0
+
+
+# =============================================================================
+# UPLOAD ENCODING
+# =============================================================================
+
+def legacy_inline_body(image: Image.Image, mask: Image.Image) -> bytes:
+    """Request body as built before streaming: data URI strings, then JSON bytes."""
+    inputs = {
+        "image": image_to_data_uri(image, "JPEG"),
+        "mask": image_to_data_uri(mask, "PNG"),
+        "prompt": DEFAULT_POSITIVE_PROMPT,
+    }
+    return json.dumps({"input": inputs}).encode("utf-8")
+
+
+def streamed_inline_body(image: Image.Image, mask: Image.Image) -> int:
+    """Encode into spooled files and stream the body as the client sends it; returns its length."""
+    encoded_image, encoded_mask = encode_flux_images(image, mask)
+    try:
+        inputs = {
+            "image": encoded_image.data_uri(),
+            "mask": encoded_mask.data_uri(),
+            "prompt": DEFAULT_POSITIVE_PROMPT,
+        }
+        _, body = json_body_stream({"input": inputs})
+
+        async def send() -> int:
+            return sum([len(chunk) async for chunk in body()])
+
+        return asyncio.run(send())
+    finally:
+        encoded_image.close()
+        encoded_mask.close()
+
+
+def measure_peak(func: Callable[[], object], jobs: int) -> Tuple[float, float]:
+    """
+    Run `jobs` copies of func concurrently; (traced peak MB, wall seconds).
+
+    The jobs finish together (a barrier holds each result until all are
+    done), as when several uploads are in flight at once. tracemalloc sees
+    Python and numpy allocations, not Pillow's internal image buffers,
+    which both variants share anyway.
+    """
+    barrier = threading.Barrier(jobs)
+
+    def job() -> None:
+        result = func()
+        barrier.wait()
+        del result
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(jobs) as pool:
+            for future in [pool.submit(job) for _ in range(jobs)]:
+                future.result()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2**20, time.perf_counter() - start
+
+
+def bench_upload(size: Tuple[int, int], photo: Optional[str], jobs: int) -> int:
+    """Peak traced memory of inline request bodies, legacy strings vs streamed."""
+    image = load_image(photo) if photo else synthetic_photo(size)
+    image.load()
+    mask = synthetic_mask(image.size)
+
+    label = photo or f"synthetic {image.width}x{image.height}"
+    print(f"{label}, {jobs} concurrent job(s)")
+    print()
+    print(f"{'body':<10} {'payload MB':>11} {'peak MB':>9} {'per job':>9} {'seconds':>9}")
+    payload_mb = len(legacy_inline_body(image, mask)) / 2**20
+    for name, func in (
+        ("strings", lambda: legacy_inline_body(image, mask)),
+        ("streamed", lambda: streamed_inline_body(image, mask)),
+    ):
+        peak_mb, seconds = measure_peak(func, jobs)
+        print(f"{name:<10} {payload_mb:11.1f} {peak_mb:9.1f} {peak_mb / jobs:9.1f} {seconds:9.2f}")
+    return 0
+
+
+# =============================================================================
+# SCHEDULER
+# =============================================================================
+
+def _tiny_inputs() -> dict:
+    return {"image": "data:image/png;base64," + base64.b64encode(
+        image_to_bytes(Image.new("RGB", (8, 8)), "PNG")
+    ).decode("ascii")}
+
+
+async def _run_burst(
+    server: FakeReplicateServer,
+    jobs: int,
+    concurrency: int,
+    max_concurrency: int,
+    rate: float,
+    interactive: int = 0,
+) -> dict:
+    """Submit `jobs` bulk predictions, then `interactive` ones; time each."""
+    inputs = _tiny_inputs()
+    finished: Dict[int, List[float]] = {PRIORITY_BULK: [], PRIORITY_INTERACTIVE: []}
+    failures = 0
+    start = time.monotonic()
+
+    async with AsyncInpaintingClient(
+        "fake", base_url=server.base_url, max_connections=64,
+        concurrency=concurrency, max_concurrency=max_concurrency, rate_limit=rate,
+        poll_interval=0.1, max_poll_interval=0.25, backoff_base=0.2,
+    ) as client:
+        async def job(priority: int) -> None:
+            nonlocal failures
+            try:
+                await client.run("fake/model", inputs, priority)
+                finished[priority].append(time.monotonic() - start)
+            except InpaintingError:
+                failures += 1
+
+        tasks = [asyncio.create_task(job(PRIORITY_BULK)) for _ in range(jobs)]
+        await asyncio.sleep(0)  # bulk jobs queue first
+        tasks += [asyncio.create_task(job(PRIORITY_INTERACTIVE)) for _ in range(interactive)]
+        await asyncio.gather(*tasks)
+        stats = client.scheduler.stats()
+
+    return {
+        "wall_s": time.monotonic() - start,
+        "failures": failures,
+        "bulk_mean_s": statistics.mean(finished[PRIORITY_BULK]) if finished[PRIORITY_BULK] else None,
+        "interactive_mean_s": (
+            statistics.mean(finished[PRIORITY_INTERACTIVE]) if finished[PRIORITY_INTERACTIVE] else None
+        ),
+        **stats,
+    }
+
+
+def bench_scheduler(
+    jobs: int,
+    latency: float,
+    capacity: int,
+    max_queue: int,
+    server_rate: float,
+    fixed: List[int],
+    interactive: int,
+) -> int:
+    """Fixed vs adaptive concurrency against a fake API with limited capacity."""
+    print(f"{jobs} predictions, fake API: {latency}s per prediction, capacity {capacity}, "
+          f"429 beyond {max_queue} queued or {server_rate:g} creates/s")
+    print()
+    print(f"{'client':<16} {'seconds':>8} {'jobs/s':>7} {'429s':>5} {'failed':>7} "
+          f"{'peak':>5} {'limit':>6}")
+
+    configs = [(f"fixed {n}", n, n) for n in fixed] + [("adaptive 4-32", 4, 32)]
+    for name, concurrency, ceiling in configs:
+        with FakeReplicateServer(latency=latency, capacity=capacity, max_queue=max_queue,
+                                 rate_limit=server_rate) as server:
+            result = asyncio.run(_run_burst(server, jobs, concurrency, ceiling, 0))
+            throttled = server.requests.get("429", 0)
+        print(f"{name:<16} {result['wall_s']:8.2f} {jobs / result['wall_s']:7.2f} "
+              f"{throttled:5d} {result['failures']:7d} {result['peak_in_flight']:5d} "
+              f"{result['limit']:6.1f}")
+
+    if interactive:
+        with FakeReplicateServer(latency=latency, capacity=capacity, max_queue=max_queue,
+                                 rate_limit=server_rate) as server:
+            result = asyncio.run(_run_burst(server, jobs, 4, 32, 0, interactive))
+        print()
+        print(f"Priority: {interactive} interactive jobs submitted after {jobs} bulk jobs")
+        print(f"  interactive finished after {result['interactive_mean_s']:.2f}s on average, "
+              f"bulk after {result['bulk_mean_s']:.2f}s")
+    return 0
+
+
+# =============================================================================
+# BATCHED MASKING
+# =============================================================================
+
+def bench_mask_batch(
+    model: str,
+    model_path: Optional[str],
+    size: Tuple[int, int],
+    photos: int,
+    batch_sizes: List[int],
+    repeats: int,
+    intra_op: int,
+    inter_op: int,
+) -> int:
+    """Masking throughput, rembg per photo vs generate_masks_batch per batch size."""
+    import rembg
+
+    set_session_threads(intra_op, inter_op)
+    options = {"model_path": model_path} if model_path else {}
+    if model_path:
+        model = "u2net_custom"
+    session = get_session(model, **options)
+    images = [synthetic_photo(size, seed) for seed in range(photos)]
+
+    def per_photo() -> None:
+        for image in images:
+            rembg.remove(image, session=session, only_mask=True)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        per_photo()  # warm-up: first runs allocate the runtime's buffers
+        timings = {"rembg": statistics.median(time_call(per_photo, repeats))}
+        for batch_size in batch_sizes:
+            run = lambda: generate_masks_batch(images, model, batch_size=batch_size, **options)
+            run()
+            timings[batch_size] = statistics.median(time_call(run, repeats))
+
+    print(f"{model}{f' ({model_path})' if model_path else ''}, {photos} photo(s) of "
+          f"{size[0]}x{size[1]}, ONNX threads {intra_op or 'default'} intra-op / "
+          f"{inter_op or 'default'} inter-op, median of {repeats}")
+    print()
+    print(f"{'batch':>8} {'seconds':>8} {'photos/s':>9} {'speedup':>8}")
+    baseline = timings["rembg"]
+    for name, seconds in timings.items():
+        label = "rembg" if name == "rembg" else str(name)
+        print(f"{label:>8} {seconds:8.2f} {photos / seconds:9.2f} {baseline / seconds:7.2f}x")
+    return 0
+
+
+# =============================================================================
+# OUTPUT ENCODING
+# =============================================================================
+
+def bench_encode(
+    size: Tuple[int, int],
+    photo: Optional[str],
+    exports: List[Tuple[str, int]],
+    repeats: int,
+) -> int:
+    """Seconds and bytes per output encoder, and sequential vs parallel export."""
+    image = load_image(photo) if photo else synthetic_photo(size)
+    image = image.convert("RGB")
+    options = OutputOptions()
+
+    with tempfile.TemporaryDirectory(prefix="bench-encode-") as tmp:
+        print(f"{image.width}x{image.height}{f' ({photo})' if photo else ''}, "
+              f"median of {repeats}")
+        print()
+        print(f"{'encoder':<22} {'seconds':>8} {'MB':>7}")
+
+        legacy = Path(tmp) / "legacy.png"
+        seconds = statistics.median(time_call(lambda: image.save(legacy, "PNG", quality=100), repeats))
+        print(f"{'png (Pillow default)':<22} {seconds:8.2f} {legacy.stat().st_size / 2**20:7.2f}")
+
+        targets = []
+        for name, max_size in exports:
+            format, extension = OUTPUT_FORMATS[name]
+            targets.append((Path(tmp) / f"out_{name}_{max_size}{extension}", format, max_size))
+        sequential = []
+        for target in targets:
+            times = time_call(lambda: export_image(image, [target], options), repeats)
+            sequential.append(statistics.median(times))
+            label = f"{target[1].lower()}{f' {target[2]}px' if target[2] else ''}"
+            print(f"{label:<22} {sequential[-1]:8.2f} {target[0].stat().st_size / 2**20:7.2f}")
+
+        parallel = statistics.median(time_call(lambda: export_image(image, targets, options), repeats))
+    print()
+    print(f"{len(targets)} export(s): {sum(sequential):.2f}s one after another, "
+          f"{parallel:.2f}s in parallel ({sum(sequential) / parallel:.1f}x, "
+          f"{os.cpu_count()} CPU(s))")
+    return 0
+
+
+# =============================================================================
+# PIPELINE
+# =============================================================================
+
+def _git_commit() -> Optional[str]:
+    """Short hash of the checked-out commit, if this is a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _bench_stage(
+    stage: str,
+    photo_path: str,
+    mask_path: str,
+    work_dir: str,
+    repeats: int,
+    options: Dict[str, object],
+) -> dict:
+    """
+    Time one stage on one photo (runs in a fresh process).
+
+    Inputs the stage needs (decoded photo, subject mask, dilated mask) are
+    prepared before the baseline RSS is taken, so stage_rss_mb is roughly
+    the extra memory the stage itself needed.
+    """
+    stage_options = dict(options)
+    if stage == "inpaint_fake":
+        server = FakeReplicateServer(latency=0.0).start()
+        os.environ["REPLICATE_BASE_URL"] = server.base_url
+
+    # Stage functions print progress lines; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        image = load_image(photo_path) if stage != "load_image" else None
+        if image is not None:
+            image.load()
+        mask = Image.open(mask_path).convert("L") if stage in ("dilate_mask", "preview_fill", "inpaint_fake") else None
+        dilated = (
+            dilate_mask(mask, options["dilation"]) if stage in ("preview_fill", "inpaint_fake") else None
+        )
+        output_path = str(Path(work_dir) / f"save_{os.getpid()}.png")
+
+        calls: Dict[str, Callable[[], object]] = {
+            # load_image opens lazily; include the decode the next stage would pay
+            "load_image": lambda: load_image(photo_path).load(),
+            "generate_mask": lambda: generate_mask(
+                image, stage_options["mask_model"], stage_options["mask_size"]
+            ),
+            "dilate_mask": lambda: dilate_mask(
+                mask, stage_options["dilation"], stage_options["feather"]
+            ),
+            "image_to_base64": lambda: image_to_base64(image),
+            "image_to_data_uri": lambda: image_to_data_uri(image),
+            "save_output": lambda: save_output(image, output_path),
+            "preview_fill": lambda: preview_fill(image, dilated),
+            "inpaint_fake": lambda: call_flux_inpainting(
+                image, dilated, DEFAULT_POSITIVE_PROMPT, DEFAULT_NEGATIVE_PROMPT,
+                api_token="fake", upload_size=stage_options["upload_size"],
+            ),
+        }
+        call = calls[stage]
+
+        baseline_rss = metrics.peak_rss_bytes()
+        # The first call pays one-off costs (model load, imports, connections)
+        cold = time_call(call, 1)[0]
+        durations = time_call(call, repeats)
+        peak_rss = metrics.peak_rss_bytes()
+
+    if stage == "inpaint_fake":
+        server.stop()
+
+    return {
+        "stage": stage,
+        "repeats": repeats,
+        "cold_s": round(cold, 6),
+        "median_s": round(statistics.median(durations), 6),
+        "p95_s": round(percentile(durations, 95), 6),
+        "min_s": round(min(durations), 6),
+        "peak_rss_mb": round(peak_rss / 2**20, 1) if peak_rss else None,
+        "stage_rss_mb": (
+            round((peak_rss - baseline_rss) / 2**20, 1) if peak_rss and baseline_rss else None
+        ),
+    }
+
+
+def bench_pipeline(
+    sizes: List[Tuple[int, int]],
+    photos: List[str],
+    stages: List[str],
+    repeats: int,
+    output_path: str,
+    options: Dict[str, object],
+) -> int:
+    """
+    Benchmark pipeline stages on synthetic and real photos; write JSON results.
+
+    Each (photo, stage) pair runs in its own short-lived process so the
+    peak memory figure belongs to that stage alone.
+    """
+    results = []
+    failures = 0
+
+    with tempfile.TemporaryDirectory(prefix="wedding_bg_bench_") as work_dir:
+        cases = []
+        for size in sizes:
+            label = f"synthetic-{size[0]}x{size[1]}"
+            photo_path = str(Path(work_dir) / f"{label}.jpg")
+            mask_path = str(Path(work_dir) / f"{label}_mask.png")
+            synthetic_photo(size).save(photo_path, quality=92)
+            synthetic_mask(size).save(mask_path)
+            cases.append((label, photo_path, mask_path, size))
+        for photo in photos:
+            with Image.open(photo) as opened:
+                size = opened.size
+            mask_path = str(Path(work_dir) / f"{Path(photo).stem}_mask.png")
+            synthetic_mask(size).save(mask_path)
+            cases.append((Path(photo).name, photo, mask_path, size))
+
+        print(f"{len(cases)} photo(s) x {len(stages)} stage(s), {repeats} repeats")
+        print()
+        print(f"{'input':<28} {'stage':<18} {'median s':>9} {'p95 s':>8} {'cold s':>8} {'peak MB':>8}")
+
+        for label, photo_path, mask_path, size in cases:
+            for stage in stages:
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    try:
+                        row = pool.submit(
+                            _bench_stage, stage, photo_path, mask_path, work_dir,
+                            repeats, options,
+                        ).result()
+                    except Exception as e:
+                        print(f"{label:<28} {stage:<18} [FAIL] {e}")
+                        failures += 1
+                        continue
+                row = {"input": label, "size": list(size), **row}
+                results.append(row)
+                peak = f"{row['peak_rss_mb']:8.0f}" if row["peak_rss_mb"] else "     n/a"
+                print(
+                    f"{label:<28} {stage:<18} {row['median_s']:9.3f} "
+                    f"{row['p95_s']:8.3f} {row['cold_s']:8.3f} {peak}"
+                )
+
+    report = {
+        "version": RESULTS_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pillow": PIL.__version__,
+        "options": options,
+        "results": results,
+    }
+    Path(output_path).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print()
+    print(f"Results written to: {output_path}")
+    return 1 if failures else 0
+
+
+def compare_results(baseline_path: str, current_path: str, threshold: float) -> int:
+    """
+    Compare two `pipeline` result files by median time.
+
+    Returns 1 if any (input, stage) got slower than baseline by more than
+    `threshold` (a fraction, e.g. 0.10 = 10%).
+    """
+    def load(path: str) -> Dict[Tuple[str, str], dict]:
+        report = json.loads(Path(path).read_text(encoding="utf-8"))
+        return {(row["input"], row["stage"]): row for row in report["results"]}
+
+    baseline = load(baseline_path)
+    current = load(current_path)
+
+    print(f"{'input':<28} {'stage':<18} {'base s':>8} {'now s':>8} {'change':>8}")
+    regressions = 0
+    for key in sorted(baseline.keys() & current.keys()):
+        before = baseline[key]["median_s"]
+        after = current[key]["median_s"]
+        change = (after - before) / before if before > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{key[0]:<28} {key[1]:<18} {before:8.3f} {after:8.3f} {change:+7.1%}{flag}")
+
+    for key in sorted(baseline.keys() ^ current.keys()):
+        where = "baseline" if key in baseline else "current"
+        print(f"{key[0]:<28} {key[1]:<18} only in {where}")
+
+    print()
+    print(f"{regressions} regression(s) above {threshold:.0%}")
+    return 1 if regressions else 0
+
+
+# =============================================================================
+# CLI INTERFACE
+# =============================================================================
+
+def create_parser() -> argparse.ArgumentParser:
+    """Create argument parser for CLI."""
+    parser = argparse.ArgumentParser(description="Wedding BG Generator benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    pipeline = subparsers.add_parser(
+        "pipeline", help="All pipeline stages on synthetic/real photos, fake API"
+    )
+    pipeline.add_argument("--sizes", type=parse_size, nargs="*", default=list(SIZE_PRESETS.values()),
+                          help="Synthetic photo sizes: 1mp, 12mp, 48mp or WIDTHxHEIGHT "
+                               "(default: 1mp 12mp 48mp)")
+    pipeline.add_argument("--photos", nargs="*", default=[],
+                          help="Real photos to benchmark as well")
+    pipeline.add_argument("--stages", nargs="+", choices=PIPELINE_STAGES, default=list(PIPELINE_STAGES),
+                          help="Stages to run (default: all)")
+    pipeline.add_argument("--repeats", type=int, default=5,
+                          help="Timed runs per stage, after one cold run (default: 5)")
+    pipeline.add_argument("-o", "--output", default="bench_results.json",
+                          help="JSON results file (default: bench_results.json)")
+    pipeline.add_argument("-m", "--mask-model", default=DEFAULT_MASK_MODEL,
+                          help=f"rembg model for generate_mask (default: {DEFAULT_MASK_MODEL})")
+    pipeline.add_argument("--mask-size", type=int, default=0,
+                          help="Low-resolution masking size (default: 0 = full resolution)")
+    pipeline.add_argument("-d", "--dilation", type=int, default=7,
+                          help="Dilation for dilate_mask (default: 7)")
+    pipeline.add_argument("--feather", type=int, default=6,
+                          help="Feather for dilate_mask (default: 6)")
+    pipeline.add_argument("--upload-size", type=int, default=0,
+                          help="upload_size for the fake inpainting call (default: 0)")
+
+    compare = subparsers.add_parser("compare", help="Diff two pipeline result files")
+    compare.add_argument("baseline", help="Earlier results JSON")
+    compare.add_argument("current", help="Newer results JSON")
+    compare.add_argument("--threshold", type=float, default=0.10,
+                         help="Median slowdown that counts as a regression (default: 0.10)")
+
+    dilate = subparsers.add_parser("dilate", help="Legacy vs vectorized mask dilation")
+    dilate.add_argument("--size", type=parse_size, default=(4000, 3000),
+                        help="Mask size WIDTHxHEIGHT (default: 4000x3000)")
+    dilate.add_argument("--radii", type=int, nargs="+", default=[3, 7, 15, 20],
+                        help="Dilation radii to compare (default: 3 7 15 20)")
+    dilate.add_argument("--repeats", type=int, default=3,
+                        help="Timed runs per measurement (default: 3)")
+
+    load = subparsers.add_parser("load", help="Full vs reduced decodes vs raw-cache mmap")
+    load.add_argument("photos", nargs="+", help="JPEG photos to decode")
+    load.add_argument("--sizes", type=int, nargs="*", default=[768, 1024, 2048],
+                      help="Reduced decode sizes (default: 768 1024 2048)")
+    load.add_argument("--repeats", type=int, default=3,
+                      help="Timed runs per measurement (default: 3)")
+
+    upload = subparsers.add_parser("upload", help="Peak memory of inline request bodies")
+    upload.add_argument("--size", type=parse_size, default=SIZE_PRESETS["12mp"],
+                        help="Synthetic photo size: 1mp, 12mp, 48mp or WIDTHxHEIGHT (default: 12mp)")
+    upload.add_argument("--photo", help="Real photo to encode instead of a synthetic one")
+    upload.add_argument("--jobs", type=int, default=4,
+                        help="Concurrent requests to build (default: 4)")
+
+    scheduler = subparsers.add_parser(
+        "scheduler", help="Fixed vs adaptive API concurrency against a throttling fake API"
+    )
+    scheduler.add_argument("--jobs", type=int, default=60, help="Predictions per run (default: 60)")
+    scheduler.add_argument("--latency", type=float, default=1.0,
+                           help="Fake prediction time in seconds (default: 1.0)")
+    scheduler.add_argument("--capacity", type=int, default=8,
+                           help="Fake API predictions processed at once (default: 8)")
+    scheduler.add_argument("--max-queue", type=int, default=4,
+                           help="Fake API queued predictions before HTTP 429 (default: 4)")
+    scheduler.add_argument("--server-rate", type=float, default=20.0,
+                           help="Fake API creates per second before HTTP 429 (default: 20)")
+    scheduler.add_argument("--fixed", type=int, nargs="*", default=[2, 32],
+                           help="Fixed concurrency levels to compare (default: 2 32)")
+    scheduler.add_argument("--interactive", type=int, default=4,
+                           help="Interactive jobs for the priority check (default: 4, 0 = skip)")
+
+    mask_batch = subparsers.add_parser(
+        "mask-batch", help="rembg per-photo vs batched mask inference throughput"
+    )
+    mask_batch.add_argument("-m", "--model", default=DEFAULT_MASK_MODEL,
+                            help=f"rembg model (default: {DEFAULT_MASK_MODEL})")
+    mask_batch.add_argument("--model-path",
+                            help="Custom ONNX model with u2net preprocessing, inside ~/.rembg")
+    mask_batch.add_argument("--size", type=parse_size, default=SIZE_PRESETS["1mp"],
+                            help="Synthetic photo size: 1mp, 12mp, 48mp or WIDTHxHEIGHT (default: 1mp)")
+    mask_batch.add_argument("--photos", type=int, default=32,
+                            help="Photos masked per run (default: 32)")
+    mask_batch.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16],
+                            help="Batch sizes to compare (default: 1 4 8 16)")
+    mask_batch.add_argument("--repeats", type=int, default=3,
+                            help="Timed runs per measurement (default: 3)")
+    mask_batch.add_argument("--intra-op-threads", type=int, default=0,
+                            help="ONNX Runtime threads per operator (default: 0 = onnxruntime default)")
+    mask_batch.add_argument("--inter-op-threads", type=int, default=0,
+                            help="ONNX Runtime threads across graph branches (default: 0)")
+
+    encode = subparsers.add_parser("encode", help="Output encoders, sequential vs parallel export")
+    encode.add_argument("--size", type=parse_size, default=SIZE_PRESETS["12mp"],
+                        help="Synthetic photo size: 1mp, 12mp, 48mp or WIDTHxHEIGHT (default: 12mp)")
+    encode.add_argument("--photo", help="Real photo to encode instead of a synthetic one")
+    encode.add_argument("--exports", type=parse_export, nargs="+",
+                        default=[("png", 0), ("jpeg", 0), ("webp", 2048), ("avif", 1024)],
+                        help="FORMAT[:SIZE] outputs (default: png jpeg webp:2048 avif:1024)")
+    encode.add_argument("--repeats", type=int, default=3,
+                        help="Timed runs per measurement (default: 3)")
+
+    return parser
+
+
+def main() -> int:
+    """Main entry point."""
+    args = create_parser().parse_args()
+
+    if args.benchmark == "pipeline":
+        if args.repeats < 1:
+            print("[ERROR] --repeats must be at least 1")
+            return 1
+        options = {
+            "mask_model": args.mask_model,
+            "mask_size": args.mask_size,
+            "dilation": args.dilation,
+            "feather": args.feather,
+            "upload_size": args.upload_size,
+        }
+        return bench_pipeline(
+            args.sizes, args.photos, args.stages, args.repeats, args.output, options
+        )
+    if args.benchmark == "compare":
+        return compare_results(args.baseline, args.current, args.threshold)
+    if args.benchmark == "dilate":
+        return bench_dilate(args.size, args.radii, args.repeats)
+    if args.benchmark == "load":
+        return bench_load(args.photos, args.sizes, args.repeats)
+    if args.benchmark == "upload":
+        return bench_upload(args.size, args.photo, args.jobs)
+    if args.benchmark == "scheduler":
+        return bench_scheduler(
+            args.jobs, args.latency, args.capacity, args.max_queue, args.server_rate,
+            args.fixed, args.interactive,
+        )
+    if args.benchmark == "encode":
+        return bench_encode(args.size, args.photo, args.exports, args.repeats)
+    if args.benchmark == "mask-batch":
+        if min(args.batch_sizes) < 1 or args.photos < 1:
+            print("[ERROR] --photos and --batch-sizes must be at least 1")
+            return 1
+        return bench_mask_batch(
+            args.model, args.model_path, args.size, args.photos, args.batch_sizes,
+            args.repeats, args.intra_op_threads, args.inter_op_threads,
+        )
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
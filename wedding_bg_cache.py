@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Wedding BG Generator - On-disk Caches
+=====================================
+Content-addressed caches shared by the CLI, batch workers and the GUI.
+
+Masks depend only on the image bytes, the rembg model and the threshold,
+so re-running a photo with another prompt or dilation can skip rembg.
+Inpainting results depend only on the exact request payload, so
+re-exporting an album does not pay for identical Replicate calls twice.
+Decoded photos can optionally be kept as raw arrays and memory-mapped
+back, which skips JPEG decoding on repeated runs.
+
+Environment:
+    WEDDING_BG_CACHE_DIR=~/.cache/wedding_bg   (cache root override)
+"""
+
+from __future__ import annotations
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Optional, Union
+
+from PIL import Image
+
+
+# Default cache root (overridable via WEDDING_BG_CACHE_DIR or --cache-dir)
+DEFAULT_CACHE_DIR = Path(
+    os.environ.get("WEDDING_BG_CACHE_DIR", Path.home() / ".cache" / "wedding_bg")
+)
+
+# Masks are stored as 1-bit PNGs (typically 20-100 KB for 12 MP photos)
+DEFAULT_MASK_CACHE_BYTES = 512 * 2**20
+
+# Decoded RGB arrays are ~36 MB per 12 MP photo; the raw cache is opt-in
+DEFAULT_RAW_CACHE_BYTES = 4 * 2**30
+
+# Bumped when cached masks stop matching what load_image returns
+# (v2: photos are EXIF-transposed before masking)
+MASK_KEY_VERSION = 2
+
+# Inpainting results are full-size PNGs, so the cap is larger
+DEFAULT_RESULT_CACHE_BYTES = 4 * 2**30
+DEFAULT_RESULT_MAX_AGE_DAYS = 30
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+
+def file_digest(path: Union[str, Path], chunk_size: int = 2**20) -> str:
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# mkstemp creates files as 0600; published files should be world-readable
+FILE_MODE = 0o644
+
+
+def atomic_write_bytes(data: bytes, path: Path) -> None:
+    """Write bytes to a temp file next to `path`, then rename it into place."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=path.suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_name, FILE_MODE)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def atomic_move(src: Path, dst: Path) -> None:
+    """
+    Move a file into place atomically.
+
+    Uses a plain rename when possible; across filesystems the data is
+    streamed into a temp file next to `dst` first, then renamed.
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        atomic_copy(src, dst)
+        Path(src).unlink(missing_ok=True)
+
+
+def atomic_copy(src: Path, dst: Path, link: bool = False) -> None:
+    """
+    Copy a file into place atomically.
+
+    With link=True the copy is a hard link when the filesystem allows it.
+    Only use that for files nobody edits: a program that saves the linked
+    output in place would rewrite the source (e.g. a cache entry) as well.
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=dst.parent, prefix=".tmp-", suffix=dst.suffix)
+    os.close(fd)
+    try:
+        os.unlink(tmp_name)
+        if link:
+            try:
+                os.link(src, tmp_name)
+            except OSError:
+                shutil.copyfile(src, tmp_name)
+        else:
+            shutil.copyfile(src, tmp_name)
+        os.replace(tmp_name, dst)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def atomic_write_image(image: Image.Image, path: Path, format: str, **params) -> None:
+    """Save an image to a temp file next to `path`, then rename it into place."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=path.suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, format=format, **params)
+        os.chmod(tmp_name, FILE_MODE)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+# =============================================================================
+# MASK CACHE
+# =============================================================================
+
+class MaskCache:
+    """
+    Persistent mask cache keyed by (image hash, model, threshold).
+
+    Entries are 1-bit PNG files named by their key. Recency is tracked via
+    file mtime (touched on every hit), so the cache stays consistent when
+    several batch worker processes share the same directory. When the
+    total size exceeds `max_bytes`, least recently used entries go first.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Union[str, Path]] = None,
+        max_bytes: int = DEFAULT_MASK_CACHE_BYTES,
+    ):
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR) / "masks"
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, image_path: Union[str, Path], model: str, threshold: int) -> str:
+        """Cache key for a photo file, rembg model and binarization threshold."""
+        return f"{file_digest(image_path)}-{model}-t{threshold}-v{MASK_KEY_VERSION}"
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.png"
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        """Return the cached binary mask (L mode, 0/255) or None."""
+        path = self._path(key)
+        try:
+            with Image.open(path) as cached:
+                mask = cached.convert("L")
+            os.utime(path)
+        except (FileNotFoundError, OSError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return mask
+
+    def put(self, key: str, mask: Image.Image) -> None:
+        """Store a binary mask (any mode; non-zero pixels become white)."""
+        binary = mask.convert("L").point(lambda v: 255 if v else 0, mode="1")
+        atomic_write_image(binary, self._path(key), "PNG", optimize=True)
+        self.evict()
+
+    def evict(self) -> int:
+        """Delete least recently used entries until under max_bytes; returns count."""
+        if not self.cache_dir.exists():
+            return 0
+
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*/*.png"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def summary(self) -> str:
+        """One-line hit/miss summary for run reports."""
+        return f"mask cache: {self.hits} hit(s), {self.misses} miss(es)"
+
+
+# =============================================================================
+# RAW IMAGE CACHE
+# =============================================================================
+
+class RawImageCache:
+    """
+    Decoded photos stored as uncompressed .npy arrays, read back via mmap.
+
+    Re-opening a cached photo maps the file instead of decoding a JPEG,
+    so repeated runs (and the second decode in batch inpainting) cost a
+    page-cache copy. Entries are keyed by image hash and decode size and
+    evicted least-recently-used (by mtime) above `max_bytes`, like
+    MaskCache.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Union[str, Path]] = None,
+        max_bytes: int = DEFAULT_RAW_CACHE_BYTES,
+    ):
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR) / "raw"
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, image_path: Union[str, Path], max_size: int = 0) -> str:
+        """Cache key for a photo file decoded at `max_size` (0 = full size)."""
+        return f"{file_digest(image_path)}-s{max_size}"
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.npy"
+
+    def get(self, key: str):
+        """Read-only memory-mapped (H, W, C) uint8 array, or None."""
+        import numpy as np
+
+        path = self._path(key)
+        try:
+            array = np.load(path, mmap_mode="r")
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return array
+
+    def put(self, key: str, array) -> None:
+        """Store an (H, W, C) uint8 array."""
+        import numpy as np
+
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-", suffix=".npy")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def evict(self) -> int:
+        """Delete least recently used entries until under max_bytes; returns count."""
+        if not self.cache_dir.exists():
+            return 0
+
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*/*.npy"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def summary(self) -> str:
+        """One-line hit/miss summary for run reports."""
+        return f"raw image cache: {self.hits} hit(s), {self.misses} miss(es)"
+
+
+# =============================================================================
+# INPAINTING RESULT CACHE
+# =============================================================================
+
+class ResultCache:
+    """
+    Persistent store of inpainting API results keyed by the full request.
+
+    Result files live under `results/` and are tracked in a SQLite index
+    (key -> file, size, created, last_used), so lookups are a primary-key
+    query rather than a directory scan even with thousands of entries.
+    Each operation opens its own connection, which keeps the cache safe to
+    use from API worker threads and from several processes at once.
+    Entries older than `max_age_days` are dropped, then least recently
+    used entries until the total size is under `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[Union[str, Path]] = None,
+        max_bytes: int = DEFAULT_RESULT_CACHE_BYTES,
+        max_age_days: float = DEFAULT_RESULT_MAX_AGE_DAYS,
+    ):
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR) / "results"
+        self.index_path = self.cache_dir / "index.sqlite"
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " filename TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.index_path, timeout=30)
+
+    @staticmethod
+    def key(model: str, inputs: dict) -> str:
+        """Cache key: SHA-256 over the model name and the canonical request JSON."""
+        payload = json.dumps({"model": model, "input": inputs}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get_path(self, key: str) -> Optional[Path]:
+        """Return the path of the cached result file or None (file stays owned by the cache)."""
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT filename FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            path = self.cache_dir / row[0] if row else None
+            if path and not path.exists():
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                path = None
+            elif path:
+                conn.execute(
+                    "UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key)
+                )
+
+        self._count(path is not None)
+        return path
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached result bytes or None."""
+        path = self.get_path(key)
+        try:
+            return path.read_bytes() if path else None
+        except FileNotFoundError:
+            return None
+
+    def _record(self, key: str, filename: str, size: int) -> None:
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, filename, size, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, filename, size, now, now),
+            )
+        self.evict()
+
+    def put(self, key: str, data: bytes, suffix: str = ".png") -> None:
+        """Store result bytes under `key` (replacing any existing entry)."""
+        filename = f"{key[:2]}/{key}{suffix}"
+        atomic_write_bytes(data, self.cache_dir / filename)
+        self._record(key, filename, len(data))
+
+    def put_file(self, key: str, src: Union[str, Path], suffix: str = ".png") -> Path:
+        """Move an already-written result file into the cache; returns its new path."""
+        filename = f"{key[:2]}/{key}{suffix}"
+        path = self.cache_dir / filename
+        atomic_move(Path(src), path)
+        self._record(key, filename, path.stat().st_size)
+        return path
+
+    def evict(self) -> int:
+        """Drop expired entries, then LRU entries over max_bytes; returns count."""
+        cutoff = time.time() - self.max_age_days * 86400
+        with closing(self._connect()) as conn, conn:
+            doomed = conn.execute(
+                "SELECT key, filename, size FROM entries WHERE created < ?", (cutoff,)
+            ).fetchall()
+
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            total -= sum(size for _, _, size in doomed)
+            if total > self.max_bytes:
+                expired = {key for key, _, _ in doomed}
+                for key, filename, size in conn.execute(
+                    "SELECT key, filename, size FROM entries ORDER BY last_used"
+                ):
+                    if total <= self.max_bytes:
+                        break
+                    if key not in expired:
+                        doomed.append((key, filename, size))
+                        total -= size
+
+            conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _, _ in doomed])
+
+        for _, filename, _ in doomed:
+            (self.cache_dir / filename).unlink(missing_ok=True)
+        return len(doomed)
+
+    def summary(self) -> str:
+        """One-line hit/miss summary for run reports."""
+        return f"result cache: {self.hits} hit(s), {self.misses} miss(es)"
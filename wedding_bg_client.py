@@ -0,0 +1,774 @@
+#!/usr/bin/env python3
+"""
+Wedding BG Generator - Async Replicate Client
+=============================================
+asyncio client for the Replicate predictions HTTP API.
+
+Creates predictions, polls them without blocking the event loop, and
+downloads results over a shared connection pool. Images that feed several
+predictions can be sent once through the files API (upload_file); inline
+images (DataURI inputs) are base64-encoded chunk by chunk while the request
+body streams, so no full-size base64 string is built. Every HTTP call has a
+timeout; transient failures (connection errors, 429, 5xx) are retried
+with jittered exponential backoff; cancelling the awaiting task also
+cancels the remote prediction.
+
+Predictions are admitted by an AdaptiveScheduler: a priority queue in
+front of an AIMD concurrency limit (raised while latency stays near its
+best, cut on 429/5xx or queueing delay) and a token-bucket rate limit
+on prediction creation.
+
+Requirements:
+    pip install httpx
+
+Environment:
+    REPLICATE_API_TOKEN=r8_xxxxx
+    REPLICATE_BASE_URL=https://api.replicate.com   (e.g. a local fake server)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import collections
+import concurrent.futures
+import contextlib
+import heapq
+import io
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from typing import (
+    Any, AsyncIterator, BinaryIO, Callable, Coroutine, Deque, Dict, Iterator, List, Optional,
+    Tuple, Union,
+)
+
+import httpx
+
+
+DEFAULT_BASE_URL = "https://api.replicate.com"
+
+# HTTP statuses worth retrying: throttling and server-side hiccups
+TRANSIENT_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# Statuses that, with a Retry-After header, mean the request was turned away
+# before any work was done; the only ones a prediction create is retried on
+# (a 500/502/504 may come back after the prediction was already created)
+REJECTED_STATUSES = {429, 503}
+
+# Prediction states that will not change any more
+TERMINAL_STATES = {"succeeded", "failed", "canceled"}
+
+# Job priorities (lower runs first): interactive runs jump ahead of bulk exports
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# Ceiling for the adaptive concurrency limit and default prediction
+# creation rate (Replicate allows 600 creates per minute)
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_RATE_LIMIT = 10.0
+
+# AIMD: the limit is multiplied by this on congestion, at most once per
+# cooldown, and latency above best * tolerance counts as congestion
+DECREASE_FACTOR = 0.7
+LATENCY_TOLERANCE = 2.0
+
+# The best latency is the minimum over this many recent completions, so one
+# fast outlier stops counting once the window moves past it
+LATENCY_WINDOW = 32
+
+# Raw bytes base64-encoded per chunk of a streamed data URI; a multiple of 3,
+# so chunks encode independently without padding
+DATA_URI_CHUNK = 3 * 2**15
+
+
+class InpaintingError(RuntimeError):
+    """A prediction failed, was canceled, or the API returned an error."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class InpaintingTimeout(InpaintingError, TimeoutError):
+    """A prediction did not finish within the configured timeout."""
+
+
+def _http_error(method: str, url: str, response: httpx.Response) -> InpaintingError:
+    """InpaintingError describing an HTTP error response."""
+    return InpaintingError(
+        f"{method} {url} -> HTTP {response.status_code}: {response.text[:200]}",
+        status=response.status_code,
+    )
+
+
+def _retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Parse a numeric Retry-After header, if present."""
+    value = response.headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+# =============================================================================
+# STREAMED REQUEST BODIES
+# =============================================================================
+
+class DataURI:
+    """
+    A model input sent inline as a base64 data URI, encoded while streaming.
+
+    The payload stays as raw bytes in `fileobj` (e.g. a spooled temp file);
+    base64 text is produced one chunk at a time as the request body is
+    written, and the file is re-read from the start on every retry.
+    """
+
+    def __init__(self, fileobj: BinaryIO, content_type: str):
+        self.fileobj = fileobj
+        self.content_type = content_type
+        self.size = fileobj.seek(0, os.SEEK_END)
+        self._prefix = f"data:{content_type};base64,".encode("ascii")
+
+    def __len__(self) -> int:
+        """Length of the data URI text."""
+        return len(self._prefix) + 4 * ((self.size + 2) // 3)
+
+    def chunks(self) -> Iterator[bytes]:
+        """The data URI text in chunks of at most 4/3 * DATA_URI_CHUNK bytes."""
+        yield self._prefix
+        self.fileobj.seek(0)
+        while True:
+            chunk = self.fileobj.read(DATA_URI_CHUNK)
+            if not chunk:
+                return
+            yield base64.b64encode(chunk)
+
+
+def _json_parts(payload: Any) -> List[Union[bytes, DataURI]]:
+    """JSON encoding of payload, split around DataURI values (emitted unquoted)."""
+    streamed: Dict[str, DataURI] = {}
+
+    def placeholder(value: Any) -> str:
+        if not isinstance(value, DataURI):
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+        token = uuid.uuid4().hex
+        streamed[token] = value
+        return token
+
+    text = json.dumps(payload, default=placeholder)
+    if not streamed:
+        return [text.encode("utf-8")]
+
+    parts: List[Union[bytes, DataURI]] = []
+    # re.split with a group alternates literal JSON and placeholder tokens
+    pieces = re.split('"(' + "|".join(streamed) + ')"', text)
+    for i, piece in enumerate(pieces):
+        if i % 2:
+            parts += [b'"', streamed[piece], b'"']
+        elif piece:
+            parts.append(piece.encode("utf-8"))
+    return parts
+
+
+def json_body_stream(payload: Any) -> Tuple[int, Callable[[], AsyncIterator[bytes]]]:
+    """
+    Content length and a body factory for a JSON payload with DataURI values.
+
+    Each call of the factory starts a fresh pass over the body, so a retried
+    request re-sends it in full. Base64 needs no JSON escaping, which is what
+    lets the data URIs be written between literal quote characters.
+    """
+    parts = _json_parts(payload)
+
+    async def body() -> AsyncIterator[bytes]:
+        for part in parts:
+            if isinstance(part, bytes):
+                yield part
+            else:
+                # Spooled files are in memory or a small local read away
+                for chunk in part.chunks():
+                    yield chunk
+
+    return sum(len(part) for part in parts), body
+
+
+# =============================================================================
+# SCHEDULER
+# =============================================================================
+
+class AdaptiveScheduler:
+    """
+    Admission control for predictions on one event loop.
+
+    Jobs wait in a priority queue (lower value first, FIFO within a
+    priority) for one of `limit` slots. The limit follows AIMD: each
+    completion with latency near the recent best (minimum of the last
+    LATENCY_WINDOW completions) adds 1/limit (about +1 per round of
+    completions); a 429/5xx or a latency above best * latency_tolerance
+    multiplies it by DECREASE_FACTOR, at most once per cooldown so one
+    burst of errors counts as one congestion event. Prediction creation
+    additionally draws from a token bucket.
+
+    One scheduler may be shared by clients on different event loops and
+    threads (e.g. GUI jobs next to a batch run), so that priorities, the
+    rate limit and the backoff apply to the whole process; its state is
+    guarded by a lock and waiters are woken on their own loop.
+
+    Args:
+        initial: Starting concurrency limit
+        max_limit: Ceiling for the limit
+        min_limit: Floor for the limit
+        rate: Tokens (prediction creations) per second; 0 = unlimited
+        burst: Bucket size (default: one second of tokens)
+        latency_tolerance: Latency over best * this counts as congestion
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        max_limit: int = DEFAULT_MAX_CONCURRENCY,
+        min_limit: int = 1,
+        rate: float = DEFAULT_RATE_LIMIT,
+        burst: Optional[float] = None,
+        latency_tolerance: float = LATENCY_TOLERANCE,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(min(max(initial, min_limit), self.max_limit))
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.latency_tolerance = latency_tolerance
+
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.throttled = 0
+        self.decreases = 0
+        self._latencies: Deque[float] = collections.deque(maxlen=LATENCY_WINDOW)
+
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._tokens = self.burst
+        self._refilled = time.monotonic()
+        self._last_decrease = 0.0
+
+    @classmethod
+    def for_limits(
+        cls, concurrency: int, max_concurrency: int, rate_limit: float
+    ) -> "AdaptiveScheduler":
+        """Scheduler starting at `concurrency`; a ceiling at or below it pins the limit (no AIMD)."""
+        return cls(
+            concurrency, max_concurrency,
+            min_limit=concurrency if max_concurrency <= concurrency else 1,
+            rate=rate_limit,
+        )
+
+    @property
+    def best_latency(self) -> Optional[float]:
+        """Lowest latency among the recent completions."""
+        return min(self._latencies) if self._latencies else None
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting for a slot."""
+        return len(self._waiters)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of queue depth, in-flight count, limit and feedback counters."""
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "limit": round(self.limit, 2),
+            "completed": self.completed,
+            "throttled": self.throttled,
+            "decreases": self.decreases,
+            "best_latency_s": round(self.best_latency, 3) if self.best_latency else None,
+        }
+
+    def summary(self) -> str:
+        """One-line report for the end of a run."""
+        return (
+            f"scheduler: limit {self.limit:.1f}, peak {self.peak_in_flight} in flight, "
+            f"{self.throttled} throttled response(s), {self.decreases} slowdown(s)"
+        )
+
+    # -------------------------------------------------------------------------
+    # Slots
+    # -------------------------------------------------------------------------
+
+    def _capacity(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def _grant(self) -> None:
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _wake(self) -> None:
+        """Hand free slots to the highest-priority waiters (lock held)."""
+        while self._waiters and self.in_flight < self._capacity():
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                self._grant()
+                waiter.get_loop().call_soon_threadsafe(self._deliver, waiter)
+
+    def _deliver(self, waiter: asyncio.Future) -> None:
+        """Complete a granted waiter on its own loop."""
+        if waiter.done():
+            self._release()  # cancelled after the slot was granted
+        else:
+            waiter.set_result(None)
+
+    def _release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE) -> AsyncIterator[None]:
+        """Hold one concurrency slot for the duration of the block."""
+        with self._lock:
+            waiter = None
+            if not self._waiters and self.in_flight < self._capacity():
+                self._grant()
+            else:
+                waiter = asyncio.get_running_loop().create_future()
+                entry = (priority, next(self._order), waiter)
+                heapq.heappush(self._waiters, entry)
+        if waiter is not None:
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release()  # granted just as we were cancelled
+                else:
+                    with self._lock:
+                        # _wake may have popped the entry already; a slot it
+                        # granted is handed back by _deliver
+                        with contextlib.suppress(ValueError):
+                            self._waiters.remove(entry)
+                            heapq.heapify(self._waiters)
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def acquire_token(self) -> None:
+        """Wait for one token from the rate-limit bucket."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+                self._refilled = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+
+    # -------------------------------------------------------------------------
+    # Feedback
+    # -------------------------------------------------------------------------
+
+    def _cooldown(self) -> float:
+        # Roughly one round trip, so a decrease can take effect before the next
+        return max(1.0, self.best_latency or 0.0)
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < self._cooldown():
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_limit), self.limit * DECREASE_FACTOR)
+        self.decreases += 1
+
+    def on_throttle(self) -> None:
+        """Record a 429/5xx response."""
+        with self._lock:
+            self.throttled += 1
+            self._decrease()
+
+    def on_success(self, latency: float) -> None:
+        """Record a completed prediction and its end-to-end latency."""
+        with self._lock:
+            self.completed += 1
+            self._latencies.append(latency)
+            if latency > self.best_latency * self.latency_tolerance:
+                self._decrease()
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+                self._wake()
+
+
+# =============================================================================
+# CLIENT
+# =============================================================================
+
+class AsyncInpaintingClient:
+    """
+    Pooled, retrying client for Replicate predictions.
+
+    Use as an async context manager so the connection pool is closed:
+
+        async with AsyncInpaintingClient(token) as client:
+            data = await client.run("black-forest-labs/flux-fill-dev", inputs)
+
+    Args:
+        api_token: Replicate API token (default: REPLICATE_API_TOKEN env)
+        base_url: API root (default: REPLICATE_BASE_URL env or api.replicate.com)
+        max_connections: Size of the shared HTTP connection pool
+        concurrency: Starting number of predictions in flight via run()
+        max_concurrency: Ceiling the adaptive limit may grow to (at most
+            `concurrency` fixes the limit at `concurrency`)
+        rate_limit: Prediction creations per second (0 = unlimited)
+        request_timeout: Per-HTTP-request timeout in seconds
+        prediction_timeout: Overall limit for one prediction to finish
+        poll_interval: First polling delay; grows 1.5x up to max_poll_interval
+        max_poll_interval: Upper bound on the polling delay
+        max_retries: Retries per HTTP request for transient failures
+        backoff_base: Backoff scale in seconds (full jitter, doubling per try)
+        backoff_max: Upper bound on a single backoff sleep
+        scheduler: Shared AdaptiveScheduler; when given, concurrency,
+            max_concurrency and rate_limit are ignored
+    """
+
+    def __init__(
+        self,
+        api_token: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_connections: int = 10,
+        concurrency: int = 4,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        rate_limit: float = DEFAULT_RATE_LIMIT,
+        request_timeout: float = 30.0,
+        prediction_timeout: float = 300.0,
+        poll_interval: float = 1.0,
+        max_poll_interval: float = 5.0,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        scheduler: Optional[AdaptiveScheduler] = None,
+    ):
+        token = api_token or os.environ.get("REPLICATE_API_TOKEN")
+        if not token:
+            raise ValueError(
+                "REPLICATE_API_TOKEN not found. "
+                "Set it via environment variable or --api-token flag."
+            )
+
+        self.base_url = (
+            base_url or os.environ.get("REPLICATE_BASE_URL") or DEFAULT_BASE_URL
+        ).rstrip("/")
+        self.prediction_timeout = prediction_timeout
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # The token only goes to the API host, never to result download URLs
+        self._auth_headers = {"Authorization": f"Bearer {token}"}
+        self.scheduler = scheduler or AdaptiveScheduler.for_limits(
+            concurrency, max_concurrency, rate_limit
+        )
+        self._http = httpx.AsyncClient(
+            timeout=httpx.Timeout(request_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            follow_redirects=True,
+        )
+
+    async def __aenter__(self) -> "AsyncInpaintingClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close pooled connections."""
+        await self._http.aclose()
+
+    # -------------------------------------------------------------------------
+    # HTTP with retries
+    # -------------------------------------------------------------------------
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Full-jitter exponential backoff, never shorter than Retry-After."""
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        delay = random.uniform(0, ceiling)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        idempotent: bool = True,
+        body: Optional[Callable[[], AsyncIterator[bytes]]] = None,
+        **kwargs,
+    ) -> httpx.Response:
+        """
+        Send one request, retrying transient failures.
+
+        Non-idempotent requests (creating a prediction) are only retried when
+        the request provably did not reach the server (connection errors) or
+        was turned away with 429/503 and a Retry-After header, so a slow or
+        failed response never creates a duplicate, billed job.
+        `body` is a factory for a streamed request body, called per attempt.
+        """
+        if url.startswith(self.base_url):
+            kwargs["headers"] = {**self._auth_headers, **kwargs.get("headers", {})}
+
+        attempt = 0
+        while True:
+            retry_after = None
+            if body is not None:
+                kwargs["content"] = body()
+            try:
+                response = await self._http.request(method, url, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                error: Exception = e
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                if not idempotent:
+                    raise
+                error = e
+            else:
+                if response.status_code not in TRANSIENT_STATUSES:
+                    if response.is_error:
+                        raise _http_error(method, url, response)
+                    return response
+                error = _http_error(method, url, response)
+                retry_after = _retry_after_seconds(response)
+                if url.startswith(self.base_url):
+                    self.scheduler.on_throttle()
+                if not idempotent and (
+                    response.status_code not in REJECTED_STATUSES or retry_after is None
+                ):
+                    raise error
+
+            if attempt >= self.max_retries:
+                raise error
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+            attempt += 1
+
+    # -------------------------------------------------------------------------
+    # Files
+    # -------------------------------------------------------------------------
+
+    async def upload_file(
+        self, data: Union[bytes, BinaryIO], filename: str, content_type: str
+    ) -> str:
+        """
+        Upload bytes or a binary file through the files API; returns a URL
+        usable as a model input.
+
+        Lets one image feed many predictions without re-sending it inline
+        as a base64 data URI each time. A file is streamed in chunks and
+        rewound on retries.
+        """
+        response = await self._request(
+            "POST",
+            f"{self.base_url}/v1/files",
+            idempotent=False,
+            files={"content": (filename, data, content_type)},
+        )
+        payload = response.json()
+        try:
+            return payload["urls"]["get"]
+        except (KeyError, TypeError):
+            raise InpaintingError(f"Unexpected files API response: {str(payload)[:200]}")
+
+    # -------------------------------------------------------------------------
+    # Predictions
+    # -------------------------------------------------------------------------
+
+    async def create_prediction(self, model: str, inputs: Dict[str, Any]) -> dict:
+        """
+        Start a prediction for an official model ("owner/name").
+
+        DataURI input values are streamed into the request body; other
+        values are sent as plain JSON.
+        """
+        length, body = json_body_stream({"input": inputs})
+        response = await self._request(
+            "POST",
+            f"{self.base_url}/v1/models/{model}/predictions",
+            idempotent=False,
+            body=body,
+            headers={"Content-Type": "application/json", "Content-Length": str(length)},
+        )
+        return response.json()
+
+    async def get_prediction(self, prediction: dict) -> dict:
+        """Fetch the current state of a prediction."""
+        url = prediction.get("urls", {}).get("get") or (
+            f"{self.base_url}/v1/predictions/{prediction['id']}"
+        )
+        response = await self._request("GET", url)
+        return response.json()
+
+    async def cancel_prediction(self, prediction: dict) -> None:
+        """Ask the API to stop a prediction (best effort)."""
+        url = prediction.get("urls", {}).get("cancel") or (
+            f"{self.base_url}/v1/predictions/{prediction['id']}/cancel"
+        )
+        try:
+            await self._request("POST", url)
+        except (InpaintingError, httpx.HTTPError):
+            pass
+
+    async def wait_for_prediction(self, prediction: dict) -> dict:
+        """
+        Poll until the prediction reaches a terminal state.
+
+        Raises InpaintingTimeout (after cancelling remotely) if it takes longer
+        than prediction_timeout; task cancellation also cancels remotely.
+        """
+        deadline = time.monotonic() + self.prediction_timeout
+        interval = self.poll_interval
+
+        try:
+            while prediction.get("status") not in TERMINAL_STATES:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    await self.cancel_prediction(prediction)
+                    raise InpaintingTimeout(
+                        f"Prediction {prediction.get('id')} did not finish "
+                        f"within {self.prediction_timeout:g}s"
+                    )
+                await asyncio.sleep(min(interval, remaining))
+                interval = min(interval * 1.5, self.max_poll_interval)
+                prediction = await self.get_prediction(prediction)
+        except asyncio.CancelledError:
+            await asyncio.shield(self.cancel_prediction(prediction))
+            raise
+
+        if prediction["status"] != "succeeded":
+            raise InpaintingError(
+                f"Prediction {prediction.get('id')} {prediction['status']}: "
+                f"{prediction.get('error') or 'no error message'}"
+            )
+        return prediction
+
+    # -------------------------------------------------------------------------
+    # Downloads
+    # -------------------------------------------------------------------------
+
+    async def download_to(self, url: str, fileobj: BinaryIO, chunk_size: int = 2**16) -> int:
+        """
+        Stream a result URL into a binary file object; returns bytes written.
+
+        A failed attempt rewinds and truncates fileobj before retrying.
+        """
+        start = fileobj.tell()
+        attempt = 0
+        while True:
+            try:
+                async with self._http.stream("GET", url) as response:
+                    if response.is_error:
+                        await response.aread()
+                        raise _http_error("GET", url, response)
+                    written = 0
+                    async for chunk in response.aiter_bytes(chunk_size):
+                        fileobj.write(chunk)
+                        written += len(chunk)
+                    return written
+            except (InpaintingError, httpx.TransportError) as e:
+                status = getattr(e, "status", None)
+                permanent = status is not None and status not in TRANSIENT_STATUSES
+                if permanent or attempt >= self.max_retries:
+                    raise
+                fileobj.seek(start)
+                fileobj.truncate()
+                await asyncio.sleep(self._backoff(attempt, None))
+                attempt += 1
+
+    async def download(self, url: str) -> bytes:
+        """Download a result URL into memory."""
+        buffer = io.BytesIO()
+        await self.download_to(url, buffer)
+        return buffer.getvalue()
+
+    # -------------------------------------------------------------------------
+    # High level
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def output_url(prediction: dict) -> str:
+        """First output URL of a finished prediction."""
+        output = prediction.get("output")
+        if isinstance(output, list) and output:
+            output = output[0]
+        if not isinstance(output, str):
+            raise InpaintingError(f"Unexpected API output type: {type(output)}")
+        return output
+
+    async def run_to(
+        self,
+        model: str,
+        inputs: Dict[str, Any],
+        fileobj: BinaryIO,
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> int:
+        """
+        Create a prediction, wait for it and stream its first output into fileobj.
+
+        Waits for a scheduler slot (by priority) and a rate-limit token first;
+        the prediction's latency feeds back into the concurrency limit.
+        """
+        async with self.scheduler.slot(priority):
+            await self.scheduler.acquire_token()
+            start = time.monotonic()
+            prediction = await self.create_prediction(model, inputs)
+            prediction = await self.wait_for_prediction(prediction)
+            self.scheduler.on_success(time.monotonic() - start)
+            return await self.download_to(self.output_url(prediction), fileobj)
+
+    async def run(
+        self, model: str, inputs: Dict[str, Any], priority: int = PRIORITY_INTERACTIVE
+    ) -> bytes:
+        """Create a prediction, wait for it and return the first output's bytes."""
+        buffer = io.BytesIO()
+        await self.run_to(model, inputs, buffer, priority)
+        return buffer.getvalue()
+
+
+# =============================================================================
+# SYNC BRIDGE
+# =============================================================================
+
+class LoopThread:
+    """
+    An asyncio event loop running on a daemon thread.
+
+    Lets synchronous code (batch pipeline, GUI workers) submit coroutines to
+    one long-lived loop so they share a client and its connection pool.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self) -> "LoopThread":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop; returns a thread-safe future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Wedding BG Generator - Duplicate Photo Index
+============================================
+Finds byte-identical and near-duplicate photos across folders (pic/ and
+public/pic/ overlap heavily), so batch runs and asset builds can process
+one representative per cluster.
+
+Every photo gets two 64-bit perceptual hashes:
+    dHash - sign of horizontal brightness gradients on a 9x8 thumbnail
+    pHash - sign of the low-frequency 8x8 DCT block of a 32x32 thumbnail
+Two photos are near duplicates when both hashes are within a few bits
+(Hamming distance). Re-encodes, resizes and small crops of the same shot
+stay within the threshold; different shots of the same scene do not.
+
+Hashes are kept in a SQLite index under the cache directory, keyed by
+content hash, so identical copies and unchanged files are never decoded
+twice. Lookups compare a query against every stored hash at once with
+vectorized XOR + popcount, which stays in the low milliseconds for tens
+of thousands of photos.
+
+Usage:
+    python wedding_bg_dedupe.py pic public/pic
+    python wedding_bg_dedupe.py pic public/pic --threshold 6 --json dupes.json
+    python wedding_bg_dedupe.py pic --nearest pic/3.jpg
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from wedding_bg_cache import DEFAULT_CACHE_DIR, file_digest
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+
+# Default near-duplicate threshold in bits (of 64), applied to both hashes
+DEFAULT_THRESHOLD = 8
+
+# Extensions indexed when a directory is given
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff", ".heic", ".heif"}
+
+# DCT-II basis for the 32x32 pHash input (rows: frequencies, cols: samples)
+_N = 32
+_DCT = np.cos(np.pi * (2 * np.arange(_N)[None, :] + 1) * np.arange(_N)[:, None] / (2 * _N))
+
+
+# =============================================================================
+# HASHING
+# =============================================================================
+
+@dataclass
+class PhotoHash:
+    """Content and perceptual hashes of one photo."""
+
+    path: str
+    sha256: str
+    width: int
+    height: int
+    dhash: int
+    phash: int
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8).ravel()).tobytes(), "big")
+
+
+def perceptual_hashes(image: Image.Image) -> Tuple[int, int]:
+    """(dHash, pHash) of an image, as unsigned 64-bit integers."""
+    gray = image.convert("L")
+
+    small = np.asarray(gray.resize((9, 8), Image.Resampling.BILINEAR), dtype=np.int16)
+    dhash = _bits_to_int(small[:, 1:] > small[:, :-1])
+
+    pixels = np.asarray(gray.resize((_N, _N), Image.Resampling.BILINEAR), dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:8, :8]
+    # Exclude the DC term from the median so overall brightness does not matter
+    phash = _bits_to_int(low > np.median(low.ravel()[1:]))
+
+    return dhash, phash
+
+
+def hash_file(path: str, sha256: Optional[str] = None) -> PhotoHash:
+    """Hash one photo file (runs in a worker process)."""
+    sha256 = sha256 or file_digest(path)
+    with Image.open(path) as opened:
+        width, height = opened.size
+        if opened.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            width, height = height, width
+        # Hashes only need a thumbnail, so let JPEG decode at 1/8 scale
+        opened.draft("L", (64, 64))
+        dhash, phash = perceptual_hashes(ImageOps.exif_transpose(opened))
+    return PhotoHash(path, sha256, width, height, dhash, phash)
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+# =============================================================================
+# INDEX
+# =============================================================================
+
+class PhotoHashIndex:
+    """
+    Persistent perceptual-hash index.
+
+    `files` maps a path to its size, mtime and content hash; `hashes` maps
+    a content hash to its dimensions and perceptual hashes. Unchanged
+    files are looked up by stat, identical copies share one `hashes` row,
+    and only new content is decoded (in a process pool).
+    """
+
+    def __init__(self, cache_dir: Optional[Union[str, Path]] = None):
+        root = Path(cache_dir or DEFAULT_CACHE_DIR)
+        root.mkdir(parents=True, exist_ok=True)
+        self.index_path = root / "phash.sqlite"
+        self.computed = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " path TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " sha256 TEXT NOT NULL)"
+            )
+            # 64-bit hashes are stored as hex: SQLite integers are signed
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                " sha256 TEXT PRIMARY KEY,"
+                " width INTEGER NOT NULL,"
+                " height INTEGER NOT NULL,"
+                " dhash TEXT NOT NULL,"
+                " phash TEXT NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.index_path, timeout=30)
+
+    def update(self, paths: Iterable[str], workers: Optional[int] = None) -> List[PhotoHash]:
+        """
+        Hashes for `paths` (in order), computing only what the index lacks.
+
+        Unreadable files are reported and left out of the result.
+        """
+        paths = [str(Path(p)) for p in paths]
+        known: Dict[str, PhotoHash] = {}
+        pending: List[str] = []
+
+        with closing(self._connect()) as conn:
+            for path in paths:
+                key = str(Path(path).resolve())
+                try:
+                    stat = os.stat(path)
+                except OSError as e:
+                    print(f"  [WARN] {path}: {e}")
+                    continue
+                row = conn.execute(
+                    "SELECT h.sha256, h.width, h.height, h.dhash, h.phash"
+                    " FROM files f JOIN hashes h ON h.sha256 = f.sha256"
+                    " WHERE f.path = ? AND f.size = ? AND f.mtime_ns = ?",
+                    (key, stat.st_size, stat.st_mtime_ns),
+                ).fetchone()
+                if row:
+                    sha, width, height, dhash, phash = row
+                    known[path] = PhotoHash(path, sha, width, height, int(dhash, 16), int(phash, 16))
+                else:
+                    pending.append(path)
+
+        computed: List[PhotoHash] = []
+        if pending:
+            max_workers = min(workers or os.cpu_count() or 1, len(pending))
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                # 1. Content hashes, so copies and touched files reuse stored hashes
+                digests = dict(zip(pending, pool.map(file_digest, pending)))
+                with closing(self._connect()) as conn:
+                    stored = {}
+                    for sha in set(digests.values()):
+                        row = conn.execute(
+                            "SELECT width, height, dhash, phash FROM hashes WHERE sha256 = ?", (sha,)
+                        ).fetchone()
+                        if row:
+                            stored[sha] = row
+
+                # 2. Decode each new content once
+                first: Dict[str, str] = {}
+                for path in pending:
+                    if digests[path] not in stored:
+                        first.setdefault(digests[path], path)
+                futures = {sha: pool.submit(hash_file, path, sha) for sha, path in first.items()}
+                for sha, future in futures.items():
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        print(f"  [WARN] Cannot hash {first[sha]}: {e}")
+                        continue
+                    stored[sha] = (record.width, record.height, f"{record.dhash:016x}", f"{record.phash:016x}")
+                    computed.append(record)
+
+            with closing(self._connect()) as conn, conn:
+                for path in pending:
+                    sha = digests[path]
+                    if sha not in stored:
+                        continue
+                    width, height, dhash, phash = stored[sha]
+                    stat = os.stat(path)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256) VALUES (?, ?, ?, ?)",
+                        (str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns, sha),
+                    )
+                    known[path] = PhotoHash(path, sha, width, height, int(dhash, 16), int(phash, 16))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO hashes (sha256, width, height, dhash, phash)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    [(r.sha256, r.width, r.height, f"{r.dhash:016x}", f"{r.phash:016x}") for r in computed],
+                )
+
+        with self._lock:
+            self.computed += len(computed)
+            self.reused += len(known) - len(computed)
+        return [known[p] for p in paths if p in known]
+
+    def summary(self) -> str:
+        """One-line computed/reused summary for run reports."""
+        return f"hash index: {self.reused} reused, {self.computed} computed"
+
+
+class HashMatrix:
+    """
+    In-memory Hamming-distance lookup over a set of PhotoHash records.
+
+    Queries XOR against all stored hashes at once and popcount the
+    result, so each lookup is a couple of vectorized passes.
+    """
+
+    def __init__(self, records: List[PhotoHash]):
+        self.records = records
+        self.dhashes = np.array([r.dhash for r in records], dtype=np.uint64)
+        self.phashes = np.array([r.phash for r in records], dtype=np.uint64)
+
+    def distances(self, dhash: int, phash: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(dHash distances, pHash distances) from a query to every record."""
+        return (
+            _popcount(self.dhashes ^ np.uint64(dhash)),
+            _popcount(self.phashes ^ np.uint64(phash)),
+        )
+
+    def nearest(self, dhash: int, phash: int, k: int = 5) -> List[Tuple[PhotoHash, int]]:
+        """The k records closest to a query, as (record, pHash + dHash distance)."""
+        d, p = self.distances(dhash, phash)
+        total = d.astype(np.int64) + p
+        order = np.argsort(total, kind="stable")[:k]
+        return [(self.records[i], int(total[i])) for i in order]
+
+    def within(self, index: int, threshold: int) -> np.ndarray:
+        """Indices of records near record `index` (both hashes within threshold)."""
+        record = self.records[index]
+        d, p = self.distances(record.dhash, record.phash)
+        return np.nonzero((d <= threshold) & (p <= threshold))[0]
+
+
+# =============================================================================
+# CLUSTERS
+# =============================================================================
+
+@dataclass
+class DuplicateCluster:
+    """Photos considered the same shot; `keep` is the representative."""
+
+    keep: str
+    duplicates: List[str]
+    identical: List[str]
+
+
+def _preference(record: PhotoHash) -> tuple:
+    # Largest image first, then shortest name ("x.jpg" over "x (2).jpg"), then path order
+    return (-record.width * record.height, len(Path(record.path).name), record.path)
+
+
+def find_clusters(records: List[PhotoHash], threshold: int = DEFAULT_THRESHOLD) -> List[DuplicateCluster]:
+    """
+    Group records into duplicate clusters (singletons are omitted).
+
+    Near-duplicate links are transitive (union-find), so a chain of small
+    edits ends up in one cluster.
+    """
+    parent = list(range(len(records)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    matrix = HashMatrix(records)
+    for i in range(len(records)):
+        for j in matrix.within(i, threshold):
+            if j > i:
+                parent[find(int(j))] = find(i)
+
+    groups: Dict[int, List[PhotoHash]] = {}
+    for i, record in enumerate(records):
+        groups.setdefault(find(i), []).append(record)
+
+    clusters = []
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        members.sort(key=_preference)
+        keep = members[0]
+        clusters.append(DuplicateCluster(
+            keep=keep.path,
+            duplicates=[m.path for m in members[1:]],
+            identical=[m.path for m in members[1:] if m.sha256 == keep.sha256],
+        ))
+    clusters.sort(key=lambda c: c.keep)
+    return clusters
+
+
+def select_representatives(
+    paths: List[str],
+    threshold: int = DEFAULT_THRESHOLD,
+    cache_dir: Optional[Union[str, Path]] = None,
+    workers: Optional[int] = None,
+) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Keep one photo per duplicate cluster.
+
+    Args:
+        paths: Photo paths, in processing order
+        threshold: Near-duplicate threshold in bits
+        cache_dir: Cache root for the hash index
+        workers: Hashing processes for photos not yet indexed
+
+    Returns:
+        (paths to process in original order, {skipped path: its representative})
+    """
+    index = PhotoHashIndex(cache_dir)
+    records = index.update(paths, workers)
+    skipped = {
+        duplicate: cluster.keep
+        for cluster in find_clusters(records, threshold)
+        for duplicate in cluster.duplicates
+    }
+    return [p for p in paths if p not in skipped], skipped
+
+
+# =============================================================================
+# CLI INTERFACE
+# =============================================================================
+
+def collect_photos(inputs: List[str]) -> List[str]:
+    """Expand files and (non-recursive) directories into photo paths."""
+    found: List[str] = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            found.extend(
+                str(p) for p in sorted(path.iterdir())
+                if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS
+            )
+        else:
+            found.append(str(path))
+    return list(dict.fromkeys(found))
+
+
+def main() -> int:
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description="Report byte-identical and near-duplicate photos across folders",
+    )
+    parser.add_argument("inputs", nargs="+", help="Photo files or directories")
+    parser.add_argument("-t", "--threshold", type=int, default=DEFAULT_THRESHOLD,
+                        help=f"Near-duplicate distance in bits, 0-32 (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument("--json", default=None, metavar="PATH",
+                        help="Also write the clusters as JSON to PATH")
+    parser.add_argument("--nearest", default=None, metavar="PHOTO",
+                        help="Instead of clustering, list the indexed photos closest to PHOTO")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Hashing processes (default: CPU count)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Cache directory (default: ~/.cache/wedding_bg or WEDDING_BG_CACHE_DIR)")
+    args = parser.parse_args()
+
+    if not 0 <= args.threshold <= 32:
+        print(f"[ERROR] Threshold must be between 0 and 32, got: {args.threshold}")
+        return 1
+
+    paths = collect_photos(args.inputs)
+    if not paths:
+        print(f"[ERROR] No photos found in: {' '.join(args.inputs)}")
+        return 1
+
+    index = PhotoHashIndex(args.cache_dir)
+    records = index.update(paths, args.workers)
+    print(f"Indexed {len(records)} photo(s) ({index.summary()})")
+    print()
+
+    if args.nearest:
+        query = index.update([args.nearest])
+        if not query:
+            return 1
+        matrix = HashMatrix([r for r in records if r.path != query[0].path])
+        for record, distance in matrix.nearest(query[0].dhash, query[0].phash):
+            print(f"  {distance:3d}  {record.path}  ({record.width}x{record.height})")
+        return 0
+
+    clusters = find_clusters(records, args.threshold)
+    for number, cluster in enumerate(clusters, start=1):
+        print(f"Cluster {number} ({len(cluster.duplicates) + 1} photos)")
+        print(f"  * {cluster.keep}  (keep)")
+        for duplicate in cluster.duplicates:
+            kind = "identical" if duplicate in cluster.identical else "near"
+            print(f"    {duplicate}  ({kind})")
+
+    redundant = sum(len(c.duplicates) for c in clusters)
+    print()
+    print(f"[DONE] {len(clusters)} cluster(s), {redundant} redundant photo(s) of {len(records)}")
+
+    if args.json:
+        Path(args.json).write_text(
+            json.dumps([asdict(c) for c in clusters], indent=2, ensure_ascii=False), encoding="utf-8"
+        )
+        print(f"  Report: {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
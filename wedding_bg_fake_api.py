@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Wedding BG Generator - Fake Replicate API
+=========================================
+Local stand-in for the Replicate predictions API, for exercising the
+async client, batch pipeline and benchmarks without network or cost.
+
+The "model" simply echoes the input image back once `latency` seconds
+have passed. The input may be a data URI or the URL of a file uploaded
+through the fake files API. Failures can be injected with `fail_rate` (HTTP 500 on
+create) so retry paths get exercised.
+
+Load and throttling can be simulated for scheduler tests: `capacity`
+runs at most that many predictions at once (later ones queue, so latency
+grows with load), `max_queue` rejects creates with HTTP 429 once that many
+are queued, and `rate_limit` rejects creates above that many per second
+with HTTP 429 and a Retry-After header.
+
+Usage:
+    python wedding_bg_fake_api.py --port 8765 --latency 2
+    python wedding_bg_fake_api.py --latency 1 --capacity 6 --max-queue 4 --rate-limit 20
+    REPLICATE_BASE_URL=http://127.0.0.1:8765 REPLICATE_API_TOKEN=fake \\
+        python wedding_bg_gen.py photo.jpg
+
+Embedding:
+    with FakeReplicateServer(latency=0.5) as server:
+        client = AsyncInpaintingClient("fake", base_url=server.base_url)
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import email.parser
+import email.policy
+import heapq
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+
+# =============================================================================
+# STATE
+# =============================================================================
+
+class _Prediction:
+    """One fake prediction: the decoded input image plus timing."""
+
+    def __init__(self, prediction_id: str, image: bytes, mime: str,
+                 ready_at: float, started_at: Optional[float] = None):
+        self.id = prediction_id
+        self.image = image
+        self.mime = mime
+        self.ready_at = ready_at
+        self.started_at = started_at if started_at is not None else time.monotonic()
+        self.canceled = False
+
+    def status(self) -> str:
+        if self.canceled:
+            return "canceled"
+        now = time.monotonic()
+        if now >= self.ready_at:
+            return "succeeded"
+        return "processing" if now >= self.started_at else "starting"
+
+
+def _decode_data_uri(uri: str) -> tuple:
+    """Split a data URI into (bytes, mime type)."""
+    match = re.match(r"data:([^;]+);base64,(.*)", uri, re.DOTALL)
+    if not match:
+        raise ValueError("image must be a base64 data URI or an uploaded file URL")
+    return base64.b64decode(match.group(2)), match.group(1)
+
+
+def _parse_upload(content_type: str, body: bytes) -> tuple:
+    """(bytes, mime type) of the "content" part of a multipart/form-data body."""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+    )
+    for part in message.iter_parts():
+        if part.get_param("name", header="content-disposition") == "content":
+            return part.get_payload(decode=True), part.get_content_type()
+    raise ValueError("multipart body has no 'content' part")
+
+
+# =============================================================================
+# HTTP HANDLER
+# =============================================================================
+
+class _Handler(BaseHTTPRequestHandler):
+    """Routes the subset of the predictions API used by the client."""
+
+    server: "_Server"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json",
+              headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, payload: dict, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send(status, json.dumps(payload).encode("utf-8"), headers=headers)
+
+    def _prediction_json(self, prediction: _Prediction) -> dict:
+        base = self.server.base_url
+        status = prediction.status()
+        return {
+            "id": prediction.id,
+            "status": status,
+            "output": [f"{base}/files/{prediction.id}"] if status == "succeeded" else None,
+            "error": None,
+            "urls": {
+                "get": f"{base}/v1/predictions/{prediction.id}",
+                "cancel": f"{base}/v1/predictions/{prediction.id}/cancel",
+            },
+        }
+
+    def _lookup(self, prediction_id: str) -> Optional[_Prediction]:
+        with self.server.lock:
+            return self.server.predictions.get(prediction_id)
+
+    def _resolve_image(self, value: str) -> tuple:
+        """(bytes, mime type) for a data URI or one of our uploaded file URLs."""
+        match = re.fullmatch(re.escape(self.server.base_url) + r"/v1/files/([0-9a-f]+)", value)
+        if match:
+            with self.server.lock:
+                uploaded = self.server.files.get(match.group(1))
+            if uploaded is None:
+                raise ValueError(f"unknown file: {value}")
+            return uploaded
+        return _decode_data_uri(value)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        self.server.count("POST")
+
+        if self.path == "/v1/files":
+            try:
+                data, mime = _parse_upload(self.headers.get("Content-Type", ""), body)
+            except ValueError as e:
+                return self._json(422, {"detail": str(e)})
+            file_id = uuid.uuid4().hex
+            with self.server.lock:
+                self.server.files[file_id] = (data, mime)
+            self.server.count("upload")
+            return self._json(201, {
+                "id": file_id,
+                "size": len(data),
+                "content_type": mime,
+                "urls": {"get": f"{self.server.base_url}/v1/files/{file_id}"},
+            })
+
+        if re.fullmatch(r"/v1/models/[^/]+/[^/]+/predictions", self.path):
+            if random.random() < self.server.fail_rate:
+                return self._json(500, {"detail": "injected failure"})
+            try:
+                inputs = json.loads(body)["input"]
+                image, mime = self._resolve_image(inputs["image"])
+            except (KeyError, ValueError) as e:
+                return self._json(422, {"detail": str(e)})
+
+            with self.server.lock:
+                wait = self.server.throttle()
+                if wait is not None:
+                    self.server.requests["429"] = self.server.requests.get("429", 0) + 1
+                else:
+                    start, ready_at = self.server.schedule()
+                    prediction = _Prediction(uuid.uuid4().hex, image, mime, ready_at, start)
+                    self.server.predictions[prediction.id] = prediction
+            if wait is not None:
+                return self._json(429, {"detail": "throttled"},
+                                  headers={"Retry-After": f"{wait:.2f}"})
+            return self._json(201, self._prediction_json(prediction))
+
+        match = re.fullmatch(r"/v1/predictions/([0-9a-f]+)/cancel", self.path)
+        if match:
+            prediction = self._lookup(match.group(1))
+            if not prediction:
+                return self._json(404, {"detail": "not found"})
+            prediction.canceled = True
+            return self._json(200, self._prediction_json(prediction))
+
+        self._json(404, {"detail": "not found"})
+
+    def do_GET(self):
+        self.server.count("GET")
+
+        match = re.fullmatch(r"/v1/predictions/([0-9a-f]+)", self.path)
+        if match:
+            prediction = self._lookup(match.group(1))
+            if not prediction:
+                return self._json(404, {"detail": "not found"})
+            return self._json(200, self._prediction_json(prediction))
+
+        match = re.fullmatch(r"/files/([0-9a-f]+)", self.path)
+        if match:
+            prediction = self._lookup(match.group(1))
+            if not prediction or prediction.status() != "succeeded":
+                return self._json(404, {"detail": "not found"})
+            return self._send(200, prediction.image, prediction.mime)
+
+        self._json(404, {"detail": "not found"})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float, fail_rate: float, verbose: bool,
+                 capacity: int = 0, max_queue: int = 0, rate_limit: float = 0.0):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.verbose = verbose
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.predictions: Dict[str, _Prediction] = {}
+        self.files: Dict[str, tuple] = {}
+        self.requests: Dict[str, int] = {}
+        # Finish times of the `capacity` model slots (a min-heap)
+        self.slots: List[float] = []
+        self.tokens = max(1.0, rate_limit)
+        self.refilled = time.monotonic()
+        host, port = self.server_address[:2]
+        self.base_url = f"http://{host}:{port}"
+
+    def count(self, method: str) -> None:
+        with self.lock:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+    def throttle(self) -> Optional[float]:
+        """Seconds to wait if a new prediction must be rejected, else None (hold lock)."""
+        now = time.monotonic()
+        if self.max_queue:
+            queued = sum(1 for p in self.predictions.values()
+                         if not p.canceled and p.started_at > now)
+            if queued >= self.max_queue:
+                return max(0.1, min(self.slots) - now) if self.slots else self.latency
+        if self.rate_limit:
+            self.tokens = min(max(1.0, self.rate_limit),
+                              self.tokens + (now - self.refilled) * self.rate_limit)
+            self.refilled = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate_limit
+            self.tokens -= 1
+        return None
+
+    def schedule(self) -> tuple:
+        """(start, ready_at) for a new prediction on the first free slot (hold lock)."""
+        now = time.monotonic()
+        if not self.capacity:
+            return now, now + self.latency
+        if len(self.slots) < self.capacity:
+            start = now
+        else:
+            start = max(now, heapq.heappop(self.slots))
+        heapq.heappush(self.slots, start + self.latency)
+        return start, start + self.latency
+
+
+# =============================================================================
+# PUBLIC API
+# =============================================================================
+
+class FakeReplicateServer:
+    """
+    Fake predictions API on a background thread.
+
+    Args:
+        host: Interface to bind
+        port: Port to bind (0 picks a free one)
+        latency: Seconds a prediction takes once it has a model slot
+        fail_rate: Probability that creating a prediction returns HTTP 500
+        verbose: Log every request to stderr
+        capacity: Predictions processed at once (0 = unlimited); the rest
+            queue in "starting" state
+        max_queue: Queued predictions before creates get HTTP 429 (0 = no limit)
+        rate_limit: Creates per second before HTTP 429 (0 = no limit)
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 1.0,
+        fail_rate: float = 0.0,
+        verbose: bool = False,
+        capacity: int = 0,
+        max_queue: int = 0,
+        rate_limit: float = 0.0,
+    ):
+        self._server = _Server(
+            (host, port), latency, fail_rate, verbose, capacity, max_queue, rate_limit
+        )
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return self._server.base_url
+
+    @property
+    def requests(self) -> Dict[str, int]:
+        """Request counts by HTTP method, plus "upload" for files API uploads
+        and "429" for throttled creates."""
+        with self._server.lock:
+            return dict(self._server.requests)
+
+    def start(self) -> "FakeReplicateServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self) -> None:
+        """Serve on the calling thread until interrupted."""
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+
+    def __enter__(self) -> "FakeReplicateServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main() -> int:
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Fake Replicate predictions API")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port (default: 8765)")
+    parser.add_argument("--latency", type=float, default=1.0,
+                        help="Seconds until each prediction succeeds (default: 1.0)")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="Probability of HTTP 500 when creating a prediction (default: 0)")
+    parser.add_argument("--capacity", type=int, default=0,
+                        help="Predictions processed at once; others queue (default: 0 = unlimited)")
+    parser.add_argument("--max-queue", type=int, default=0,
+                        help="Queued predictions before HTTP 429 (default: 0 = no limit)")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="Prediction creates per second before HTTP 429 (default: 0 = no limit)")
+    args = parser.parse_args()
+
+    server = FakeReplicateServer(
+        args.host, args.port, args.latency, args.fail_rate, verbose=True,
+        capacity=args.capacity, max_queue=args.max_queue, rate_limit=args.rate_limit,
+    )
+    print(f"Fake Replicate API listening on {server.base_url}")
+    print(f"  export REPLICATE_BASE_URL={server.base_url}")
+    server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,46 +5,104 @@ Wedding Photo Background Generator
 CLI tool to automate background replacement for wedding photos
 while preserving the original lighting atmosphere.
 
-Uses rembg for masking and Replicate API (Flux) for inpainting.
+Uses rembg for masking and Replicate API (Flux) for inpainting
+(see wedding_bg_client.py for the async HTTP client).
 
 Usage:
     python wedding_bg_gen.py input.jpg
     python wedding_bg_gen.py input.jpg --prompt "custom prompt"
     python wedding_bg_gen.py input.jpg --output my_output.png
     python wedding_bg_gen.py input.jpg --dilation 8
+    python wedding_bg_gen.py pic/ --output-dir results/ --workers 4
+    python wedding_bg_gen.py "pic/*.jpg" --api-workers 8
+    python wedding_bg_gen.py pic/ public/pic/ --output-dir results/ --dedupe
+    python wedding_bg_gen.py pic/ --output-dir results/ --no-resume
+    python wedding_bg_gen.py pic/ --output-dir results/ --workers 2 --mask-batch 8 --intra-op-threads 16
+    python wedding_bg_gen.py input.jpg --mask-model u2net_human_seg
+    python wedding_bg_gen.py input.jpg --profile-models
+    python wedding_bg_gen.py input.jpg --upload-size 1024 --feather 12
+    python wedding_bg_gen.py input.jpg --mask-size 1024
+    python wedding_bg_gen.py pic/ --output-dir results/ --format jpeg --export webp:2048 --export avif:1024
+    python wedding_bg_gen.py input.jpg -p "black velvet" -p "dark marble" --output-dir variants/
+    python wedding_bg_gen.py input.jpg --prompt-file prompts.txt --output-dir variants/
 
 Requirements:
-    pip install rembg pillow numpy replicate
+    pip install rembg pillow numpy httpx
 
 Environment:
     REPLICATE_API_TOKEN=r8_xxxxx
+    REPLICATE_BASE_URL=http://127.0.0.1:8765   (optional, e.g. wedding_bg_fake_api.py)
 """
 
 from __future__ import annotations
 
+import abc
 import argparse
+import asyncio
 import base64
+import contextlib
+import glob
+import hashlib
+import importlib
+import importlib.util
 import io
+import json
 import os
 import sys
-from datetime import datetime
+import tempfile
+import threading
+import time
+from concurrent.futures import as_completed
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 
-try:
+import wedding_bg_metrics as metrics
+from wedding_bg_metrics import instrumented
+
+if TYPE_CHECKING:
     import numpy as np
-    from PIL import Image, ImageFilter
-    import replicate
+
+    from wedding_bg_cache import MaskCache, RawImageCache, ResultCache
+    from wedding_bg_client import AdaptiveScheduler, AsyncInpaintingClient, DataURI
+
+
+# =============================================================================
+# DEPENDENCIES
+# =============================================================================
+# numpy, rembg (onnxruntime) and wedding_bg_client (httpx) are imported
+# inside the functions that use them, so --help, --version and the GUI
+# window come up without paying for them. Missing packages are still reported at startup: find_spec locates a
+# module without executing it.
+
+def _require(name: str, error: str) -> None:
+    """Exit with `error` if module `name` is not installed."""
+    try:
+        found = importlib.util.find_spec(name) is not None
+    except ImportError:
+        found = False
+    if not found:
+        print(error)
+        sys.exit(1)
+
+
+_require("numpy", "[ERROR] Missing dependency: numpy\nInstall with: pip install rembg pillow numpy httpx")
+# wedding_bg_client (httpx) is imported where the Replicate client is built
+_require("httpx", "[ERROR] Missing dependency: httpx\nInstall with: pip install rembg pillow numpy httpx")
+_require(
+    "rembg",
+    "[ERROR] rembg not installed. Install with: pip install rembg[gpu] or pip install rembg",
+)
+
+try:
+    from PIL import Image, ImageDraw, ImageFilter, ImageOps
 except ImportError as e:
     print(f"[ERROR] Missing dependency: {e}")
-    print("Install with: pip install rembg pillow numpy replicate")
+    print("Install with: pip install rembg pillow numpy httpx")
     sys.exit(1)
 
-try:
-    from rembg import remove, new_session
-except ImportError:
-    print("[ERROR] rembg not installed. Install with: pip install rembg[gpu] or pip install rembg")
-    sys.exit(1)
+import wedding_bg_cache
+import wedding_bg_ledger
 
 
 # =============================================================================
@@ -64,50 +122,643 @@ DEFAULT_NEGATIVE_PROMPT = (
 )
 
 
+# File extensions picked up when a directory is given as input
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+# rembg models selectable for masking (u2netp is the small/fast variant)
+MASK_MODELS = ("u2net", "u2netp", "u2net_human_seg", "isnet-general-use", "silueta")
+DEFAULT_MASK_MODEL = "u2net"
+
+# rembg alpha above this value counts as subject
+MASK_THRESHOLD = 128
+
+# Input preprocessing of each rembg model: (mean, std, network input size).
+# _segment reproduces it for single and batched masking alike.
+_U2NET_NORMALIZATION = ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320))
+MASK_NORMALIZATION = {
+    "u2net": _U2NET_NORMALIZATION,
+    "u2netp": _U2NET_NORMALIZATION,
+    "u2net_human_seg": _U2NET_NORMALIZATION,
+    "u2net_custom": _U2NET_NORMALIZATION,
+    "silueta": _U2NET_NORMALIZATION,
+    "isnet-general-use": ((0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (1024, 1024)),
+}
+
+# Photos per ONNX inference in batch masking, for the library and the CLI.
+# Raise it (e.g. 8) together with --intra-op-threads on many-core machines.
+DEFAULT_MASK_BATCH = 1
+
+# Version of the _segment preprocessing, recorded in mask cache variants
+MASK_PREPROCESSING = "seg1"
+
+# Guided-filter radius (px) for full-resolution edge refinement of low-res masks
+EDGE_REFINE_RADIUS = 8
+
+# Replicate inpainting model and its default settings
+FLUX_MODEL = "black-forest-labs/flux-fill-dev"
+FLUX_GUIDANCE = 30  # Higher guidance for more prompt adherence
+FLUX_STEPS = 50  # More steps for quality
+
+# Seam softening (px) when compositing a hard-edged mask at full resolution
+COMPOSITE_FEATHER = 6
+
+# Encoded uploads stay in memory up to this size, then spill to a temp file
+UPLOAD_SPOOL_BYTES = 8 * 2**20
+
+# Inpainting backends selectable via process_wedding_photo(backend=...)
+INPAINTING_BACKENDS = ("replicate", "preview")
+
+# Ceiling for the adaptive API concurrency and prediction creations per second
+DEFAULT_MAX_API_WORKERS = 16
+DEFAULT_API_RATE = 10.0
+
+# Output encoders: format name -> (Pillow format, file extension)
+OUTPUT_FORMATS = {
+    "png": ("PNG", ".png"),
+    "jpeg": ("JPEG", ".jpg"),
+    "webp": ("WEBP", ".webp"),
+    "avif": ("AVIF", ".avif"),
+}
+DEFAULT_OUTPUT_FORMAT = "png"
+
+# zlib level of PNG outputs; Pillow's default 6 takes ~3x as long on a
+# 12 MP result for files only ~6% smaller
+PNG_COMPRESS_LEVEL = 3
+
+# Quality of lossy outputs (JPEG, WebP, AVIF)
+OUTPUT_QUALITY = 95
+
+# Encoder effort: WebP method 0 (fast) - 6 (small), AVIF speed 0 (small) - 10 (fast)
+WEBP_METHOD = 4
+AVIF_SPEED = 8
+
+# Contact sheet of prompt variants: thumbnail long side (px) and spacing
+CONTACT_THUMB_SIZE = 480
+CONTACT_PADDING = 16
+
+# Long side (px) of local previews, and how much their fill is darkened
+PREVIEW_SIZE = 768
+PREVIEW_DIM = 0.6
+
+
+# =============================================================================
+# REMBG SESSION REGISTRY
+# =============================================================================
+
+# One ONNX session per (model, providers, options) for the whole process.
+# Batch worker processes each build their own registry on first use.
+_SESSIONS: Dict[Tuple, object] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+# ONNX Runtime thread pools of new sessions as (intra-op, inter-op) threads;
+# 0 leaves the onnxruntime default (one intra-op thread per core)
+_SESSION_THREADS: Tuple[int, int] = (0, 0)
+
+
+def set_session_threads(intra_op: int = 0, inter_op: int = 0) -> None:
+    """
+    Set the ONNX Runtime thread pools used by sessions created from now on.
+
+    intra_op threads split the work of one operator (a convolution over the
+    whole batch); inter_op threads run independent graph branches at the
+    same time. With several masking processes, give each process
+    cores / processes intra-op threads so they don't oversubscribe the CPU.
+    Batch runs pass this as the initializer of their worker processes.
+
+    Args:
+        intra_op: Threads per operator (0 = onnxruntime default)
+        inter_op: Threads across operators; above 1 the graph runs in
+            parallel execution mode (0 = sequential)
+    """
+    global _SESSION_THREADS
+    _SESSION_THREADS = (intra_op, inter_op)
+
+
+def _session_options(intra_op: int, inter_op: int):
+    """onnxruntime.SessionOptions with the given thread pools."""
+    import onnxruntime
+
+    sess_opts = onnxruntime.SessionOptions()
+    sess_opts.intra_op_num_threads = intra_op
+    if inter_op:
+        sess_opts.inter_op_num_threads = inter_op
+        if inter_op > 1:
+            sess_opts.execution_mode = onnxruntime.ExecutionMode.ORT_PARALLEL
+    return sess_opts
+
+
+def get_session(
+    model_name: str = DEFAULT_MASK_MODEL,
+    providers: Optional[List[str]] = None,
+    **options,
+):
+    """
+    Return a cached rembg session, creating it on first use.
+
+    Loading an ONNX model takes seconds and hundreds of MB, so sessions are
+    kept for the lifetime of the process instead of per photo. New sessions
+    use the thread pools set with set_session_threads.
+
+    Args:
+        model_name: rembg model name (see MASK_MODELS)
+        providers: Optional ONNX Runtime execution providers
+        **options: Extra keyword arguments forwarded to rembg.new_session
+
+    Returns:
+        rembg BaseSession instance
+    """
+    import rembg
+
+    threads = _SESSION_THREADS
+    key = (model_name, tuple(providers or ()), tuple(sorted(options.items())), threads)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            if providers:
+                options["providers"] = providers
+            if any(threads):
+                options["sess_opts"] = _session_options(*threads)
+            session = rembg.new_session(model_name, **options)
+            _SESSIONS[key] = session
+    return session
+
+
+def prewarm(model_name: str = DEFAULT_MASK_MODEL) -> None:
+    """
+    Import the masking stack and load a rembg session ahead of use.
+
+    Meant for a background thread (the GUI calls it at launch) so the first
+    photo does not pay for imports and the model load.
+    """
+    for name in ("numpy", "rembg"):
+        importlib.import_module(name)
+    get_session(model_name)
+
+
+def clear_sessions() -> None:
+    """Drop all cached rembg sessions (frees model memory)."""
+    with _SESSIONS_LOCK:
+        _SESSIONS.clear()
+
+
 # =============================================================================
 # CORE FUNCTIONS
 # =============================================================================
 
-def load_image(image_path: str) -> Image.Image:
-    """Load an image from file path."""
+@instrumented("load_image")
+def load_image(
+    image_path: str,
+    max_size: int = 0,
+    raw_cache: Optional[RawImageCache] = None,
+) -> Image.Image:
+    """
+    Load an image upright, optionally decoded straight to a smaller size.
+
+    JPEGs are decoded with draft mode (libjpeg DCT scaling by 1/2, 1/4 or
+    1/8), so a 12 MP photo needed at 1024px never exists at full size in
+    memory. The EXIF orientation is applied, so phone photos are masked
+    the way they are displayed.
+
+    Args:
+        image_path: Path to the image
+        max_size: Long side to decode to (0 = full resolution)
+        raw_cache: Optional RawImageCache; a hit memory-maps the decoded
+            pixels instead of decoding again
+
+    Returns:
+        RGB (or RGBA) image, at most max_size on the long side
+    """
+    import numpy as np
+
     path = Path(image_path)
     if not path.exists():
         raise FileNotFoundError(f"Image not found: {image_path}")
 
+    key = raw_cache.key(path, max_size) if raw_cache else None
+    if key:
+        cached = raw_cache.get(key)
+        if cached is not None:
+            return Image.fromarray(cached)
+
     img = Image.open(path)
+    if max_size:
+        # The box is square, so shrinking before the rotation is equivalent
+        # and leaves fewer pixels to rotate
+        img.draft("RGB", (max_size, max_size))
     # Convert to RGB if necessary (e.g., RGBA, P mode)
     if img.mode not in ("RGB", "RGBA"):
         img = img.convert("RGB")
+    if max_size and max(img.size) > max_size:
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    img = ImageOps.exif_transpose(img)
+
+    if key:
+        raw_cache.put(key, np.asarray(img))
     return img
 
 
-def generate_mask(image: Image.Image, session_name: str = "u2net") -> Image.Image:
+def _mask_source(image: Image.Image, mask_size: int) -> Image.Image:
+    """The image to segment: a copy with long side mask_size when smaller."""
+    if not mask_size or max(image.size) <= mask_size:
+        return image
+    scale = mask_size / max(image.size)
+    small_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(small_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+
+def _full_resolution_mask(image: Image.Image, mask: Image.Image) -> Image.Image:
+    """Upsample a mask of a low-resolution copy and refine its edges."""
+    import numpy as np
+
+    if mask.size == image.size:
+        return mask
+    coarse = np.asarray(mask.resize(image.size, Image.Resampling.BILINEAR))
+    return Image.fromarray(refine_mask_edges(image, coarse))
+
+
+@instrumented("generate_mask")
+def generate_mask(
+    image: Image.Image,
+    session_name: str = DEFAULT_MASK_MODEL,
+    mask_size: int = 0,
+) -> Image.Image:
     """
     Generate a binary mask of the subjects using rembg.
 
     Args:
         image: Input PIL Image
-        session_name: rembg model name (u2net, u2net_human_seg, isnet-general-use)
+        session_name: rembg model name (see MASK_MODELS)
+        mask_size: If set and the image is larger, segment a copy whose long
+            side is mask_size, upsample the mask and refine only the boundary
+            band at full resolution (0 = segment at full resolution)
 
     Returns:
         PIL Image in "L" mode (grayscale mask)
     """
-    print("[Step 1/4] Generating subject mask with rembg...")
+    low_res = bool(mask_size) and max(image.size) > mask_size
+    detail = f", {mask_size}px + edge refine" if low_res else ""
+    print(f"[Step 1/4] Generating subject mask with rembg ({session_name}{detail})...")
+
+    if session_name in MASK_NORMALIZATION:
+        # Same preprocessing as batch masking, so cached masks match either way
+        return _segment([image], session_name, mask_size, 1)[0]
 
-    # Create rembg session
-    session = new_session(session_name)
+    import rembg
+
+    # Reuse the process-wide session (model loads once per process)
+    session = get_session(session_name)
 
     # Remove background (returns RGBA with transparent background)
-    result = remove(image, session=session, only_mask=True)
+    result = rembg.remove(_mask_source(image, mask_size), session=session, only_mask=True)
 
     # Convert to grayscale mask (L mode)
     if result.mode != "L":
         result = result.convert("L")
 
-    return result
+    return _full_resolution_mask(image, result)
+
+
+def _normalize_for_mask(image: Image.Image, normalization: tuple) -> np.ndarray:
+    """
+    One photo as a 3xHxW float32 network input, as rembg's normalize builds it.
+
+    The photo is resized to the network size, scaled by its own maximum and
+    standardized per channel.
+    """
+    import numpy as np
+
+    mean, std, size = normalization
+    pixels = np.asarray(image.convert("RGB").resize(size, Image.Resampling.LANCZOS), dtype=np.float32)
+    pixels /= max(float(pixels.max()), 1e-6)
+    pixels -= np.asarray(mean, dtype=np.float32)
+    pixels /= np.asarray(std, dtype=np.float32)
+    return pixels.transpose(2, 0, 1)
+
+
+@instrumented("generate_masks_batch")
+def generate_masks_batch(
+    images: List[Image.Image],
+    session_name: str = DEFAULT_MASK_MODEL,
+    mask_size: int = 0,
+    batch_size: int = DEFAULT_MASK_BATCH,
+    **session_options,
+) -> List[Image.Image]:
+    """
+    Segment several photos with one ONNX inference per batch.
+
+    rembg runs its network on one photo at a time (batch dimension 1), so
+    the runtime's threads idle between the small per-photo calls and every
+    call pays the graph overhead again. Here up to batch_size photos are
+    preprocessed exactly like rembg does, stacked into one Nx3xHxW tensor
+    and run together; the output is split back into per-photo masks and
+    post-processed as rembg would (min-max scaled, resized to the photo).
+    Models exported with a fixed batch dimension run in chunks of that size;
+    models without a known preprocessing fall back to generate_mask.
+
+    Args:
+        images: Input PIL Images (any sizes)
+        session_name: rembg model name (see MASK_MODELS)
+        mask_size: Low-resolution segmentation size (see generate_mask)
+        batch_size: Photos per inference
+        **session_options: Extra keyword arguments for get_session (e.g.
+            model_path for "u2net_custom")
+
+    Returns:
+        One PIL Image in "L" mode per input image, in input order
+    """
+    normalization = MASK_NORMALIZATION.get(session_name)
+    if normalization is None:
+        return [generate_mask(image, session_name, mask_size) for image in images]
+
+    detail = f", {mask_size}px + edge refine" if mask_size else ""
+    print(f"[Step 1/4] Generating {len(images)} subject mask(s) with rembg "
+          f"({session_name}{detail}, batches of {batch_size})...")
+
+    return _segment(images, session_name, mask_size, batch_size, **session_options)
+
+
+def _segment(
+    images: List[Image.Image],
+    session_name: str,
+    mask_size: int,
+    batch_size: int,
+    **session_options,
+) -> List[Image.Image]:
+    """
+    Run a model from MASK_NORMALIZATION on photos, batch_size per inference.
+
+    Shared by generate_mask and generate_masks_batch so a photo gets the
+    same mask whichever path segmented it.
+    """
+    import numpy as np
+
+    normalization = MASK_NORMALIZATION[session_name]
+    inner = get_session(session_name, **session_options).inner_session
+    network_input = inner.get_inputs()[0]
+    fixed_batch = network_input.shape[0]
+    if isinstance(fixed_batch, int) and fixed_batch > 0:
+        batch_size = min(batch_size, fixed_batch)
+    batch_size = max(1, batch_size)
+
+    masks: List[Image.Image] = []
+    for start in range(0, len(images), batch_size):
+        chunk = images[start:start + batch_size]
+        sources = [_mask_source(image, mask_size) for image in chunk]
+        tensor = np.stack([_normalize_for_mask(source, normalization) for source in sources])
+        predictions = inner.run(None, {network_input.name: tensor})[0][:, 0]
+
+        for image, source, pred in zip(chunk, sources, predictions):
+            # Min-max scaled per photo, as if it had been run on its own
+            low, high = float(pred.min()), float(pred.max())
+            pred = (pred - low) / max(high - low, 1e-6)
+            mask = Image.fromarray((pred.clip(0, 1) * 255).astype(np.uint8), mode="L")
+            mask = mask.resize(source.size, Image.Resampling.LANCZOS)
+            masks.append(_full_resolution_mask(image, mask))
+    return masks
+
+
+def _mask_variant(mask_model: str, mask_size: int, load_size: int) -> str:
+    """Mask cache variant for a model and segmentation/decode sizes."""
+    # Low-resolution masks differ slightly, so they get their own entries
+    variant = f"{mask_model}-lr{mask_size}" if mask_size else mask_model
+    if mask_model in MASK_NORMALIZATION:
+        # Segmented by _segment, not rembg.remove; keep older entries apart
+        variant += f"-{MASK_PREPROCESSING}"
+    if load_size:
+        # Masks of reduced decodes have a different size
+        variant += f"-px{load_size}"
+    return variant
+
+
+def _binarize(mask: Image.Image) -> Image.Image:
+    """Threshold a grayscale rembg mask at MASK_THRESHOLD to 0/255."""
+    import numpy as np
+
+    return Image.fromarray((np.asarray(mask) > MASK_THRESHOLD).astype(np.uint8) * 255)
+
+
+def get_subject_mask(
+    input_path: str,
+    mask_model: str = DEFAULT_MASK_MODEL,
+    mask_cache: Optional[MaskCache] = None,
+    image: Optional[Image.Image] = None,
+    mask_size: int = 0,
+    load_size: int = 0,
+    raw_cache: Optional[RawImageCache] = None,
+) -> Image.Image:
+    """
+    Binary subject mask for a photo, served from the mask cache when possible.
+
+    Args:
+        input_path: Path to the photo (its bytes form the cache key)
+        mask_model: rembg model name (see MASK_MODELS)
+        mask_cache: Optional MaskCache; None always runs rembg
+        image: Already-loaded image (loaded from input_path on a miss otherwise)
+        mask_size: Low-resolution segmentation size (see generate_mask)
+        load_size: Size the photo is decoded at (see load_image); must match
+            `image` when both are given
+        raw_cache: Optional RawImageCache used when the photo must be loaded
+
+    Returns:
+        PIL Image in "L" mode with values 0/255
+    """
+    variant = _mask_variant(mask_model, mask_size, load_size)
+    key = mask_cache.key(input_path, variant, MASK_THRESHOLD) if mask_cache else None
+    if key:
+        cached = mask_cache.get(key)
+        if cached is not None:
+            print(f"[Step 1/4] Subject mask loaded from cache ({mask_model})")
+            return cached
+
+    if image is None:
+        image = load_image(input_path, load_size, raw_cache)
+    mask = _binarize(generate_mask(image, mask_model, mask_size))
+
+    if key:
+        mask_cache.put(key, mask)
+    return mask
+
+
+def get_subject_masks(
+    input_paths: List[str],
+    mask_model: str = DEFAULT_MASK_MODEL,
+    mask_cache: Optional[MaskCache] = None,
+    mask_size: int = 0,
+    load_size: int = 0,
+    raw_cache: Optional[RawImageCache] = None,
+    batch_size: int = DEFAULT_MASK_BATCH,
+) -> Tuple[Dict[str, Image.Image], Dict[str, Exception]]:
+    """
+    Binary subject masks for several photos, the cache misses segmented in batches.
+
+    Same masks and cache entries as get_subject_mask, but the photos that
+    are not cached go through generate_masks_batch together.
+
+    Args:
+        input_paths: Paths to the photos
+        mask_model: rembg model name (see MASK_MODELS)
+        mask_cache: Optional MaskCache; None always runs rembg
+        mask_size: Low-resolution segmentation size (see generate_mask)
+        load_size: Size the photos are decoded at (see load_image)
+        raw_cache: Optional RawImageCache used to load the photos
+        batch_size: Photos per inference (see generate_masks_batch)
+
+    Returns:
+        (path -> PIL Image in "L" mode with values 0/255, path -> error for
+        photos that could not be loaded)
+    """
+    variant = _mask_variant(mask_model, mask_size, load_size)
+    masks: Dict[str, Image.Image] = {}
+    errors: Dict[str, Exception] = {}
+    keys: Dict[str, Optional[str]] = {}
+    images: Dict[str, Image.Image] = {}
+
+    for path in input_paths:
+        try:
+            keys[path] = mask_cache.key(path, variant, MASK_THRESHOLD) if mask_cache else None
+            cached = mask_cache.get(keys[path]) if keys[path] else None
+            if cached is not None:
+                masks[path] = cached
+                continue
+            images[path] = load_image(path, load_size, raw_cache)
+        except Exception as e:
+            errors[path] = e
+    if masks:
+        print(f"[Step 1/4] {len(masks)} subject mask(s) loaded from cache ({mask_model})")
+
+    if images:
+        generated = generate_masks_batch(list(images.values()), mask_model, mask_size, batch_size)
+        for path, raw in zip(images, generated):
+            masks[path] = _binarize(raw)
+            if keys[path]:
+                mask_cache.put(keys[path], masks[path])
+    return masks, errors
+
+
+def _running_max(array: np.ndarray, radius: int, axis: int) -> np.ndarray:
+    """
+    Sliding-window maximum of width 2*radius+1 along one axis.
+
+    Uses the van Herk/Gil-Werman block trick: the padded axis is cut into
+    blocks of the window width, and every window max is the max of one
+    block-suffix and one block-prefix. Cost is constant per pixel no matter
+    how large the radius is. Out-of-range pixels count as 0.
+    """
+    import numpy as np
+
+    if radius <= 0:
+        return array
+
+    window = 2 * radius + 1
+    moved = np.moveaxis(array, axis, -1)
+    length = moved.shape[-1]
+
+    blocks = -(-(length + 2 * radius) // window)
+    padded = np.zeros(moved.shape[:-1] + (blocks * window,), dtype=moved.dtype)
+    padded[..., radius:radius + length] = moved
+
+    shaped = padded.reshape(moved.shape[:-1] + (blocks, window))
+    prefix = np.maximum.accumulate(shaped, axis=-1).reshape(padded.shape)
+    suffix = np.maximum.accumulate(shaped[..., ::-1], axis=-1)[..., ::-1].reshape(padded.shape)
+
+    # Window for output i spans padded[i : i + window]
+    result = np.maximum(suffix[..., :length], prefix[..., window - 1:window - 1 + length])
+    return np.moveaxis(result, -1, axis)
+
+
+def _box_mean(array: np.ndarray, radius: int) -> np.ndarray:
+    """2D mean over a (2r+1)x(2r+1) window with edge replication (via cumsum)."""
+    import numpy as np
+
+    window = 2 * radius + 1
+    padded = np.pad(array, ((radius + 1, radius), (radius + 1, radius)), mode="edge")
+    summed = padded.cumsum(axis=0, dtype=np.float64).cumsum(axis=1)
+    return (
+        summed[window:, window:] - summed[:-window, window:]
+        - summed[window:, :-window] + summed[:-window, :-window]
+    ) / (window * window)
+
+
+def _guided_filter(guide: np.ndarray, source: np.ndarray, radius: int, eps: float) -> np.ndarray:
+    """He et al. guided filter: edge-aware smoothing of `source` along `guide` edges."""
+    mean_i = _box_mean(guide, radius)
+    mean_p = _box_mean(source, radius)
+    cov_ip = _box_mean(guide * source, radius) - mean_i * mean_p
+    var_i = _box_mean(guide * guide, radius) - mean_i * mean_i
+
+    a = cov_ip / (var_i + eps)
+    b = mean_p - a * mean_i
+    return _box_mean(a, radius) * guide + _box_mean(b, radius)
+
+
+def refine_mask_edges(
+    image: Image.Image,
+    coarse_mask: np.ndarray,
+    radius: int = EDGE_REFINE_RADIUS,
+    eps: float = 1e-3,
+    tile_rows: int = 256,
+) -> np.ndarray:
+    """
+    Snap an upsampled mask to full-resolution image edges near its boundary.
 
+    Only the uncertain band (soft values left by upsampling, widened by the
+    filter radius) is touched. The image is processed in row tiles, each
+    cropped to the columns the band occupies, so working memory stays at a
+    few tile-sized float arrays even for 48 MP photos.
 
-def dilate_mask(mask: Image.Image, dilation_pixels: int = 7) -> Image.Image:
+    Args:
+        image: Full-resolution photo (guide)
+        coarse_mask: Upsampled uint8 mask at the photo's resolution
+        radius: Guided filter window radius in pixels
+        eps: Guided filter regularisation (larger = smoother)
+        tile_rows: Rows per processing tile
+
+    Returns:
+        Refined uint8 mask
+    """
+    import numpy as np
+
+    guide = np.asarray(image.convert("L"))
+    uncertain = ((coarse_mask > 8) & (coarse_mask < 247)).astype(np.uint8)
+    band = _running_max(_running_max(uncertain, radius, axis=0), radius, axis=1).astype(bool)
+
+    refined = coarse_mask.copy()
+    height, width = coarse_mask.shape
+
+    for top in range(0, height, tile_rows):
+        bottom = min(height, top + tile_rows)
+        tile_band = band[top:bottom]
+        columns = np.flatnonzero(tile_band.any(axis=0))
+        if columns.size == 0:
+            continue
+        left, right = int(columns[0]), int(columns[-1]) + 1
+
+        # The guided filter takes window means of window means, so a halo of
+        # 2*radius around the tile keeps both exact inside it
+        halo = 2 * radius
+        y0, y1 = max(0, top - halo), min(height, bottom + halo)
+        x0, x1 = max(0, left - halo), min(width, right + halo)
+        filtered = _guided_filter(
+            guide[y0:y1, x0:x1].astype(np.float32) / 255,
+            coarse_mask[y0:y1, x0:x1].astype(np.float32) / 255,
+            radius,
+            eps,
+        )
+
+        inner = filtered[top - y0:bottom - y0, left - x0:right - x0]
+        inner = np.clip(inner * 255 + 0.5, 0, 255).astype(np.uint8)
+        selected = tile_band[:, left:right]
+        refined[top:bottom, left:right][selected] = inner[selected]
+
+    return refined
+
+
+@instrumented("dilate_mask")
+def dilate_mask(
+    mask: Image.Image,
+    dilation_pixels: int = 7,
+    feather_pixels: int = 0,
+) -> Image.Image:
     """
     Apply mask dilation to expand the mask edges.
 
@@ -115,248 +766,1887 @@ def dilate_mask(mask: Image.Image, dilation_pixels: int = 7) -> Image.Image:
     to blend them perfectly with the new background, avoiding the
     "cut-out sticker" look.
 
+    The dilation is a square (2n+1)x(2n+1) max filter, identical to
+    applying MaxFilter(3) n times, computed as two separable running-max
+    passes whose cost does not depend on n.
+
     Args:
         mask: Grayscale mask (L mode)
         dilation_pixels: Number of pixels to expand (5-10 recommended)
+        feather_pixels: Width of a soft ramp centred on the dilated edge
+            (0 keeps a hard binary edge)
 
     Returns:
-        Dilated mask
+        Dilated (and optionally feathered) inverted mask
     """
-    print(f"[Step 2/4] Applying mask dilation ({dilation_pixels}px)...")
-
-    # Convert to numpy for processing
-    mask_array = np.array(mask)
+    import numpy as np
 
-    # Create a binary mask (threshold at 128)
-    binary_mask = (mask_array > 128).astype(np.uint8) * 255
+    feather_note = f", feather {feather_pixels}px" if feather_pixels else ""
+    print(f"[Step 2/4] Applying mask dilation ({dilation_pixels}px{feather_note})...")
 
-    # Convert back to PIL for dilation using MaxFilter
-    pil_mask = Image.fromarray(binary_mask, mode="L")
+    # Create a binary mask (threshold at MASK_THRESHOLD)
+    binary_mask = (np.asarray(mask) > MASK_THRESHOLD).astype(np.uint8) * 255
 
-    # Apply dilation using MaxFilter (expands white regions)
-    # Apply multiple times for larger dilation
-    dilated = pil_mask
-    for _ in range(dilation_pixels):
-        dilated = dilated.filter(ImageFilter.MaxFilter(3))
+    # Separable square dilation (expands white regions)
+    dilated = _running_max(binary_mask, dilation_pixels, axis=0)
+    dilated = _running_max(dilated, dilation_pixels, axis=1)
 
     # Invert the mask: we want to inpaint the BACKGROUND (where mask is black)
     # Flux expects: white = area to inpaint, black = area to keep
     # Our mask: white = subject, black = background
     # So we need to invert for background inpainting
-    inverted = Image.eval(dilated, lambda x: 255 - x)
+    inverted = Image.fromarray(255 - dilated)
+
+    if feather_pixels > 0:
+        # Pillow's GaussianBlur is an extended box blur (constant cost per
+        # radius); sigma = width / 2.5 puts the 10-90% ramp at ~feather_pixels
+        inverted = inverted.filter(ImageFilter.GaussianBlur(feather_pixels / 2.5))
 
     return inverted
 
 
-def image_to_base64(image: Image.Image, format: str = "PNG") -> str:
-    """Convert PIL Image to base64 string."""
+def image_to_bytes(image: Image.Image, format: str = "PNG") -> bytes:
+    """Encode a PIL Image in the given format."""
     buffer = io.BytesIO()
     image.save(buffer, format=format)
-    buffer.seek(0)
-    return base64.b64encode(buffer.read()).decode("utf-8")
+    return buffer.getvalue()
+
+
+def image_to_base64(image: Image.Image, format: str = "PNG") -> str:
+    """Convert PIL Image to base64 string (whole payload in memory; see EncodedUpload)."""
+    return base64.b64encode(image_to_bytes(image, format)).decode("utf-8")
 
 
 def image_to_data_uri(image: Image.Image, format: str = "PNG") -> str:
-    """Convert PIL Image to data URI."""
+    """Convert PIL Image to data URI (whole payload in memory; see EncodedUpload)."""
     b64 = image_to_base64(image, format)
     mime = "image/png" if format.upper() == "PNG" else "image/jpeg"
     return f"data:{mime};base64,{b64}"
 
 
-def call_flux_inpainting(
-    original_image: Image.Image,
-    mask: Image.Image,
-    prompt: str,
-    negative_prompt: str,
+class _DigestWriter:
+    """
+    Write-only wrapper that hashes everything written to a file.
+
+    It has no fileno(), so Pillow encodes through write() instead of
+    handing the encoder a descriptor (which would also force a spooled
+    file onto disk).
+    """
+
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        return self._fileobj.write(data)
+
+    def flush(self) -> None:
+        pass
+
+
+class EncodedUpload:
+    """
+    An encoded image waiting to be sent, held in a spooled temp file.
+
+    The encoder writes straight into the file (memory up to
+    UPLOAD_SPOOL_BYTES, then disk) and is hashed on the way, so neither the
+    encoded bytes nor their base64 text ever exists as one Python object.
+    Sent inline with data_uri() or through the files API with `file`.
+    """
+
+    def __init__(self, image: Image.Image, format: str):
+        self.mime = "image/png" if format.upper() == "PNG" else "image/jpeg"
+        self.file = tempfile.SpooledTemporaryFile(
+            max_size=UPLOAD_SPOOL_BYTES, prefix="wedding_bg_upload_"
+        )
+        writer = _DigestWriter(self.file)
+        image.save(writer, format=format)
+        self.size = self.file.tell()
+        self.digest = "sha256:" + writer.sha256.hexdigest()
+
+    def data_uri(self) -> DataURI:
+        """Request input that base64-encodes the file while the body streams."""
+        from wedding_bg_client import DataURI
+
+        return DataURI(self.file, self.mime)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def encode_flux_images(
+    original_image: Image.Image, mask: Image.Image
+) -> Tuple[EncodedUpload, EncodedUpload]:
+    """Encode photo (JPEG) and mask (PNG) as sent to Flux Fill, mask matched to the photo size."""
+    # Ensure both images are the same size
+    if original_image.size != mask.size:
+        mask = mask.resize(original_image.size, Image.Resampling.NEAREST)
+
+    # Convert original to RGB if RGBA
+    if original_image.mode == "RGBA":
+        original_image = original_image.convert("RGB")
+
+    encoded_image = EncodedUpload(original_image, "JPEG")
+    try:
+        return encoded_image, EncodedUpload(mask, "PNG")
+    except BaseException:
+        encoded_image.close()
+        raise
+
+
+def _flux_settings(prompt: str, guidance: int, steps: int) -> dict:
+    """Non-image Flux Fill inputs."""
+    return {
+        "prompt": prompt,
+        "guidance": guidance,
+        "steps": steps,
+        "output_format": "png",
+        "output_quality": 100,
+    }
+
+
+def model_working_size(size: Tuple[int, int], max_side: int) -> Tuple[int, int]:
+    """
+    Size to upload at: longest side <= max_side, both sides multiples of 16.
+
+    Flux works on a 16px latent grid, so matching it means the generated
+    image comes back at exactly the uploaded size.
+    """
+    width, height = size
+    scale = min(1.0, max_side / max(width, height))
+    return (
+        max(16, int(width * scale) // 16 * 16),
+        max(16, int(height * scale) // 16 * 16),
+    )
+
+
+def composite_subject(
+    original_image: Image.Image,
+    generated: Image.Image,
+    mask: Image.Image,
+) -> Image.Image:
+    """
+    Put the full-resolution subject back over an upscaled generated image.
+
+    Args:
+        original_image: Full-resolution original photo
+        generated: Inpainting result at model resolution
+        mask: Full-resolution inpaint mask (white = generated background);
+            a hard mask is softened so the seam does not show
+
+    Returns:
+        RGB image at the original resolution
+    """
+    if mask.size != original_image.size:
+        mask = mask.resize(original_image.size, Image.Resampling.BILINEAR)
+
+    # A binary mask would leave a visible seam; soften it if it has no ramp
+    if mask.getcolors(2) is not None:
+        mask = mask.filter(ImageFilter.GaussianBlur(COMPOSITE_FEATHER / 2.5))
+
+    background = generated.convert("RGB").resize(
+        original_image.size, Image.Resampling.LANCZOS
+    )
+    return Image.composite(background, original_image.convert("RGB"), mask)
+
+
+class EncodedResult:
+    """
+    An encoded inpainting result on disk, decoded only when pixels are needed.
+
+    `temporary` results are owned by this object (a download in the temp
+    directory) and may be moved into place; cached results are copied
+    (hard-linked where possible) so the cache keeps its entry.
+    """
+
+    def __init__(self, path: Path, temporary: bool):
+        self.path = Path(path)
+        self.temporary = temporary
+
+    def header(self) -> Tuple[str, str]:
+        """(format, mode) read from the file header without decoding pixels."""
+        with Image.open(self.path) as probe:
+            return probe.format, probe.mode
+
+    def decode(self) -> Image.Image:
+        """Fully decode the image and release the temporary file."""
+        with Image.open(self.path) as encoded:
+            encoded.load()
+            image = encoded
+        self.discard()
+        return image
+
+    def place(self, destination: Path) -> None:
+        """
+        Move (temporary) or copy (cached) the encoded file to destination atomically.
+
+        Cached files are copied, never hard-linked: editing the output in
+        place must not change the cache entry.
+        """
+        if self.temporary:
+            wedding_bg_cache.atomic_move(self.path, destination)
+        else:
+            wedding_bg_cache.atomic_copy(self.path, destination)
+
+    def discard(self) -> None:
+        """Delete the file if this object owns it."""
+        if self.temporary:
+            self.path.unlink(missing_ok=True)
+
+
+async def _run_prediction(
+    cache_inputs: dict,
+    make_inputs: Callable[[], Awaitable[dict]],
+    client: AsyncInpaintingClient,
+    result_cache: Optional[ResultCache],
+    refresh_cache: bool,
+    priority: Optional[int] = None,
+) -> EncodedResult:
+    """
+    Consult the result cache, else stream one prediction to disk.
+
+    `cache_inputs` identifies the request for caching; `make_inputs` builds
+    the payload actually sent and is only awaited on a cache miss.
+    `priority` orders the prediction in the client's scheduler queue
+    (default: PRIORITY_INTERACTIVE).
+    """
+    import wedding_bg_client
+
+    if priority is None:
+        priority = wedding_bg_client.PRIORITY_INTERACTIVE
+    # Identical requests (same pixels, mask, prompt and settings) reuse the
+    # stored result instead of paying for another prediction
+    cache_key = wedding_bg_cache.ResultCache.key(FLUX_MODEL, cache_inputs) if result_cache else None
+    if cache_key and not refresh_cache:
+        cached = await asyncio.to_thread(result_cache.get_path, cache_key)
+        if cached is not None:
+            print("  Result loaded from cache (identical request)")
+            return EncodedResult(cached, temporary=False)
+
+    inputs = await make_inputs()
+    print("  Sending request to Replicate (this may take 30-60 seconds)...")
+    metrics.count_bytes(up=sum(
+        len(v) for v in inputs.values() if isinstance(v, (str, wedding_bg_client.DataURI))
+    ))
+
+    # Stream the download straight to disk; nothing is decoded here
+    fd, tmp_name = tempfile.mkstemp(prefix="wedding_bg_", suffix=".result")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            metrics.count_bytes(down=await client.run_to(FLUX_MODEL, inputs, f, priority))
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+    if cache_key:
+        cached = await asyncio.to_thread(result_cache.put_file, cache_key, tmp_name)
+        return EncodedResult(cached, temporary=False)
+    return EncodedResult(Path(tmp_name), temporary=True)
+
+
+async def _request_inpainting(
+    image: Image.Image,
+    mask: Image.Image,
+    prompt: str,
+    client: AsyncInpaintingClient,
+    guidance: int,
+    steps: int,
+    result_cache: Optional[ResultCache],
+    refresh_cache: bool,
+    priority: Optional[int] = None,
+) -> EncodedResult:
+    """
+    Send images inline as streamed data URIs and run one (cached) prediction.
+
+    The cache identity uses content digests, as for variants, so the same
+    photo, mask and settings hit the same entry either way.
+    """
+    encoded_image, encoded_mask = await asyncio.to_thread(encode_flux_images, image, mask)
+    try:
+        settings = _flux_settings(prompt, guidance, steps)
+
+        async def make_inputs() -> dict:
+            return {**settings, "image": encoded_image.data_uri(), "mask": encoded_mask.data_uri()}
+
+        return await _run_prediction(
+            {**settings, "image": encoded_image.digest, "mask": encoded_mask.digest},
+            make_inputs, client, result_cache, refresh_cache, priority,
+        )
+    finally:
+        encoded_image.close()
+        encoded_mask.close()
+
+
+def _upload_working_images(
+    original_image: Image.Image,
+    mask: Image.Image,
+    upload_size: int,
+) -> Tuple[Image.Image, Image.Image]:
+    """Image and mask at the size sent to the model (unchanged if upload_size is 0)."""
+    if not upload_size or max(original_image.size) <= upload_size:
+        return original_image, mask
+    work_size = model_working_size(original_image.size, upload_size)
+    print(f"  Uploading at {work_size[0]}x{work_size[1]} "
+          f"(from {original_image.size[0]}x{original_image.size[1]})")
+    return (
+        original_image.resize(work_size, Image.Resampling.LANCZOS, reducing_gap=2.0),
+        mask.resize(work_size, Image.Resampling.BILINEAR),
+    )
+
+
+@instrumented("call_flux_inpainting")
+async def call_flux_inpainting_async(
+    original_image: Image.Image,
+    mask: Image.Image,
+    prompt: str,
+    negative_prompt: str,
+    client: AsyncInpaintingClient,
+    guidance: int = FLUX_GUIDANCE,
+    steps: int = FLUX_STEPS,
+    result_cache: Optional[ResultCache] = None,
+    refresh_cache: bool = False,
+    upload_size: int = 0,
+    priority: Optional[int] = None,
+) -> Union[Image.Image, EncodedResult]:
+    """
+    Run Flux inpainting through a shared AsyncInpaintingClient.
+
+    Encoding and cache I/O run in worker threads so many calls can share
+    one event loop (and one connection pool) without blocking each other.
+    Arguments are as for call_flux_inpainting, plus the client to use and
+    the prediction's scheduling priority (wedding_bg_client's
+    PRIORITY_INTERACTIVE, the default, or PRIORITY_BULK).
+
+    Returns the still-encoded EncodedResult when the API output can be
+    used as is, or a decoded Image when it had to be composited.
+    """
+    print("[Step 3/4] Calling Flux inpainting API...")
+
+    if not upload_size or max(original_image.size) <= upload_size:
+        return await _request_inpainting(
+            original_image, mask, prompt, client, guidance, steps,
+            result_cache, refresh_cache, priority,
+        )
+
+    # Upload at model resolution, then upscale only the background and
+    # keep the original subject pixels
+    small_image, small_mask = await asyncio.to_thread(
+        _upload_working_images, original_image, mask, upload_size
+    )
+    generated = await _request_inpainting(
+        small_image, small_mask, prompt, client, guidance, steps,
+        result_cache, refresh_cache, priority,
+    )
+    return await asyncio.to_thread(
+        lambda: composite_subject(original_image, generated.decode(), mask)
+    )
+
+
+@instrumented("call_flux_variants")
+async def call_flux_variants_async(
+    original_image: Image.Image,
+    mask: Image.Image,
+    prompts: List[str],
+    negative_prompt: str,
+    client: AsyncInpaintingClient,
+    guidance: int = FLUX_GUIDANCE,
+    steps: int = FLUX_STEPS,
+    result_cache: Optional[ResultCache] = None,
+    refresh_cache: bool = False,
+    upload_size: int = 0,
+    priority: Optional[int] = None,
+) -> List[Union[Image.Image, EncodedResult, BaseException]]:
+    """
+    Run Flux inpainting once per prompt on the same photo and mask.
+
+    The photo and mask are resized and encoded once. If any prompt misses
+    the result cache they are uploaded once through the files API, and
+    every prediction references the uploaded URLs instead of carrying its
+    own base64 copy. Predictions run concurrently, as the client's
+    scheduler admits them. Other arguments are as for call_flux_inpainting_async.
+
+    Returns:
+        One result per prompt, in prompt order; a failed variant is returned
+        as its exception so the others still complete
+    """
+    print(f"[Step 3/4] Calling Flux inpainting API for {len(prompts)} prompts...")
+
+    small_image, small_mask = await asyncio.to_thread(
+        _upload_working_images, original_image, mask, upload_size
+    )
+    encoded_image, encoded_mask = await asyncio.to_thread(
+        encode_flux_images, small_image, small_mask
+    )
+
+    # Cache identity uses content digests, since upload URLs differ per run
+    digests = {"image": encoded_image.digest, "mask": encoded_mask.digest}
+    uploaded: Dict[str, str] = {}
+    upload_lock = asyncio.Lock()
+
+    async def upload_once() -> Dict[str, str]:
+        async with upload_lock:
+            if not uploaded:
+                print("  Uploading photo and mask once for all prompts...")
+                image_url, mask_url = await asyncio.gather(
+                    client.upload_file(encoded_image.file, "image.jpg", encoded_image.mime),
+                    client.upload_file(encoded_mask.file, "mask.png", encoded_mask.mime),
+                )
+                metrics.count_bytes(up=encoded_image.size + encoded_mask.size)
+                uploaded.update(image=image_url, mask=mask_url)
+        return uploaded
+
+    async def variant(prompt: str) -> Union[Image.Image, EncodedResult]:
+        settings = _flux_settings(prompt, guidance, steps)
+
+        async def make_inputs() -> dict:
+            return {**settings, **await upload_once()}
+
+        result = await _run_prediction(
+            {**settings, **digests}, make_inputs, client, result_cache, refresh_cache,
+            priority,
+        )
+        if small_image is original_image:
+            return result
+        return await asyncio.to_thread(
+            lambda: composite_subject(original_image, result.decode(), mask)
+        )
+
+    try:
+        return await asyncio.gather(*(variant(p) for p in prompts), return_exceptions=True)
+    finally:
+        encoded_image.close()
+        encoded_mask.close()
+
+
+def call_flux_inpainting(
+    original_image: Image.Image,
+    mask: Image.Image,
+    prompt: str,
+    negative_prompt: str,
+    api_token: Optional[str] = None,
+    guidance: int = FLUX_GUIDANCE,
+    steps: int = FLUX_STEPS,
+    result_cache: Optional[ResultCache] = None,
+    refresh_cache: bool = False,
+    upload_size: int = 0,
+    decode: bool = True,
+) -> Union[Image.Image, EncodedResult]:
+    """
+    Call Replicate API with Flux inpainting model.
+
+    Args:
+        original_image: Original wedding photo
+        mask: Dilated mask (white = inpaint area)
+        prompt: Positive prompt for generation
+        negative_prompt: Negative prompt to avoid
+        api_token: Replicate API token (optional, uses env if not provided)
+        guidance: Prompt adherence (higher = follows the prompt more closely)
+        steps: Diffusion steps (more = higher quality, slower)
+        result_cache: Optional ResultCache consulted before calling the API
+        refresh_cache: Skip cache lookups but still store the new result
+        upload_size: If set, upload at most this many pixels on the long side
+            and composite the full-resolution subject back (0 = full size)
+        decode: Return a decoded Image; False may return the still-encoded
+            EncodedResult so save_output can skip a decode/re-encode
+
+    Returns:
+        Generated image with new background
+    """
+    from wedding_bg_client import AsyncInpaintingClient
+
+    async def run() -> Union[Image.Image, EncodedResult]:
+        async with AsyncInpaintingClient(
+            api_token, scheduler=api_scheduler()
+        ) as client:
+            return await call_flux_inpainting_async(
+                original_image, mask, prompt, negative_prompt, client,
+                guidance=guidance,
+                steps=steps,
+                result_cache=result_cache,
+                refresh_cache=refresh_cache,
+                upload_size=upload_size,
+            )
+
+    result = asyncio.run(run())
+    if decode and isinstance(result, EncodedResult):
+        result = result.decode()
+    return result
+
+
+# =============================================================================
+# INPAINTING BACKENDS
+# =============================================================================
+
+@instrumented("preview_fill")
+def preview_fill(
+    image: Image.Image,
+    mask: Image.Image,
+    max_side: int = PREVIEW_SIZE,
+) -> Image.Image:
+    """
+    Local stand-in for inpainting, for checking mask and framing.
+
+    The masked area is replaced by a heavy blur of the original background
+    only (normalized convolution, so subject colours do not bleed in),
+    slightly darkened; the subject is composited back through the mask.
+    Works at preview resolution and runs in well under a second.
+
+    Args:
+        image: Original wedding photo
+        mask: Dilated mask (white = inpaint area)
+        max_side: Long side of the returned preview
+
+    Returns:
+        RGB preview, at most max_side on the long side
+    """
+    import numpy as np
+
+    print("[Step 3/4] Rendering local preview (no API call)...")
+
+    work_size = model_working_size(image.size, max_side)
+    small = image.convert("RGB").resize(work_size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    alpha = mask.convert("L").resize(work_size, Image.Resampling.BILINEAR)
+
+    rgb = np.asarray(small, dtype=np.float32)
+    weight = np.asarray(alpha, dtype=np.float32) / 255
+    radius = max(2, max(work_size) // 48)
+
+    # Two box passes approximate a Gaussian; dividing by the blurred weight
+    # averages background pixels only
+    norm = _box_mean(_box_mean(weight, radius), radius)
+    fallback = (rgb * weight[..., None]).sum(axis=(0, 1)) / max(weight.sum(), 1.0)
+    filled = np.empty_like(rgb)
+    for channel in range(3):
+        blurred = _box_mean(_box_mean(rgb[..., channel] * weight, radius), radius)
+        filled[..., channel] = np.where(
+            norm > 1e-3, blurred / np.maximum(norm, 1e-3), fallback[channel]
+        )
+
+    background = Image.fromarray(np.clip(filled * PREVIEW_DIM, 0, 255).astype(np.uint8))
+    return Image.composite(background, small, alpha)
+
+
+class InpaintingBackend(abc.ABC):
+    """
+    Turns a photo and its dilated mask into a photo with a new background.
+
+    Backends are async so the batch pipeline can run many requests on one
+    event loop; CPU-bound work belongs in worker threads. Subclasses must
+    implement inpaint; instantiating one that does not raises TypeError.
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def inpaint(
+        self,
+        image: Image.Image,
+        mask: Image.Image,
+        prompt: str,
+        negative_prompt: str,
+    ) -> Union[Image.Image, EncodedResult]:
+        """Return the result as an Image or a still-encoded EncodedResult."""
+
+    async def inpaint_variants(
+        self,
+        image: Image.Image,
+        mask: Image.Image,
+        prompts: List[str],
+        negative_prompt: str,
+    ) -> List[Union[Image.Image, EncodedResult, BaseException]]:
+        """One result per prompt, in order; failures are returned as exceptions."""
+        return await asyncio.gather(
+            *(self.inpaint(image, mask, p, negative_prompt) for p in prompts),
+            return_exceptions=True,
+        )
+
+    async def aclose(self) -> None:
+        """Release connections or other resources."""
+
+    def summary(self) -> Optional[str]:
+        """One-line report for the end of a run, if the backend has one."""
+        return None
+
+
+class ReplicateBackend(InpaintingBackend):
+    """
+    Flux Fill on Replicate (see call_flux_inpainting_async).
+
+    Args:
+        client: Shared AsyncInpaintingClient (closed by aclose)
+        result_cache: Optional ResultCache consulted before calling the API
+        refresh_cache: Skip cache lookups but still store the new result
+        upload_size: Upload long side (0 = full resolution)
+        priority: Scheduling priority of this backend's predictions
+    """
+
+    name = "replicate"
+
+    def __init__(
+        self,
+        client: AsyncInpaintingClient,
+        result_cache: Optional[ResultCache] = None,
+        refresh_cache: bool = False,
+        upload_size: int = 0,
+        priority: Optional[int] = None,
+    ):
+        self.client = client
+        self.result_cache = result_cache
+        self.refresh_cache = refresh_cache
+        self.upload_size = upload_size
+        self.priority = priority
+
+    async def inpaint(self, image, mask, prompt, negative_prompt):
+        return await call_flux_inpainting_async(
+            image, mask, prompt, negative_prompt, self.client,
+            result_cache=self.result_cache,
+            refresh_cache=self.refresh_cache,
+            upload_size=self.upload_size,
+            priority=self.priority,
+        )
+
+    async def inpaint_variants(self, image, mask, prompts, negative_prompt):
+        return await call_flux_variants_async(
+            image, mask, prompts, negative_prompt, self.client,
+            result_cache=self.result_cache,
+            refresh_cache=self.refresh_cache,
+            upload_size=self.upload_size,
+            priority=self.priority,
+        )
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    def summary(self) -> Optional[str]:
+        lines = [self.result_cache.summary()] if self.result_cache else []
+        if self.client.scheduler.completed or self.client.scheduler.throttled:
+            lines.append(self.client.scheduler.summary())
+        return "\n  ".join(lines) or None
+
+
+class PreviewBackend(InpaintingBackend):
+    """CPU-only preview_fill; needs no API token and costs nothing."""
+
+    name = "preview"
+
+    def __init__(self, max_side: int = PREVIEW_SIZE):
+        self.max_side = max_side
+
+    async def inpaint(self, image, mask, prompt, negative_prompt):
+        return await asyncio.to_thread(preview_fill, image, mask, self.max_side)
+
+    async def inpaint_variants(self, image, mask, prompts, negative_prompt):
+        # The preview ignores the prompt, so one fill serves every variant
+        fill = await self.inpaint(image, mask, prompts[0], negative_prompt)
+        return [fill] * len(prompts)
+
+
+# One scheduler for every Replicate client in the process, so interactive
+# jobs (GUI, single photos) queue ahead of a running batch and everything
+# shares one rate limit and one congestion backoff
+_API_SCHEDULER: Optional[AdaptiveScheduler] = None
+_API_SCHEDULER_LOCK = threading.Lock()
+
+
+def api_scheduler(
+    api_workers: int = 4,
+    max_api_workers: int = DEFAULT_MAX_API_WORKERS,
+    api_rate: float = DEFAULT_API_RATE,
+) -> AdaptiveScheduler:
+    """
+    The process-wide prediction scheduler, created on first use.
+
+    The limits of the first caller win; later callers share the scheduler
+    as it is (in the CLI there is only one caller per process).
+    """
+    from wedding_bg_client import AdaptiveScheduler
+
+    global _API_SCHEDULER
+    with _API_SCHEDULER_LOCK:
+        if _API_SCHEDULER is None:
+            _API_SCHEDULER = AdaptiveScheduler.for_limits(
+                api_workers, max(max_api_workers, api_workers), api_rate
+            )
+        return _API_SCHEDULER
+
+
+def create_backend(
+    name: str = "replicate",
+    api_token: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    use_result_cache: bool = True,
+    refresh_cache: bool = False,
+    upload_size: int = 0,
+    api_workers: int = 4,
+    max_api_workers: int = DEFAULT_MAX_API_WORKERS,
+    api_rate: float = DEFAULT_API_RATE,
+    priority: Optional[int] = None,
+    scheduler: Optional[AdaptiveScheduler] = None,
+) -> InpaintingBackend:
+    """
+    Build an inpainting backend by name (see INPAINTING_BACKENDS).
+
+    For Replicate, predictions are admitted by `scheduler` (default: the
+    process-wide api_scheduler, created with api_workers as the starting
+    concurrency, adapting up to max_api_workers, at most api_rate
+    creations per second). Options that do not apply to the chosen
+    backend are ignored.
+    """
+    if name == "preview":
+        return PreviewBackend()
+    if name == "replicate":
+        from wedding_bg_client import AsyncInpaintingClient
+
+        max_api_workers = max(max_api_workers, api_workers)
+        client = AsyncInpaintingClient(
+            api_token,
+            max_connections=max_api_workers * 2,
+            scheduler=scheduler or api_scheduler(api_workers, max_api_workers, api_rate),
+        )
+        result_cache = wedding_bg_cache.ResultCache(cache_dir) if use_result_cache else None
+        return ReplicateBackend(client, result_cache, refresh_cache, upload_size, priority)
+    raise ValueError(
+        f"Unknown inpainting backend: {name} (choose from {', '.join(INPAINTING_BACKENDS)})"
+    )
+
+
+def backend_load_size(name: str) -> int:
+    """Long side photos are decoded at for a backend (0 = full resolution)."""
+    # The preview renders at PREVIEW_SIZE, so a full-size decode is wasted work
+    return PREVIEW_SIZE if name == "preview" else 0
+
+
+@dataclass
+class OutputOptions:
+    """
+    How results are encoded, and which extra formats and sizes are exported.
+
+    `format` names generated output files (an explicit output path keeps
+    its own extension). Each export is a (format, max_size) pair written
+    next to the output; max_size 0 keeps the full resolution.
+    """
+
+    format: str = DEFAULT_OUTPUT_FORMAT
+    exports: List[Tuple[str, int]] = field(default_factory=list)
+    png_compress_level: int = PNG_COMPRESS_LEVEL
+    quality: int = OUTPUT_QUALITY
+    webp_method: int = WEBP_METHOD
+    avif_speed: int = AVIF_SPEED
+
+    @property
+    def extension(self) -> str:
+        return OUTPUT_FORMATS[self.format][1]
+
+    def params(self, format: str) -> dict:
+        """Pillow save() arguments for a Pillow format name."""
+        if format == "PNG":
+            return {"compress_level": self.png_compress_level}
+        if format == "JPEG":
+            return {"quality": self.quality, "optimize": True, "progressive": True}
+        if format == "WEBP":
+            return {"quality": self.quality, "method": self.webp_method}
+        if format == "AVIF":
+            return {"quality": self.quality, "speed": self.avif_speed}
+        return {}
+
+    def export_paths(self, output_path: Path) -> List[Tuple[Path, str, int]]:
+        """(path, Pillow format, max_size) of the exports of one output file."""
+        targets = []
+        for name, max_size in self.exports:
+            format, extension = OUTPUT_FORMATS[name]
+            stem = f"{output_path.stem}_{max_size}" if max_size else output_path.stem
+            path = output_path.with_name(stem + extension)
+            if path != output_path and path not in (t[0] for t in targets):
+                targets.append((path, format, max_size))
+        return targets
+
+
+@dataclass
+class ExportResult:
+    """One encoded output file."""
+
+    path: str
+    format: str
+    size: Tuple[int, int]
+    bytes: int
+    seconds: float
+
+
+def parse_export(value: str) -> Tuple[str, int]:
+    """Parse a FORMAT[:MAX_SIZE] export spec, e.g. "webp" or "jpeg:2048"."""
+    name, _, size = value.lower().partition(":")
+    name = "jpeg" if name == "jpg" else name
+    if name not in OUTPUT_FORMATS:
+        raise argparse.ArgumentTypeError(
+            f"Unknown format: {name} (choose from {', '.join(OUTPUT_FORMATS)})"
+        )
+    try:
+        max_size = int(size) if size else 0
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected FORMAT[:MAX_SIZE], got: {value}")
+    if max_size < 0:
+        raise argparse.ArgumentTypeError(f"Export size must not be negative, got: {value}")
+    return name, max_size
+
+
+def output_name(
+    input_path: str, digest: str, suffix: str = "_bg", extension: str = ".png"
+) -> str:
+    """
+    Deterministic output file name for an input photo.
+
+    The stem keeps names readable and the content hash prefix keeps two
+    photos with the same name (pic/1.jpg, public/pic/1.jpg) apart, so
+    re-runs overwrite their own earlier output and nothing else.
+    """
+    return f"{Path(input_path).stem}_{digest[:8]}{suffix}{extension}"
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """RGB version of a result; transparency is composited onto white."""
+    if image.mode == "RGBA":
+        alpha_min, _ = image.getchannel("A").getextrema()
+        if alpha_min == 255:
+            # Fully opaque: dropping the channel is enough
+            return image.convert("RGB")
+        # Create white background and paste
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    if image.mode != "RGB":
+        return image.convert("RGB")
+    return image
+
+
+def _encode_output(
+    image: Image.Image, path: Path, format: str, max_size: int, options: OutputOptions
+) -> ExportResult:
+    """
+    Resize (if needed) and write one output file; runs on an export thread.
+
+    `image` must be this thread's own copy: save() stores its encoder
+    arguments on the Image object, so a shared one could leak them into
+    another thread's format.
+    """
+    start = time.perf_counter()
+    if max_size and max(image.size) > max_size:
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    wedding_bg_cache.atomic_write_image(image, path, format, **options.params(format))
+    return ExportResult(
+        str(path.absolute()), format, image.size, path.stat().st_size,
+        time.perf_counter() - start,
+    )
+
+
+def export_image(
+    image: Image.Image,
+    targets: List[Tuple[Path, str, int]],
+    options: Optional[OutputOptions] = None,
+) -> List[ExportResult]:
+    """
+    Encode one image to several files at once.
+
+    Pillow's resize and its PNG/JPEG/WebP/AVIF encoders release the GIL,
+    so each target gets its own thread and a multi-format export takes
+    about as long as its slowest encoder instead of the sum of all.
+
+    Args:
+        image: RGB image to encode
+        targets: (path, Pillow format, max_size) per file; max_size 0
+            keeps the full resolution, larger images are never upscaled
+        options: Encoder settings (default: OutputOptions())
+
+    Returns:
+        One ExportResult per target, in target order
+    """
+    options = options or OutputOptions()
+    image.load()
+    if len(targets) == 1:
+        return [_encode_output(image.copy(), *targets[0], options)]
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=min(len(targets), os.cpu_count() or 1)) as pool:
+        futures = [
+            pool.submit(_encode_output, image.copy(), *target, options) for target in targets
+        ]
+        return [future.result() for future in futures]
+
+
+def _print_export(result: ExportResult) -> None:
+    width, height = result.size
+    print(f"  Saved to: {result.path} ({result.format} {width}x{height}, "
+          f"{result.bytes / 2**20:.2f} MB in {result.seconds:.2f}s)")
+
+
+@instrumented("save_output")
+def save_output(
+    image: Union[Image.Image, EncodedResult],
+    output_path: str,
+    output: Optional[OutputOptions] = None,
+) -> str:
+    """
+    Save the result image, plus any exports configured in `output`.
+
+    An EncodedResult whose format already matches the output path (and has
+    no alpha to flatten) is moved/copied into place without decoding.
+    The output and its exports are encoded in parallel (see export_image).
+
+    Args:
+        image: Result image to save (decoded, or still encoded on disk)
+        output_path: Output path (format from its extension); see output_name
+        output: Encoder settings and exports (default: OutputOptions())
+
+    Returns:
+        Path where the image was saved
+    """
+    print("[Step 4/4] Saving output...")
+    output = output or OutputOptions()
+
+    path = Path(output_path)
+    target_format = Image.registered_extensions().get(path.suffix.lower(), "PNG")
+    targets = [(path, target_format, 0)] + output.export_paths(path)
+
+    if isinstance(image, EncodedResult):
+        encoded_format, encoded_mode = image.header()
+        if encoded_format == target_format and encoded_mode in ("RGB", "L"):
+            image.place(path)
+            print(f"  Saved to: {path.absolute()} (as returned by the API)")
+            targets.pop(0)
+            if not targets:
+                return str(path.absolute())
+            with Image.open(path) as placed:
+                placed.load()
+                image = placed
+        else:
+            image = image.decode()
+
+    for result in export_image(_flatten(image), targets, output):
+        _print_export(result)
+
+    return str(path.absolute())
+
+
+# =============================================================================
+# MAIN PIPELINE
+# =============================================================================
+
+class ProcessingCancelled(RuntimeError):
+    """process_wedding_photo was stopped through its cancel_event."""
+
+
+def _check_cancelled(cancel_event: Optional[threading.Event]) -> None:
+    """Raise ProcessingCancelled if cancellation was requested."""
+    if cancel_event is not None and cancel_event.is_set():
+        raise ProcessingCancelled("Cancelled")
+
+
+def process_wedding_photo(
+    input_path: str,
+    output_path: Optional[str] = None,
+    positive_prompt: Optional[str] = None,
+    negative_prompt: Optional[str] = None,
+    dilation_pixels: int = 7,
+    api_token: Optional[str] = None,
+    save_mask: bool = False,
+    mask_model: str = DEFAULT_MASK_MODEL,
+    feather_pixels: int = 0,
+    use_mask_cache: bool = True,
+    cache_dir: Optional[str] = None,
+    use_result_cache: bool = True,
+    refresh_cache: bool = False,
+    upload_size: int = 0,
+    mask_size: int = 0,
+    backend: str = "replicate",
+    cancel_event: Optional[threading.Event] = None,
+    use_raw_cache: bool = False,
+    output: Optional[OutputOptions] = None,
+) -> str:
+    """
+    Main pipeline to process a wedding photo.
+
+    Args:
+        input_path: Path to input image
+        output_path: Optional output path (default: output_name() in the
+            current directory)
+        positive_prompt: Custom positive prompt
+        negative_prompt: Custom negative prompt
+        dilation_pixels: Mask dilation amount
+        api_token: Replicate API token
+        save_mask: Whether to save the mask for debugging
+        mask_model: rembg model used for masking (see MASK_MODELS)
+        feather_pixels: Soft edge width applied after dilation (0 = hard edge)
+        use_mask_cache: Reuse masks computed earlier for the same photo/model
+        cache_dir: Cache root (default: wedding_bg_cache.DEFAULT_CACHE_DIR)
+        use_result_cache: Reuse API results for identical requests
+        refresh_cache: Call the API even on a cache hit (result is re-stored)
+        upload_size: Upload at this long-side size and recomposite the
+            full-resolution subject (0 = upload full resolution)
+        mask_size: Segment at this long-side size and refine edges at full
+            resolution (0 = segment at full resolution)
+        backend: Inpainting backend, "replicate" or "preview" (local, reduced
+            resolution, no API call; see INPAINTING_BACKENDS)
+        cancel_event: When set (from any thread), processing stops at the
+            next stage boundary and an in-flight prediction is cancelled;
+            raises ProcessingCancelled
+        use_raw_cache: Keep the decoded photo in the raw image cache and
+            memory-map it on later runs instead of decoding again
+        output: Output format, encoder settings and extra exports (see
+            OutputOptions; default: PNG only)
+
+    Returns:
+        Path to the output image
+    """
+    print("=" * 60)
+    print("Wedding Photo Background Generator")
+    print("=" * 60)
+    print(f"Input: {input_path}")
+    print(f"Dilation: {dilation_pixels}px")
+    print(f"Mask model: {mask_model}")
+    print(f"Backend: {backend}")
+    print()
+
+    run_start = time.perf_counter()
+    input_token = metrics.current_input.set(input_path)
+    try:
+        output_file = _run_pipeline(
+            input_path, output_path, positive_prompt, negative_prompt,
+            dilation_pixels, api_token, save_mask, mask_model, feather_pixels,
+            use_mask_cache, cache_dir, use_result_cache, refresh_cache,
+            upload_size, mask_size, backend, cancel_event, use_raw_cache,
+            output or OutputOptions(),
+        )
+    finally:
+        metrics.current_input.reset(input_token)
+
+    if metrics.enabled():
+        metrics.emit({
+            "event": "run",
+            "input": input_path,
+            "output": output_file,
+            "time": time.time(),
+            "wall_s": round(time.perf_counter() - run_start, 6),
+        })
+
+    return output_file
+
+
+def _run_pipeline(
+    input_path: str,
+    output_path: Optional[str],
+    positive_prompt: Optional[str],
+    negative_prompt: Optional[str],
+    dilation_pixels: int,
+    api_token: Optional[str],
+    save_mask: bool,
+    mask_model: str,
+    feather_pixels: int,
+    use_mask_cache: bool,
+    cache_dir: Optional[str],
+    use_result_cache: bool,
+    refresh_cache: bool,
+    upload_size: int,
+    mask_size: int,
+    backend: str,
+    cancel_event: Optional[threading.Event],
+    use_raw_cache: bool,
+    output: OutputOptions,
+) -> str:
+    """The single-photo stages; see process_wedding_photo for arguments."""
+    # Use defaults if not provided
+    prompt = positive_prompt or DEFAULT_POSITIVE_PROMPT
+    neg_prompt = negative_prompt or DEFAULT_NEGATIVE_PROMPT
+
+    # 1. Load image (previews only need a reduced decode)
+    load_size = backend_load_size(backend)
+    raw_cache = wedding_bg_cache.RawImageCache(cache_dir) if use_raw_cache else None
+    image = load_image(input_path, load_size, raw_cache)
+    print(f"  Image size: {image.size}")
+
+    # 2. Generate mask (or reuse a cached one)
+    _check_cancelled(cancel_event)
+    mask_cache = wedding_bg_cache.MaskCache(cache_dir) if use_mask_cache else None
+    mask = get_subject_mask(input_path, mask_model, mask_cache, image, mask_size, load_size)
+
+    # 3. Dilate mask
+    _check_cancelled(cancel_event)
+    dilated_mask = dilate_mask(mask, dilation_pixels, feather_pixels)
+
+    # Optional: save mask for debugging
+    if save_mask:
+        mask_path = Path(input_path).stem + "_mask.png"
+        dilated_mask.save(mask_path)
+        print(f"  Mask saved to: {mask_path}")
+
+    # 4. Inpaint the background
+    _check_cancelled(cancel_event)
+    inpainter = create_backend(
+        backend, api_token, cache_dir, use_result_cache, refresh_cache, upload_size
+    )
+
+    async def run() -> Union[Image.Image, EncodedResult]:
+        task = asyncio.ensure_future(
+            inpainter.inpaint(image, dilated_mask, prompt, neg_prompt)
+        )
+        try:
+            # Cancelling the task also cancels the remote prediction
+            while cancel_event is not None and not task.done():
+                await asyncio.wait({task}, timeout=0.2)
+                if cancel_event.is_set():
+                    task.cancel()
+            try:
+                return await task
+            except asyncio.CancelledError:
+                raise ProcessingCancelled("Cancelled") from None
+        finally:
+            await inpainter.aclose()
+
+    result = asyncio.run(run())
+
+    # 5. Save output
+    if cancel_event is not None and cancel_event.is_set():
+        if isinstance(result, EncodedResult):
+            result.discard()
+        raise ProcessingCancelled("Cancelled")
+    if not output_path:
+        suffix = "_preview" if backend == "preview" else "_bg"
+        output_path = output_name(
+            input_path, wedding_bg_cache.file_digest(input_path), suffix, output.extension
+        )
+    output_file = save_output(result, output_path, output)
+
+    print()
+    print("=" * 60)
+    print("[DONE] Background replacement complete!")
+    if mask_cache:
+        print(f"  {mask_cache.summary()}")
+    if raw_cache:
+        print(f"  {raw_cache.summary()}")
+    if inpainter.summary():
+        print(f"  {inpainter.summary()}")
+    print("=" * 60)
+
+    return output_file
+
+
+# =============================================================================
+# PROMPT VARIANTS
+# =============================================================================
+
+@dataclass
+class VariantResult:
+    """Outcome of one prompt in a variant run."""
+
+    prompt: str
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def load_prompts(path: str) -> List[str]:
+    """Read one prompt per line, skipping blank lines and # comments."""
+    with open(path, encoding="utf-8") as f:
+        lines = (line.strip() for line in f)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+def make_contact_sheet(
+    image_paths: List[str],
+    labels: List[str],
+    thumb_size: int = CONTACT_THUMB_SIZE,
+    padding: int = CONTACT_PADDING,
+) -> Image.Image:
+    """
+    Lay out thumbnails in a grid on a dark background, each with a caption.
+
+    Args:
+        image_paths: Images to include, in order
+        labels: One caption per image (truncated to the thumbnail width)
+        thumb_size: Long side of each thumbnail
+        padding: Space between and around cells
+
+    Returns:
+        RGB contact sheet
+    """
+    thumbs = []
+    for path in image_paths:
+        with Image.open(path) as opened:
+            opened.draft("RGB", (thumb_size, thumb_size))
+            thumb = opened.convert("RGB")
+        thumb.thumbnail((thumb_size, thumb_size), Image.Resampling.LANCZOS)
+        thumbs.append(thumb)
+
+    columns = min(len(thumbs), 3) if len(thumbs) != 4 else 2
+    rows = -(-len(thumbs) // columns)
+    cell_w = max(t.width for t in thumbs)
+    caption_h = 28
+    cell_h = max(t.height for t in thumbs) + caption_h
+
+    sheet = Image.new(
+        "RGB",
+        (columns * cell_w + (columns + 1) * padding, rows * cell_h + (rows + 1) * padding),
+        (17, 17, 17),
+    )
+    draw = ImageDraw.Draw(sheet)
+    max_chars = max(8, cell_w // 7)
+    for index, (thumb, label) in enumerate(zip(thumbs, labels)):
+        x = padding + (index % columns) * (cell_w + padding)
+        y = padding + (index // columns) * (cell_h + padding)
+        sheet.paste(thumb, (x + (cell_w - thumb.width) // 2, y))
+        text = label if len(label) <= max_chars else label[: max_chars - 3] + "..."
+        draw.text((x, y + cell_h - caption_h + 8), text, fill=(230, 230, 230))
+    return sheet
+
+
+def process_prompt_variants(
+    input_path: str,
+    prompts: List[str],
+    output_dir: Optional[str] = None,
+    negative_prompt: Optional[str] = None,
+    dilation_pixels: int = 7,
     api_token: Optional[str] = None,
-) -> Image.Image:
+    save_mask: bool = False,
+    api_workers: int = 4,
+    mask_model: str = DEFAULT_MASK_MODEL,
+    feather_pixels: int = 0,
+    use_mask_cache: bool = True,
+    cache_dir: Optional[str] = None,
+    use_result_cache: bool = True,
+    refresh_cache: bool = False,
+    upload_size: int = 0,
+    mask_size: int = 0,
+    backend: str = "replicate",
+    use_raw_cache: bool = False,
+    max_api_workers: int = DEFAULT_MAX_API_WORKERS,
+    api_rate: float = DEFAULT_API_RATE,
+    output: Optional[OutputOptions] = None,
+) -> Tuple[List[VariantResult], Optional[str]]:
     """
-    Call Replicate API with Flux inpainting model.
+    Generate one background per prompt for a single photo, plus a contact sheet.
+
+    The mask is computed once and the photo and mask are uploaded once;
+    the variants then run concurrently (see call_flux_variants_async).
+    Outputs are <stem>_v01.png, <stem>_v02.png, ... (in the format of
+    `output`) in prompt order, a
+    <stem>_variants.jpg contact sheet and a <stem>_variants.json index
+    mapping files to prompts.
 
     Args:
-        original_image: Original wedding photo
-        mask: Dilated mask (white = inpaint area)
-        prompt: Positive prompt for generation
-        negative_prompt: Negative prompt to avoid
-        api_token: Replicate API token (optional, uses env if not provided)
+        input_path: Path to input image
+        prompts: Positive prompts, one per variant
+        output_dir: Directory for results (default: current directory)
+        api_workers: Variants generated at once to start with; adapts up to
+            max_api_workers (see create_backend)
+        api_rate: Prediction creations per second
+        Other arguments are as for process_wedding_photo
 
     Returns:
-        Generated image with new background
+        (one VariantResult per prompt, contact sheet path or None)
     """
-    print("[Step 3/4] Calling Flux inpainting API...")
+    print("=" * 60)
+    print("Wedding Photo Background Generator - Prompt Variants")
+    print("=" * 60)
+    print(f"Input: {input_path}")
+    print(f"Prompts: {len(prompts)}")
+    print(f"Backend: {backend}")
+    print()
+
+    neg_prompt = negative_prompt or DEFAULT_NEGATIVE_PROMPT
+    output = output or OutputOptions()
+    out_dir = Path(output_dir) if output_dir else Path(".")
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stem = Path(input_path).stem
 
-    # Check API token
-    token = api_token or os.environ.get("REPLICATE_API_TOKEN")
-    if not token:
-        raise ValueError(
-            "REPLICATE_API_TOKEN not found. "
-            "Set it via environment variable or --api-token flag."
+    input_token = metrics.current_input.set(input_path)
+    try:
+        # 1-2. Load, mask and dilate once for every variant
+        load_size = backend_load_size(backend)
+        raw_cache = wedding_bg_cache.RawImageCache(cache_dir) if use_raw_cache else None
+        image = load_image(input_path, load_size, raw_cache)
+        print(f"  Image size: {image.size}")
+        mask_cache = wedding_bg_cache.MaskCache(cache_dir) if use_mask_cache else None
+        mask = get_subject_mask(input_path, mask_model, mask_cache, image, mask_size, load_size)
+        dilated_mask = dilate_mask(mask, dilation_pixels, feather_pixels)
+        if save_mask:
+            mask_path = out_dir / f"{stem}_mask.png"
+            dilated_mask.save(mask_path)
+            print(f"  Mask saved to: {mask_path}")
+
+        # 3. All variants from one upload
+        inpainter = create_backend(
+            backend, api_token, cache_dir, use_result_cache, refresh_cache, upload_size,
+            api_workers=api_workers, max_api_workers=max_api_workers, api_rate=api_rate,
         )
 
-    # Set the token (replicate library uses this)
-    os.environ["REPLICATE_API_TOKEN"] = token
+        async def run() -> list:
+            try:
+                return await inpainter.inpaint_variants(image, dilated_mask, prompts, neg_prompt)
+            finally:
+                await inpainter.aclose()
+
+        outcomes = asyncio.run(run())
+
+        # 4. Save variants, then the contact sheet and index
+        width = max(2, len(str(len(prompts))))
+        results = []
+        for number, (prompt, outcome) in enumerate(zip(prompts, outcomes), start=1):
+            result = VariantResult(prompt=prompt)
+            if isinstance(outcome, BaseException):
+                result.error = str(outcome) or type(outcome).__name__
+                print(f"  [FAIL] variant {number}: {result.error}")
+            else:
+                variant_path = out_dir / f"{stem}_v{number:0{width}d}{output.extension}"
+                result.output_path = save_output(outcome, str(variant_path), output)
+            results.append(result)
+    finally:
+        metrics.current_input.reset(input_token)
+
+    done = [(n, r) for n, r in enumerate(results, start=1) if r.ok]
+    sheet_path = None
+    if done:
+        sheet = make_contact_sheet(
+            [r.output_path for _, r in done],
+            [f"{n}. {r.prompt}" for n, r in done],
+        )
+        sheet_path = str(out_dir / f"{stem}_variants.jpg")
+        wedding_bg_cache.atomic_write_image(sheet, Path(sheet_path), "JPEG", quality=90)
+
+    index = [
+        {"variant": n, "prompt": r.prompt, "output": r.output_path, "error": r.error}
+        for n, r in enumerate(results, start=1)
+    ]
+    wedding_bg_cache.atomic_write_bytes(
+        json.dumps({"input": input_path, "contact_sheet": sheet_path, "variants": index},
+                   indent=2, ensure_ascii=False).encode("utf-8"),
+        out_dir / f"{stem}_variants.json",
+    )
 
-    # Convert images to data URIs
-    # Ensure both images are the same size
-    if original_image.size != mask.size:
-        mask = mask.resize(original_image.size, Image.Resampling.NEAREST)
+    print()
+    print("=" * 60)
+    print(f"[DONE] {len(done)}/{len(results)} variant(s) generated")
+    if sheet_path:
+        print(f"  Contact sheet: {sheet_path}")
+    if mask_cache:
+        print(f"  {mask_cache.summary()}")
+    if raw_cache:
+        print(f"  {raw_cache.summary()}")
+    if inpainter.summary():
+        print(f"  {inpainter.summary()}")
+    print("=" * 60)
 
-    # Convert original to RGB if RGBA
-    if original_image.mode == "RGBA":
-        original_image = original_image.convert("RGB")
+    return results, sheet_path
 
-    image_uri = image_to_data_uri(original_image, "JPEG")
-    mask_uri = image_to_data_uri(mask, "PNG")
 
-    # Call Flux Fill Dev model
-    # Model: black-forest-labs/flux-fill-dev
-    print("  Sending request to Replicate (this may take 30-60 seconds)...")
+# =============================================================================
+# BATCH PIPELINE
+# =============================================================================
 
-    output = replicate.run(
-        "black-forest-labs/flux-fill-dev",
-        input={
-            "image": image_uri,
-            "mask": mask_uri,
-            "prompt": prompt,
-            "guidance": 30,  # Higher guidance for more prompt adherence
-            "steps": 50,  # More steps for quality
-            "output_format": "png",
-            "output_quality": 100,
-        }
-    )
-
-    # The output is typically a URL or file object
-    if isinstance(output, str):
-        # It's a URL, download it
-        import urllib.request
-        print(f"  Downloading result from: {output[:50]}...")
-        with urllib.request.urlopen(output) as response:
-            result_data = response.read()
-        result_image = Image.open(io.BytesIO(result_data))
-    elif hasattr(output, "read"):
-        # It's a file-like object
-        result_image = Image.open(output)
-    elif isinstance(output, list) and len(output) > 0:
-        # It's a list of URLs
-        url = output[0]
-        import urllib.request
-        print(f"  Downloading result from: {url[:50]}...")
-        with urllib.request.urlopen(url) as response:
-            result_data = response.read()
-        result_image = Image.open(io.BytesIO(result_data))
-    else:
-        raise ValueError(f"Unexpected API output type: {type(output)}")
-
-    return result_image
-
-
-def save_output(image: Image.Image, output_path: Optional[str] = None) -> str:
-    """
-    Save the result image.
+@dataclass
+class BatchResult:
+    """Outcome of one photo in a batch run."""
 
-    Args:
-        image: Result image to save
-        output_path: Optional custom output path
+    input_path: str
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    duplicate_of: Optional[str] = None
+    resumed: bool = False
 
-    Returns:
-        Path where the image was saved
-    """
-    print("[Step 4/4] Saving output...")
+    @property
+    def ok(self) -> bool:
+        return self.error is None
 
-    if output_path:
-        path = Path(output_path)
-    else:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        path = Path(f"output_{timestamp}.png")
 
-    # Ensure the image is in RGB mode for saving
-    if image.mode == "RGBA":
-        # Create white background and paste
-        background = Image.new("RGB", image.size, (255, 255, 255))
-        background.paste(image, mask=image.split()[3])
-        image = background
-    elif image.mode != "RGB":
-        image = image.convert("RGB")
+def collect_inputs(patterns: List[str]) -> List[str]:
+    """
+    Expand files, directories and glob patterns into a list of image paths.
 
-    image.save(path, "PNG", quality=100)
-    print(f"  Saved to: {path.absolute()}")
+    Directories contribute every file with an extension in IMAGE_EXTENSIONS
+    (non-recursive). Duplicates are dropped while keeping the first order seen.
 
-    return str(path.absolute())
+    Args:
+        patterns: File paths, directory paths or glob patterns
 
+    Returns:
+        Sorted-per-pattern list of image paths
+    """
+    found: List[str] = []
+    seen = set()
+
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            candidates = sorted(
+                p for p in path.iterdir()
+                if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS
+            )
+        elif glob.has_magic(pattern):
+            candidates = sorted(
+                Path(p) for p in glob.glob(pattern)
+                if Path(p).suffix.lower() in IMAGE_EXTENSIONS
+            )
+        else:
+            candidates = [path]
+
+        for candidate in candidates:
+            key = str(candidate.resolve())
+            if key not in seen:
+                seen.add(key)
+                found.append(str(candidate))
+
+    return found
+
+
+def _mask_stage(
+    input_paths: List[str],
+    dilation_pixels: int,
+    mask_model: str,
+    feather_pixels: int,
+    use_mask_cache: bool,
+    cache_dir: Optional[str],
+    mask_size: int,
+    collect_metrics: bool,
+    load_size: int = 0,
+    use_raw_cache: bool = False,
+) -> Tuple[Dict[str, Image.Image], Dict[str, str], Optional[int], List[dict], float]:
+    """
+    Mask and dilate a chunk of photos (runs inside a worker process).
 
-# =============================================================================
-# MAIN PIPELINE
-# =============================================================================
+    The photos are segmented in one batched inference. Returns the dilated
+    masks and the errors by path, the number of mask cache hits (None when
+    caching is off), the stage metrics recorded in this process, which the
+    parent re-emits to its own listeners, and the seconds spent.
+    """
+    start = time.perf_counter()
+    metrics.current_input.set(input_paths[0] if len(input_paths) == 1 else None)
+    with metrics.capture() if collect_metrics else contextlib.nullcontext() as collector:
+        mask_cache = wedding_bg_cache.MaskCache(cache_dir) if use_mask_cache else None
+        raw_cache = wedding_bg_cache.RawImageCache(cache_dir) if use_raw_cache else None
+        masks, load_errors = get_subject_masks(
+            input_paths, mask_model, mask_cache, mask_size, load_size, raw_cache,
+            batch_size=len(input_paths),
+        )
+        dilated: Dict[str, Image.Image] = {}
+        errors = {path: str(e) for path, e in load_errors.items()}
+        for path, mask in masks.items():
+            metrics.current_input.set(path)
+            dilated[path] = dilate_mask(mask, dilation_pixels, feather_pixels)
+        cache_hits = mask_cache.hits if mask_cache else None
+    records = collector.records if collector else []
+    return dilated, errors, cache_hits, records, time.perf_counter() - start
 
-def process_wedding_photo(
+
+async def _inpaint_stage(
     input_path: str,
-    output_path: Optional[str] = None,
+    dilated_mask: Image.Image,
+    output_path: str,
+    prompt: str,
+    negative_prompt: str,
+    inpainter: InpaintingBackend,
+    load_size: int = 0,
+    raw_cache: Optional[RawImageCache] = None,
+    output: Optional[OutputOptions] = None,
+) -> Tuple[str, float]:
+    """
+    Inpaint one photo and save the result (runs on the batch event loop).
+
+    Returns the output path and the seconds spent.
+    """
+    start = time.perf_counter()
+    # Each submitted coroutine runs in its own task context
+    metrics.current_input.set(input_path)
+
+    # The image is re-decoded here rather than shipped back from the mask
+    # worker, which keeps the inter-process payload down to the mask only.
+    # With the raw cache, the mask worker already stored the decoded pixels.
+    image = await asyncio.to_thread(load_image, input_path, load_size, raw_cache)
+    result = await inpainter.inpaint(image, dilated_mask, prompt, negative_prompt)
+    saved = await asyncio.to_thread(save_output, result, output_path, output)
+    return saved, time.perf_counter() - start
+
+
+def process_batch(
+    input_paths: List[str],
+    output_dir: Optional[str] = None,
     positive_prompt: Optional[str] = None,
     negative_prompt: Optional[str] = None,
     dilation_pixels: int = 7,
     api_token: Optional[str] = None,
     save_mask: bool = False,
-) -> str:
+    workers: Optional[int] = None,
+    api_workers: int = 4,
+    mask_model: str = DEFAULT_MASK_MODEL,
+    feather_pixels: int = 0,
+    use_mask_cache: bool = True,
+    cache_dir: Optional[str] = None,
+    use_result_cache: bool = True,
+    refresh_cache: bool = False,
+    upload_size: int = 0,
+    mask_size: int = 0,
+    backend: str = "replicate",
+    dedupe: bool = False,
+    dedupe_threshold: Optional[int] = None,
+    use_raw_cache: bool = False,
+    ledger_path: Optional[str] = None,
+    resume: bool = True,
+    max_api_workers: int = DEFAULT_MAX_API_WORKERS,
+    api_rate: float = DEFAULT_API_RATE,
+    mask_batch: int = DEFAULT_MASK_BATCH,
+    intra_op_threads: int = 0,
+    inter_op_threads: int = 0,
+    output: Optional[OutputOptions] = None,
+) -> List[BatchResult]:
     """
-    Main pipeline to process a wedding photo.
+    Process many photos with masking and inpainting pipelined.
+
+    Masking (rembg + dilation) is CPU-bound and runs in a process pool, in
+    chunks of mask_batch photos segmented by one batched inference each;
+    inpainting requests are I/O-bound and run as coroutines on one event
+    loop sharing one backend (and its pooled HTTP client). A photo is
+    handed to the API stage as soon as its mask is ready, so the two stages
+    overlap and overall throughput is bounded by the slower one.
+
+    Every photo is a job in a ledger (see wedding_bg_ledger), updated as it
+    moves through the stages. Running the same batch again skips photos
+    whose output from an earlier run is still there, so an interrupted
+    album picks up where it stopped. Outputs are named with output_name().
 
     Args:
-        input_path: Path to input image
-        output_path: Optional output path
+        input_paths: Image paths (see collect_inputs for expanding dirs/globs)
+        output_dir: Directory for results (default: current directory)
         positive_prompt: Custom positive prompt
         negative_prompt: Custom negative prompt
         dilation_pixels: Mask dilation amount
         api_token: Replicate API token
-        save_mask: Whether to save the mask for debugging
+        save_mask: Whether to save each mask next to its output
+        workers: Number of masking processes (default: CPU count)
+        api_workers: Concurrent inpainting requests to start with
+        mask_model: rembg model used for masking (see MASK_MODELS)
+        feather_pixels: Soft edge width applied after dilation (0 = hard edge)
+        use_mask_cache: Reuse masks computed earlier for the same photo/model
+        cache_dir: Cache root (default: wedding_bg_cache.DEFAULT_CACHE_DIR)
+        use_result_cache: Reuse API results for identical requests
+        refresh_cache: Call the API even on a cache hit (result is re-stored)
+        upload_size: Upload at this long-side size and recomposite the
+            full-resolution subject (0 = upload full resolution)
+        mask_size: Segment at this long-side size and refine edges at full
+            resolution (0 = segment at full resolution)
+        backend: Inpainting backend, "replicate" or "preview"; preview
+            outputs end in _preview.png instead of _bg.png
+        dedupe: Process one representative per cluster of identical or
+            near-duplicate photos (see wedding_bg_dedupe); the others get
+            a BatchResult with duplicate_of set and no output
+        dedupe_threshold: Near-duplicate distance in bits (default:
+            wedding_bg_dedupe.DEFAULT_THRESHOLD)
+        use_raw_cache: Keep decoded photos in the raw image cache; the
+            inpainting stage then memory-maps what the mask stage decoded
+        ledger_path: Job ledger file (default: wedding_bg_jobs.sqlite in
+            the output directory)
+        resume: Skip photos the ledger records as done; False processes
+            every photo again
+        max_api_workers: Ceiling for the adaptive request concurrency
+        api_rate: Prediction creations per second (0 = unlimited)
+        mask_batch: Photos per masking job and ONNX inference (see
+            generate_masks_batch); larger batches keep the runtime's
+            threads busy, smaller ones hand photos to the API sooner
+        intra_op_threads: ONNX intra-op threads per masking process
+            (0 = onnxruntime default, see set_session_threads)
+        inter_op_threads: ONNX inter-op threads per masking process
+        output: Output format, encoder settings and extra exports (see
+            OutputOptions; default: PNG only)
 
     Returns:
-        Path to the output image
+        One BatchResult per input, in input order
     """
     print("=" * 60)
-    print("Wedding Photo Background Generator")
+    print("Wedding Photo Background Generator - Batch")
     print("=" * 60)
-    print(f"Input: {input_path}")
+    print(f"Inputs: {len(input_paths)} photo(s)")
     print(f"Dilation: {dilation_pixels}px")
+    print(f"Mask model: {mask_model}")
+    print(f"Workers: {workers or os.cpu_count()} mask / {api_workers} API "
+          f"(adaptive up to {max(api_workers, max_api_workers)})")
+    print(f"Mask batch: {mask_batch} photo(s), ONNX threads: "
+          f"{intra_op_threads or 'default'} intra-op / {inter_op_threads or 'default'} inter-op")
+    print(f"Backend: {backend}")
     print()
 
-    # Use defaults if not provided
     prompt = positive_prompt or DEFAULT_POSITIVE_PROMPT
     neg_prompt = negative_prompt or DEFAULT_NEGATIVE_PROMPT
+    output = output or OutputOptions()
+
+    out_dir = Path(output_dir) if output_dir else Path(".")
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    results = {path: BatchResult(input_path=path) for path in input_paths}
+
+    output_suffix = "_preview" if backend == "preview" else "_bg"
+    ledger = wedding_bg_ledger.JobLedger(ledger_path or out_dir, {
+        "prompt": prompt,
+        "negative_prompt": neg_prompt,
+        "dilation": dilation_pixels,
+        "feather": feather_pixels,
+        "mask_model": mask_model,
+        "mask_size": mask_size,
+        "upload_size": upload_size,
+        "backend": backend,
+        "model": FLUX_MODEL,
+        "guidance": FLUX_GUIDANCE,
+        "steps": FLUX_STEPS,
+        # Only when not the defaults, so earlier ledgers keep their jobs;
+        # a re-run for new formats is served from the result cache
+        **({"format": output.format} if output.format != DEFAULT_OUTPUT_FORMAT else {}),
+        **({"exports": [f"{name}:{size}" for name, size in output.exports]}
+           if output.exports else {}),
+    })
+    readable = []
+    digests: Dict[str, str] = {}
+    for path in input_paths:
+        try:
+            digests[path] = wedding_bg_cache.file_digest(path)
+            readable.append(path)
+        except OSError as e:
+            results[path].error = f"read: {e}"
+            print(f"  [FAIL] {path}: {results[path].error}")
+    done = ledger.plan(digests, resume)
+
+    for path, job in done.items():
+        results[path].output_path = job.output_path
+        results[path].resumed = True
+
+    # Dedupe over every readable photo, not only the unfinished ones: a
+    # representative done in an earlier run still stands for its
+    # duplicates, which would otherwise be processed on every resume
+    candidates = readable
+    if dedupe:
+        import wedding_bg_dedupe
+
+        print("Finding duplicate photos...")
+        candidates, duplicates = wedding_bg_dedupe.select_representatives(
+            readable,
+            threshold=dedupe_threshold if dedupe_threshold is not None
+            else wedding_bg_dedupe.DEFAULT_THRESHOLD,
+            cache_dir=cache_dir,
+            workers=workers,
+        )
+        for path, representative in duplicates.items():
+            if path in done:
+                # Has its own output from a run without deduplication
+                continue
+            results[path].duplicate_of = representative
+            ledger.skip(path, representative)
+            print(f"  [SKIP] {path} (duplicate of {representative})")
+        print(f"  {len(candidates)} of {len(readable)} photo(s) are distinct")
+        print()
+
+    to_process = [path for path in candidates if path not in done]
+    if done:
+        print(f"Resuming: {len(done)} photo(s) already done, {len(to_process)} to process")
+        print()
+
+    mask_hits = mask_misses = 0
+    mask_seconds: Dict[str, float] = {}
+    load_size = backend_load_size(backend)
+    raw_cache = wedding_bg_cache.RawImageCache(cache_dir) if use_raw_cache else None
+    from wedding_bg_client import PRIORITY_BULK, LoopThread
+
+    # One backend (and connection pool) shared by every inpainting request;
+    # the Replicate client's scheduler adapts in-flight predictions between
+    # 1 and max_api_workers, behind interactive runs sharing the client
+    inpainter = create_backend(
+        backend, api_token, cache_dir, use_result_cache, refresh_cache, upload_size,
+        api_workers=api_workers, max_api_workers=max_api_workers, api_rate=api_rate,
+        priority=PRIORITY_BULK,
+    )
 
-    # 1. Load image
-    image = load_image(input_path)
-    print(f"  Image size: {image.size}")
+    batch_start = time.perf_counter()
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Each worker process runs batched inference with its own ONNX thread pools
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=set_session_threads,
+        initargs=(intra_op_threads, inter_op_threads),
+    ) as mask_pool, LoopThread() as api_loop:
+        try:
+            mask_futures = {}
+            for start in range(0, len(to_process), mask_batch):
+                chunk = to_process[start:start + mask_batch]
+                for path in chunk:
+                    ledger.start(path)
+                mask_futures[mask_pool.submit(
+                    _mask_stage, chunk, dilation_pixels, mask_model, feather_pixels,
+                    use_mask_cache, cache_dir, mask_size, metrics.enabled(),
+                    load_size, use_raw_cache,
+                )] = chunk
+            api_futures = {}
+
+            for future in as_completed(mask_futures):
+                chunk = mask_futures[future]
+                try:
+                    dilated_masks, errors, cache_hits, records, seconds = future.result()
+                except Exception as e:
+                    dilated_masks, cache_hits, records, seconds = {}, None, [], 0.0
+                    errors = {path: str(e) for path in chunk}
+
+                for record in records:
+                    metrics.emit(record)
+
+                if cache_hits is not None:
+                    mask_hits += cache_hits
+                    mask_misses += len(dilated_masks) - cache_hits
+
+                for path in chunk:
+                    # A photo's mask time is its share of the batched inference
+                    mask_seconds[path] = seconds / len(chunk)
+                    if path in errors:
+                        results[path].error = f"mask: {errors[path]}"
+                        ledger.fail(path, results[path].error)
+                        print(f"  [FAIL] {path}: {results[path].error}")
+                        continue
+                    dilated_mask = dilated_masks[path]
+
+                    if save_mask:
+                        mask_path = out_dir / output_name(path, digests[path], "_mask")
+                        dilated_mask.save(mask_path)
+                        print(f"  Mask saved to: {mask_path}")
+
+                    output_path = str(out_dir / output_name(
+                        path, digests[path], output_suffix, output.extension
+                    ))
+                    api_future = api_loop.submit(_inpaint_stage(
+                        path, dilated_mask, output_path, prompt, neg_prompt, inpainter,
+                        load_size, raw_cache, output,
+                    ))
+                    api_futures[api_future] = path
+
+            for future in as_completed(api_futures):
+                path = api_futures[future]
+                try:
+                    results[path].output_path, inpaint_seconds = future.result()
+                    ledger.finish(path, results[path].output_path, mask_seconds[path], inpaint_seconds)
+                    print(f"  [OK] {path}")
+                except Exception as e:
+                    results[path].error = f"inpaint: {e}"
+                    ledger.fail(path, results[path].error, mask_seconds[path])
+                    print(f"  [FAIL] {path}: {results[path].error}")
+        finally:
+            # Close the pooled connections even when a stage raised
+            api_loop.submit(inpainter.aclose()).result()
+
+    ordered = [results[path] for path in input_paths]
+    succeeded = sum(1 for r in ordered if r.ok and not r.duplicate_of and not r.resumed)
+
+    if metrics.enabled():
+        metrics.emit({
+            "event": "batch",
+            "time": time.time(),
+            "wall_s": round(time.perf_counter() - batch_start, 6),
+            "inputs": len(ordered),
+            "succeeded": succeeded,
+            "peak_rss_mb": round((metrics.peak_rss_bytes() or 0) / 2**20, 1),
+        })
 
-    # 2. Generate mask
-    mask = generate_mask(image)
+    print()
+    print("=" * 60)
+    print(f"[DONE] {succeeded}/{len(to_process)} photo(s) processed")
+    duplicates_skipped = sum(1 for r in ordered if r.duplicate_of)
+    if done:
+        print(f"  {len(done)} already done in an earlier run")
+    if duplicates_skipped:
+        print(f"  {duplicates_skipped} duplicate(s) skipped")
+    print(f"  {ledger.summary()}")
+    if use_mask_cache:
+        print(f"  mask cache: {mask_hits} hit(s), {mask_misses} miss(es)")
+    if raw_cache:
+        print(f"  {raw_cache.summary()}")
+    if inpainter.summary():
+        print(f"  {inpainter.summary()}")
+    print("=" * 60)
 
-    # 3. Dilate mask
-    dilated_mask = dilate_mask(mask, dilation_pixels)
+    return ordered
 
-    # Optional: save mask for debugging
-    if save_mask:
-        mask_path = Path(input_path).stem + "_mask.png"
-        dilated_mask.save(mask_path)
-        print(f"  Mask saved to: {mask_path}")
 
-    # 4. Call Flux inpainting
-    result = call_flux_inpainting(
-        original_image=image,
-        mask=dilated_mask,
-        prompt=prompt,
-        negative_prompt=neg_prompt,
-        api_token=api_token,
-    )
+# =============================================================================
+# MASK MODEL PROFILING
+# =============================================================================
 
-    # 5. Save output
-    output_file = save_output(result, output_path)
+def _profile_one_model(model_name: str, image_path: str, repeats: int, mask_size: int) -> dict:
+    """Measure load time, mask latency and peak RSS for one model (fresh process)."""
+    import statistics
+
+    image = load_image(image_path)
+    baseline_rss = metrics.peak_rss_bytes()
+
+    start = time.perf_counter()
+    get_session(model_name)
+    load_seconds = time.perf_counter() - start
+
+    # Time generate_mask, i.e. the preprocessing and inference the pipeline runs
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_mask(image, model_name, mask_size)
+        latencies.append(time.perf_counter() - start)
+
+    peak_rss = metrics.peak_rss_bytes()
+    return {
+        "model": model_name,
+        "load_s": load_seconds,
+        "median_s": statistics.median(latencies),
+        "min_s": min(latencies),
+        "peak_rss_mb": peak_rss / 2**20 if peak_rss else None,
+        "model_rss_mb": (peak_rss - baseline_rss) / 2**20 if peak_rss and baseline_rss else None,
+    }
+
+
+def profile_mask_models(
+    image_path: str,
+    models: Optional[List[str]] = None,
+    repeats: int = 3,
+    mask_size: int = 0,
+) -> List[dict]:
+    """
+    Report per-model mask latency and memory on one photo.
 
-    print()
-    print("=" * 60)
-    print("[DONE] Background replacement complete!")
-    print("=" * 60)
+    Each model is profiled in its own short-lived process so that peak RSS
+    reflects that model alone rather than everything loaded before it.
 
-    return output_file
+    Args:
+        image_path: Photo to mask
+        models: Models to compare (default: all MASK_MODELS)
+        repeats: Timed inferences per model (after the load)
+        mask_size: Low-resolution segmentation size (see generate_mask)
+
+    Returns:
+        One dict per model with load_s, median_s, min_s, peak_rss_mb, model_rss_mb
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    rows = []
+    for model_name in models or MASK_MODELS:
+        print(f"  Profiling {model_name}...")
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            try:
+                rows.append(pool.submit(
+                    _profile_one_model, model_name, image_path, repeats, mask_size
+                ).result())
+            except Exception as e:
+                print(f"    [WARN] {model_name} failed: {e}")
+
+    def fmt_mb(value: Optional[float]) -> str:
+        return f"{value:8.0f}" if value is not None else "     n/a"
+
+    print()
+    print(f"{'model':<20} {'load s':>8} {'median s':>9} {'min s':>8} {'peak MB':>8} {'model MB':>8}")
+    for row in sorted(rows, key=lambda r: r["median_s"]):
+        print(
+            f"{row['model']:<20} {row['load_s']:8.2f} {row['median_s']:9.3f} "
+            f"{row['min_s']:8.3f} {fmt_mb(row['peak_rss_mb'])} {fmt_mb(row['model_rss_mb'])}"
+        )
+    return rows
 
 
 # =============================================================================
@@ -374,30 +2664,113 @@ Examples:
   python wedding_bg_gen.py photo.jpg --output result.png
   python wedding_bg_gen.py photo.jpg --prompt "dark marble background with gold accents"
   python wedding_bg_gen.py photo.jpg --dilation 10 --save-mask
+  python wedding_bg_gen.py photo.jpg --preview
+  python wedding_bg_gen.py photo.jpg -p "black velvet" -p "dark marble" --output-dir variants
+  python wedding_bg_gen.py photo.jpg --prompt-file prompts.txt --output-dir variants
+  python wedding_bg_gen.py pic/ --output-dir results --workers 4 --api-workers 8
+  python wedding_bg_gen.py pic/ --output-dir results --workers 2 --mask-batch 8 --intra-op-threads 16
+  python wedding_bg_gen.py "album/*.jpg" another.jpg --output-dir results
+  python wedding_bg_gen.py photo.jpg --export webp:2048 --export jpeg:1024 --png-compress-level 1
 
 Environment:
-  REPLICATE_API_TOKEN: Your Replicate API token (required)
+  REPLICATE_API_TOKEN: Your Replicate API token (required unless --preview)
         """,
     )
 
     parser.add_argument(
         "input",
         type=str,
-        help="Path to the input wedding photo",
+        nargs="+",
+        help="Input wedding photo(s), directories or glob patterns",
     )
 
     parser.add_argument(
         "-o", "--output",
         type=str,
         default=None,
-        help="Output file path (default: output_TIMESTAMP.png)",
+        help="Output file path (default: <stem>_<digest8>_bg<ext> in the current "
+             "directory, single photo only)",
+    )
+
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default=None,
+        help="Output directory for batch and variant runs (default: current directory)",
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=None,
+        help="Masking processes for batch runs (default: CPU count)",
+    )
+
+    parser.add_argument(
+        "--mask-batch",
+        type=int,
+        default=DEFAULT_MASK_BATCH,
+        metavar="N",
+        help="Photos per batched mask inference in batch runs; use with fewer "
+             f"--workers and more --intra-op-threads (default: {DEFAULT_MASK_BATCH})",
+    )
+
+    parser.add_argument(
+        "--intra-op-threads",
+        type=int,
+        default=0,
+        metavar="N",
+        help="ONNX Runtime threads per operator, per masking process "
+             "(default: 0 = onnxruntime default)",
+    )
+
+    parser.add_argument(
+        "--inter-op-threads",
+        type=int,
+        default=0,
+        metavar="N",
+        help="ONNX Runtime threads across graph branches, per masking process "
+             "(default: 0 = sequential)",
+    )
+
+    parser.add_argument(
+        "--api-workers",
+        type=int,
+        default=4,
+        help="Concurrent inpainting requests to start with; adapts to latency and "
+             "throttling (default: 4)",
+    )
+
+    parser.add_argument(
+        "--max-api-workers",
+        type=int,
+        default=DEFAULT_MAX_API_WORKERS,
+        help=f"Ceiling for adaptive request concurrency (default: {DEFAULT_MAX_API_WORKERS}; "
+             "equal to --api-workers for a fixed limit)",
+    )
+
+    parser.add_argument(
+        "--api-rate",
+        type=float,
+        default=DEFAULT_API_RATE,
+        metavar="PER_SECOND",
+        help=f"Prediction creations per second, 0 = unlimited (default: {DEFAULT_API_RATE:g})",
     )
 
     parser.add_argument(
         "-p", "--prompt",
         type=str,
+        action="append",
+        default=None,
+        help=f"Custom positive prompt (default: luxurious dark velvet background); "
+             "repeat for one variant per prompt plus a contact sheet",
+    )
+
+    parser.add_argument(
+        "--prompt-file",
+        type=str,
         default=None,
-        help=f"Custom positive prompt (default: luxurious dark velvet background)",
+        help="Read variant prompts from a file, one per line (# comments allowed)",
     )
 
     parser.add_argument(
@@ -414,6 +2787,118 @@ Environment:
         help="Mask dilation in pixels (default: 7, range: 3-15)",
     )
 
+    parser.add_argument(
+        "--feather",
+        type=int,
+        default=0,
+        help="Soft mask edge width in pixels after dilation (default: 0 = hard edge)",
+    )
+
+    parser.add_argument(
+        "--upload-size",
+        type=int,
+        default=0,
+        help="Upload at this long-side size (e.g. 1024) and composite the "
+             "full-resolution subject back (default: 0 = full resolution)",
+    )
+
+    parser.add_argument(
+        "--preview",
+        action="store_true",
+        help=f"Local CPU preview instead of the API: blurred fill at {PREVIEW_SIZE}px, "
+             "for checking mask and framing in about a second",
+    )
+
+    parser.add_argument(
+        "-m", "--mask-model",
+        type=str,
+        choices=MASK_MODELS,
+        default=DEFAULT_MASK_MODEL,
+        help=f"rembg model for subject masking (default: {DEFAULT_MASK_MODEL})",
+    )
+
+    parser.add_argument(
+        "--mask-size",
+        type=int,
+        default=0,
+        help="Segment at this long-side size (e.g. 1024) and refine edges at "
+             "full resolution (default: 0 = segment at full resolution)",
+    )
+
+    parser.add_argument(
+        "--no-mask-cache",
+        action="store_true",
+        help="Always run rembg instead of reusing cached masks",
+    )
+
+    parser.add_argument(
+        "--raw-cache",
+        action="store_true",
+        help="Keep decoded photos as raw arrays in the cache and memory-map them "
+             "on later runs (~36 MB per 12 MP photo)",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Neither read nor store inpainting results in the result cache",
+    )
+
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Call the API even if an identical request is cached (stores the new result)",
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="Cache directory (default: ~/.cache/wedding_bg or WEDDING_BG_CACHE_DIR)",
+    )
+
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Append per-stage timing/resource records as JSON lines to PATH ('-' for stdout)",
+    )
+
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="Batch runs: process one photo per cluster of identical or near-duplicate photos",
+    )
+
+    parser.add_argument(
+        "--dedupe-threshold",
+        type=int,
+        default=None,
+        metavar="BITS",
+        help="Near-duplicate distance for --dedupe, 0-32 (default: 8)",
+    )
+
+    parser.add_argument(
+        "--ledger",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help="Batch runs: job ledger file (default: wedding_bg_jobs.sqlite in the output directory)",
+    )
+
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Batch runs: process every photo again, even those the ledger records as done",
+    )
+
+    parser.add_argument(
+        "--profile-models",
+        action="store_true",
+        help="Report mask latency and memory per model on the first input, then exit",
+    )
+
     parser.add_argument(
         "--api-token",
         type=str,
@@ -421,6 +2906,41 @@ Environment:
         help="Replicate API token (default: uses REPLICATE_API_TOKEN env)",
     )
 
+    parser.add_argument(
+        "-f", "--format",
+        choices=list(OUTPUT_FORMATS),
+        default=DEFAULT_OUTPUT_FORMAT,
+        help=f"Format of generated output files; --output keeps its own extension "
+             f"(default: {DEFAULT_OUTPUT_FORMAT})",
+    )
+
+    parser.add_argument(
+        "--export",
+        type=parse_export,
+        action="append",
+        default=[],
+        metavar="FORMAT[:SIZE]",
+        help="Also write the result in this format, optionally at this long-side "
+             "size (e.g. webp, jpeg:2048, avif:1024); repeatable, encoded in parallel",
+    )
+
+    parser.add_argument(
+        "--png-compress-level",
+        type=int,
+        default=PNG_COMPRESS_LEVEL,
+        metavar="0-9",
+        help=f"zlib level of PNG outputs, higher is smaller and slower "
+             f"(default: {PNG_COMPRESS_LEVEL})",
+    )
+
+    parser.add_argument(
+        "--quality",
+        type=int,
+        default=OUTPUT_QUALITY,
+        metavar="1-100",
+        help=f"Quality of JPEG, WebP and AVIF outputs (default: {OUTPUT_QUALITY})",
+    )
+
     parser.add_argument(
         "--save-mask",
         action="store_true",
@@ -446,15 +2966,167 @@ def main() -> int:
         print(f"[ERROR] Dilation must be between 1 and 20, got: {args.dilation}")
         return 1
 
+    if not 0 <= args.feather <= 64:
+        print(f"[ERROR] Feather must be between 0 and 64, got: {args.feather}")
+        return 1
+
+    if args.upload_size and args.upload_size < 256:
+        print(f"[ERROR] Upload size must be 0 or at least 256, got: {args.upload_size}")
+        return 1
+
+    if args.mask_size and args.mask_size < 320:
+        print(f"[ERROR] Mask size must be 0 or at least 320, got: {args.mask_size}")
+        return 1
+
+    if (args.workers is not None and args.workers < 1) or args.api_workers < 1:
+        print("[ERROR] --workers and --api-workers must be at least 1")
+        return 1
+    if args.max_api_workers < 1 or args.api_rate < 0:
+        print("[ERROR] --max-api-workers must be at least 1 and --api-rate not negative")
+        return 1
+    if args.mask_batch < 1 or args.intra_op_threads < 0 or args.inter_op_threads < 0:
+        print("[ERROR] --mask-batch must be at least 1 and ONNX thread counts not negative")
+        return 1
+    set_session_threads(args.intra_op_threads, args.inter_op_threads)
+
+    if not 0 <= args.png_compress_level <= 9 or not 1 <= args.quality <= 100:
+        print("[ERROR] --png-compress-level must be 0-9 and --quality 1-100")
+        return 1
+    if "avif" in [args.format] + [name for name, _ in args.export]:
+        from PIL import features
+        if not features.check("avif"):
+            print("[ERROR] This Pillow build cannot write AVIF (Pillow 11.3+ can)")
+            return 1
+    output = OutputOptions(
+        format=args.format,
+        exports=args.export,
+        png_compress_level=args.png_compress_level,
+        quality=args.quality,
+    )
+
+    if args.dedupe_threshold is not None and not 0 <= args.dedupe_threshold <= 32:
+        print(f"[ERROR] Dedupe threshold must be between 0 and 32, got: {args.dedupe_threshold}")
+        return 1
+
+    inputs = collect_inputs(args.input)
+    if not inputs:
+        print(f"[ERROR] No images found in: {' '.join(args.input)}")
+        return 1
+
+    if args.profile_models:
+        profile_mask_models(inputs[0], mask_size=args.mask_size)
+        return 0
+
+    prompts = list(args.prompt or [])
+    if args.prompt_file:
+        try:
+            prompts += load_prompts(args.prompt_file)
+        except OSError as e:
+            print(f"[ERROR] Cannot read prompt file: {e}")
+            return 1
+        if not prompts:
+            print(f"[ERROR] No prompts found in: {args.prompt_file}")
+            return 1
+
+    is_batch = len(inputs) > 1 or any(
+        Path(p).is_dir() or glob.has_magic(p) for p in args.input
+    )
+    is_variants = len(prompts) > 1
+    if is_batch and args.output:
+        print("[ERROR] --output applies to a single photo; use --output-dir for batches")
+        return 1
+    if is_variants and is_batch:
+        print("[ERROR] Multiple prompts apply to a single photo")
+        return 1
+    if is_variants and args.output:
+        print("[ERROR] --output applies to a single prompt; use --output-dir for variants")
+        return 1
+    prompt = prompts[0] if prompts else None
+
+    sink = metrics.JsonLinesSink(args.metrics) if args.metrics else None
+    if sink:
+        metrics.add_listener(sink)
+
     try:
+        if is_variants:
+            variants, _ = process_prompt_variants(
+                input_path=inputs[0],
+                prompts=prompts,
+                output_dir=args.output_dir,
+                negative_prompt=args.negative_prompt,
+                dilation_pixels=args.dilation,
+                api_token=args.api_token,
+                save_mask=args.save_mask,
+                api_workers=args.api_workers,
+                max_api_workers=args.max_api_workers,
+                api_rate=args.api_rate,
+                mask_model=args.mask_model,
+                feather_pixels=args.feather,
+                use_mask_cache=not args.no_mask_cache,
+                cache_dir=args.cache_dir,
+                use_result_cache=not args.no_cache,
+                refresh_cache=args.refresh,
+                upload_size=args.upload_size,
+                mask_size=args.mask_size,
+                backend="preview" if args.preview else "replicate",
+                use_raw_cache=args.raw_cache,
+                output=output,
+            )
+            return 0 if all(v.ok for v in variants) else 1
+
+        if is_batch:
+            results = process_batch(
+                input_paths=inputs,
+                output_dir=args.output_dir,
+                positive_prompt=prompt,
+                negative_prompt=args.negative_prompt,
+                dilation_pixels=args.dilation,
+                api_token=args.api_token,
+                save_mask=args.save_mask,
+                workers=args.workers,
+                api_workers=args.api_workers,
+                max_api_workers=args.max_api_workers,
+                api_rate=args.api_rate,
+                mask_model=args.mask_model,
+                feather_pixels=args.feather,
+                use_mask_cache=not args.no_mask_cache,
+                cache_dir=args.cache_dir,
+                use_result_cache=not args.no_cache,
+                refresh_cache=args.refresh,
+                upload_size=args.upload_size,
+                mask_size=args.mask_size,
+                backend="preview" if args.preview else "replicate",
+                dedupe=args.dedupe,
+                dedupe_threshold=args.dedupe_threshold,
+                use_raw_cache=args.raw_cache,
+                ledger_path=args.ledger,
+                resume=not args.no_resume,
+                mask_batch=args.mask_batch,
+                intra_op_threads=args.intra_op_threads,
+                inter_op_threads=args.inter_op_threads,
+                output=output,
+            )
+            return 0 if all(r.ok for r in results) else 1
+
         process_wedding_photo(
-            input_path=args.input,
+            input_path=inputs[0],
             output_path=args.output,
-            positive_prompt=args.prompt,
+            positive_prompt=prompt,
             negative_prompt=args.negative_prompt,
             dilation_pixels=args.dilation,
             api_token=args.api_token,
             save_mask=args.save_mask,
+            mask_model=args.mask_model,
+            feather_pixels=args.feather,
+            use_mask_cache=not args.no_mask_cache,
+            cache_dir=args.cache_dir,
+            use_result_cache=not args.no_cache,
+            refresh_cache=args.refresh,
+            upload_size=args.upload_size,
+            mask_size=args.mask_size,
+            backend="preview" if args.preview else "replicate",
+            use_raw_cache=args.raw_cache,
+            output=output,
         )
         return 0
     except FileNotFoundError as e:
@@ -468,6 +3140,10 @@ def main() -> int:
         import traceback
         traceback.print_exc()
         return 1
+    finally:
+        if sink:
+            metrics.remove_listener(sink)
+            sink.close()
 
 
 if __name__ == "__main__":
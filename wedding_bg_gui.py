@@ -4,17 +4,29 @@ Wedding Photo Background Generator - GUI
 =========================================
 One-click interface for background replacement.
 
+Photos are queued and processed by a small pool of worker threads. Workers
+never touch Tk: they post events to a queue that the Tk loop drains with
+after() polling, so the window stays responsive during large batches.
+
 Double-click this file to run!
 """
 
 from __future__ import annotations
 
+import itertools
 import os
+import queue
 import sys
 import threading
+import time
 import tkinter as tk
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from tkinter import filedialog, messagebox, ttk
 from pathlib import Path
+from typing import Dict, List, Optional
+
+import wedding_bg_metrics as metrics
 
 # Ensure UTF-8 output
 if sys.platform == "win32":
@@ -22,6 +34,45 @@ if sys.platform == "win32":
     if hasattr(sys.stdout, "reconfigure"):
         sys.stdout.reconfigure(encoding="utf-8", errors="replace")
 
+# Mirrors wedding_bg_gen.MASK_MODELS; kept local so startup doesn't import rembg
+MASK_MODELS = ("u2net", "u2netp", "u2net_human_seg", "isnet-general-use", "silueta")
+
+# Long side sent to the API when "Fast upload" is on
+FAST_UPLOAD_SIZE = 1024
+
+# Photos processed at once (each holds a decoded photo and a mask in memory)
+DEFAULT_PARALLEL_JOBS = 2
+MAX_PARALLEL_JOBS = 4
+
+# How often the Tk loop drains worker events (ms)
+POLL_INTERVAL_MS = 100
+
+# Pipeline stages counted for progress; inpainting reports under either name
+PROGRESS_STAGES = ("load_image", "generate_mask", "dilate_mask", "inpaint", "save_output")
+INPAINT_STAGES = {"call_flux_inpainting", "preview_fill"}
+
+# Job states that will not change any more
+FINISHED_STATES = {"done", "failed", "canceled"}
+
+
+@dataclass
+class Job:
+    """One queued photo and its progress (only touched on the Tk thread)."""
+
+    id: str
+    path: str
+    status: str = "pending"
+    stage: str = ""
+    stages_done: int = 0
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    future: Optional[Future] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
 
 class WeddingBgApp:
     """Main GUI Application."""
@@ -29,19 +80,37 @@ class WeddingBgApp:
     def __init__(self, root: tk.Tk):
         self.root = root
         self.root.title("Wedding Photo Background Generator")
-        self.root.geometry("600x500")
+        self.root.geometry("700x720")
         self.root.resizable(True, True)
 
         # Variables
-        self.input_path = tk.StringVar()
-        self.output_path = tk.StringVar()
         self.api_token = tk.StringVar(value=os.environ.get("REPLICATE_API_TOKEN", ""))
         self.dilation = tk.IntVar(value=7)
         self.custom_prompt = tk.StringVar()
-        self.is_processing = False
+        self.mask_model = tk.StringVar(value=MASK_MODELS[0])
+        self.fast_upload = tk.BooleanVar(value=False)
+        self.preview = tk.BooleanVar(value=False)
+        self.parallel_jobs = tk.IntVar(value=DEFAULT_PARALLEL_JOBS)
+        self.status_text = tk.StringVar(value="Add photos to begin.")
+
+        # Job queue state (Tk thread only) and the worker -> Tk event queue
+        self.jobs: Dict[str, Job] = {}
+        self._batch: List[str] = []  # ids submitted since the queue was last idle
+        self._job_ids = itertools.count(1)
+        self._events: "queue.Queue[tuple]" = queue.Queue()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_size = 0
 
         self._create_widgets()
 
+        metrics.add_listener(self._on_stage)
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.root.after(POLL_INTERVAL_MS, self._poll_events)
+
+        # Load the pipeline and the default model while the user picks photos
+        self._warmed: set = set()
+        self._start_prewarm(self.mask_model.get())
+
     def _create_widgets(self):
         """Create all GUI widgets."""
         # Main frame with padding
@@ -56,15 +125,26 @@ class WeddingBgApp:
         )
         title_label.pack(pady=(0, 15))
 
-        # === Input File Section ===
-        input_frame = ttk.LabelFrame(main_frame, text="1. Select Photo", padding="10")
-        input_frame.pack(fill=tk.X, pady=5)
-
-        input_entry = ttk.Entry(input_frame, textvariable=self.input_path, width=50)
-        input_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        # === Input Queue Section ===
+        input_frame = ttk.LabelFrame(main_frame, text="1. Select Photos", padding="10")
+        input_frame.pack(fill=tk.BOTH, expand=True, pady=5)
 
-        browse_btn = ttk.Button(input_frame, text="Browse...", command=self._browse_input)
-        browse_btn.pack(side=tk.RIGHT)
+        self.job_tree = ttk.Treeview(
+            input_frame, columns=("status", "stage"), height=6, selectmode="extended"
+        )
+        self.job_tree.heading("#0", text="Photo")
+        self.job_tree.heading("status", text="Status")
+        self.job_tree.heading("stage", text="Stage")
+        self.job_tree.column("#0", width=360)
+        self.job_tree.column("status", width=90, anchor=tk.CENTER)
+        self.job_tree.column("stage", width=140)
+        self.job_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        queue_buttons = ttk.Frame(input_frame)
+        queue_buttons.pack(side=tk.RIGHT, fill=tk.Y, padx=(5, 0))
+        ttk.Button(queue_buttons, text="Add Photos...", command=self._browse_input).pack(fill=tk.X)
+        ttk.Button(queue_buttons, text="Remove", command=self._remove_selected).pack(fill=tk.X, pady=2)
+        ttk.Button(queue_buttons, text="Clear Finished", command=self._clear_finished).pack(fill=tk.X)
 
         # === API Token Section ===
         token_frame = ttk.LabelFrame(main_frame, text="2. Replicate API Token", padding="10")
@@ -94,6 +174,44 @@ class WeddingBgApp:
         self.dilation_label.pack(side=tk.RIGHT)
         dilation_slider.configure(command=self._update_dilation_label)
 
+        # Mask model and parallelism
+        model_frame = ttk.Frame(options_frame)
+        model_frame.pack(fill=tk.X, pady=2)
+
+        ttk.Label(model_frame, text="Mask Model:").pack(side=tk.LEFT)
+        model_combo = ttk.Combobox(
+            model_frame,
+            textvariable=self.mask_model,
+            values=MASK_MODELS,
+            state="readonly",
+            width=20,
+        )
+        model_combo.pack(side=tk.LEFT, padx=10)
+        model_combo.bind("<<ComboboxSelected>>", lambda _: self._start_prewarm(self.mask_model.get()))
+
+        ttk.Label(model_frame, text="Parallel photos:").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Spinbox(
+            model_frame,
+            from_=1,
+            to=MAX_PARALLEL_JOBS,
+            textvariable=self.parallel_jobs,
+            state="readonly",
+            width=4,
+        ).pack(side=tk.LEFT, padx=10)
+
+        # Upload at model resolution
+        ttk.Checkbutton(
+            options_frame,
+            text="Fast upload (send 1024px, keep full-resolution subject)",
+            variable=self.fast_upload,
+        ).pack(anchor=tk.W, pady=2)
+
+        ttk.Checkbutton(
+            options_frame,
+            text="Preview only (local, about 1 second, no API cost)",
+            variable=self.preview,
+        ).pack(anchor=tk.W, pady=2)
+
         # Custom prompt
         prompt_frame = ttk.Frame(options_frame)
         prompt_frame.pack(fill=tk.X, pady=5)
@@ -102,21 +220,33 @@ class WeddingBgApp:
         prompt_entry = ttk.Entry(prompt_frame, textvariable=self.custom_prompt, width=60)
         prompt_entry.pack(fill=tk.X, pady=2)
 
-        # === Run Button ===
+        # === Run / Cancel Buttons ===
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(pady=10)
+
         self.run_btn = ttk.Button(
-            main_frame,
+            button_frame,
             text="Generate Background",
             command=self._run_generation,
             style="Accent.TButton",
         )
-        self.run_btn.pack(pady=20, ipadx=20, ipady=10)
+        self.run_btn.pack(side=tk.LEFT, ipadx=20, ipady=10, padx=5)
+
+        self.cancel_btn = ttk.Button(
+            button_frame,
+            text="Cancel",
+            command=self._cancel_jobs,
+            state=tk.DISABLED,
+        )
+        self.cancel_btn.pack(side=tk.LEFT, ipadx=10, ipady=10, padx=5)
 
         # === Progress Section ===
         progress_frame = ttk.LabelFrame(main_frame, text="Progress", padding="10")
         progress_frame.pack(fill=tk.BOTH, expand=True, pady=5)
 
-        self.progress_bar = ttk.Progressbar(progress_frame, mode="indeterminate")
+        self.progress_bar = ttk.Progressbar(progress_frame, mode="determinate")
         self.progress_bar.pack(fill=tk.X, pady=5)
+        ttk.Label(progress_frame, textvariable=self.status_text).pack(anchor=tk.W)
 
         # Log text area
         self.log_text = tk.Text(progress_frame, height=8, state=tk.DISABLED, wrap=tk.WORD)
@@ -130,29 +260,60 @@ class WeddingBgApp:
         """Update dilation label with current value."""
         self.dilation_label.configure(text=f"{int(float(value))}px")
 
+    # -------------------------------------------------------------------------
+    # Job list (Tk thread)
+    # -------------------------------------------------------------------------
+
     def _browse_input(self):
-        """Open file dialog to select input image."""
+        """Open file dialog and queue the selected images."""
         filetypes = [
             ("Image files", "*.jpg *.jpeg *.png *.webp *.bmp"),
             ("JPEG files", "*.jpg *.jpeg"),
             ("PNG files", "*.png"),
             ("All files", "*.*"),
         ]
-        filepath = filedialog.askopenfilename(
-            title="Select Wedding Photo",
+        filepaths = filedialog.askopenfilenames(
+            title="Select Wedding Photos",
             filetypes=filetypes,
         )
-        if filepath:
-            self.input_path.set(filepath)
-            self._log(f"Selected: {filepath}")
+        for filepath in filepaths:
+            self._add_job(filepath)
+
+    def _add_job(self, filepath: str):
+        """Add a photo to the list unless it is already waiting or running."""
+        if any(job.path == filepath and job.status not in FINISHED_STATES for job in self.jobs.values()):
+            self._log(f"Already queued: {filepath}")
+            return
+        job = Job(id=f"job{next(self._job_ids)}", path=filepath)
+        self.jobs[job.id] = job
+        self.job_tree.insert("", tk.END, iid=job.id, text=Path(filepath).name, values=("pending", ""))
+        self._log(f"Selected: {filepath}")
+        self._refresh_progress()
+
+    def _remove_selected(self):
+        """Remove selected photos that are not queued or running."""
+        for job_id in self.job_tree.selection():
+            if not self.jobs[job_id].active:
+                del self.jobs[job_id]
+                self.job_tree.delete(job_id)
+        self._refresh_progress()
+
+    def _clear_finished(self):
+        """Drop finished jobs from the list."""
+        for job_id in [j.id for j in self.jobs.values() if j.status in FINISHED_STATES]:
+            del self.jobs[job_id]
+            self.job_tree.delete(job_id)
+        self._refresh_progress()
+
+    def _update_row(self, job: Job):
+        self.job_tree.item(job.id, values=(job.status, job.stage))
 
     def _log(self, message: str):
-        """Add message to log area."""
+        """Add message to log area (Tk thread only)."""
         self.log_text.configure(state=tk.NORMAL)
         self.log_text.insert(tk.END, message + "\n")
         self.log_text.see(tk.END)
         self.log_text.configure(state=tk.DISABLED)
-        self.root.update_idletasks()
 
     def _clear_log(self):
         """Clear log area."""
@@ -160,83 +321,251 @@ class WeddingBgApp:
         self.log_text.delete("1.0", tk.END)
         self.log_text.configure(state=tk.DISABLED)
 
+    # -------------------------------------------------------------------------
+    # Submitting and cancelling (Tk thread)
+    # -------------------------------------------------------------------------
+
     def _run_generation(self):
-        """Run the background generation process."""
+        """Submit every pending photo to the worker pool."""
+        pending = [job for job in self.jobs.values() if job.status == "pending"]
+
         # Validation
-        if not self.input_path.get():
-            messagebox.showerror("Error", "Please select an input photo.")
+        if not pending:
+            messagebox.showerror("Error", "Please add at least one photo.")
             return
 
-        if not Path(self.input_path.get()).exists():
-            messagebox.showerror("Error", "Selected file does not exist.")
+        missing = [job.path for job in pending if not Path(job.path).exists()]
+        if missing:
+            messagebox.showerror("Error", f"Selected file does not exist:\n{missing[0]}")
             return
 
-        if not self.api_token.get():
+        if not self.api_token.get() and not self.preview.get():
             messagebox.showerror("Error", "Please enter your Replicate API token.")
             return
 
-        if self.is_processing:
-            messagebox.showwarning("Warning", "Already processing. Please wait.")
+        # Options are read here: Tk variables must not be touched by workers
+        prompt = self.custom_prompt.get().strip() or None
+        preview = self.preview.get()
+        options = {
+            "api_token": self.api_token.get() or None,
+            "positive_prompt": prompt,
+            "dilation_pixels": self.dilation.get(),
+            "mask_model": self.mask_model.get(),
+            "upload_size": FAST_UPLOAD_SIZE if self.fast_upload.get() else 0,
+            "backend": "preview" if preview else "replicate",
+        }
+
+        if not any(job.active for job in self.jobs.values()):
+            self._batch = []
+            self._clear_log()
+        self._log(f"Queued {len(pending)} photo(s) "
+                  f"({'preview' if preview else 'Replicate'}, mask model {options['mask_model']})")
+        if prompt:
+            self._log(f"Custom prompt: {prompt[:50]}...")
+
+        pool = self._get_pool()
+        for job in pending:
+            job.status = "queued"
+            job.stage = ""
+            job.stages_done = 0
+            job.future = pool.submit(self._run_job, job.id, job.path, job.cancel_event, options)
+            self._batch.append(job.id)
+            self._update_row(job)
+
+        self.cancel_btn.configure(state=tk.NORMAL)
+        self._refresh_progress()
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        """Worker pool sized by "Parallel photos" (resized only when idle)."""
+        size = max(1, min(MAX_PARALLEL_JOBS, self.parallel_jobs.get()))
+        if self._pool is not None and size != self._pool_size:
+            if not any(job.active for job in self.jobs.values()):
+                self._pool.shutdown(wait=False)
+                self._pool = None
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix="wedding-bg")
+            self._pool_size = size
+        return self._pool
+
+    def _cancel_jobs(self):
+        """Cancel the selected jobs, or every queued/running job if none is selected."""
+        selected = [self.jobs[i] for i in self.job_tree.selection() if self.jobs[i].active]
+        targets = selected or [job for job in self.jobs.values() if job.active]
+        for job in targets:
+            job.cancel_event.set()
+            if job.future is not None and job.future.cancel():
+                # Never started: nothing else will report on it
+                self._finish_job(job, "canceled", None)
+            else:
+                job.stage = "cancelling..."
+                self._update_row(job)
+        if targets:
+            self._log(f"Cancelling {len(targets)} job(s)...")
+
+    def _on_close(self):
+        """Stop workers (cancelling in-flight predictions) and close the window."""
+        for job in self.jobs.values():
+            if job.active:
+                job.cancel_event.set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        metrics.remove_listener(self._on_stage)
+        self.root.destroy()
+
+    # -------------------------------------------------------------------------
+    # Worker side (pool threads; communicates only through self._events)
+    # -------------------------------------------------------------------------
+
+    def _start_prewarm(self, model_name: str):
+        """Import wedding_bg_gen and load `model_name` on a daemon thread (once per model)."""
+        if model_name in self._warmed:
             return
+        self._warmed.add(model_name)
+        threading.Thread(target=self._prewarm, args=(model_name,), daemon=True).start()
 
-        # Start processing in background thread
-        self.is_processing = True
-        self.run_btn.configure(state=tk.DISABLED)
-        self.progress_bar.start(10)
-        self._clear_log()
-        self._log("Starting background generation...")
+    def _prewarm(self, model_name: str):
+        start = time.perf_counter()
+        try:
+            import wedding_bg_gen
+            wedding_bg_gen.prewarm(model_name)
+        except BaseException as e:  # includes the SystemExit of a missing dependency
+            self._events.put(("log", f"[WARN] Could not preload {model_name}: {e}"))
+            return
+        self._events.put(("log", f"Mask model {model_name} ready ({time.perf_counter() - start:.1f}s)"))
 
-        thread = threading.Thread(target=self._process_image, daemon=True)
-        thread.start()
+    def _on_stage(self, record: dict):
+        """Metrics listener: forward finished stages to the Tk loop (any thread)."""
+        if record.get("event") == "stage":
+            self._events.put(("stage", record["input"], record["stage"], record["wall_s"], record["ok"]))
 
-    def _process_image(self):
-        """Process the image in background thread."""
+    def _run_job(self, job_id: str, input_path: str, cancel_event: threading.Event, options: dict):
+        """Process one photo in a pool thread."""
+        self._events.put(("status", job_id, "running", None))
         try:
-            # Set API token
-            os.environ["REPLICATE_API_TOKEN"] = self.api_token.get()
-
             # Import here to avoid startup delay
-            self._log("Loading modules...")
-            from wedding_bg_gen import process_wedding_photo
-
-            # Run the pipeline
-            prompt = self.custom_prompt.get() if self.custom_prompt.get().strip() else None
-
-            self._log(f"Input: {self.input_path.get()}")
-            self._log(f"Dilation: {self.dilation.get()}px")
-            if prompt:
-                self._log(f"Custom prompt: {prompt[:50]}...")
-            self._log("")
-            self._log("Processing... This may take 30-60 seconds.")
+            from wedding_bg_cache import file_digest
+            from wedding_bg_gen import ProcessingCancelled, output_name, process_wedding_photo
+        except Exception as e:
+            self._events.put(("status", job_id, "failed", f"Could not load pipeline: {e}"))
+            return
 
+        try:
+            # Next to the photo, named like CLI/batch output (the content hash
+            # keeps a.jpg and a.heic in one folder apart)
+            suffix = "_preview" if options["backend"] == "preview" else "_bg"
+            source = Path(input_path)
+            name = output_name(input_path, file_digest(input_path), suffix)
             output_path = process_wedding_photo(
-                input_path=self.input_path.get(),
-                output_path=None,
-                positive_prompt=prompt,
-                dilation_pixels=self.dilation.get(),
+                input_path=input_path,
+                output_path=str(source.with_name(name)),
+                cancel_event=cancel_event,
+                **options,
             )
+        except ProcessingCancelled:
+            self._events.put(("status", job_id, "canceled", None))
+        except Exception as e:
+            self._events.put(("status", job_id, "failed", str(e)))
+        else:
+            self._events.put(("status", job_id, "done", output_path))
 
-            self._log("")
-            self._log(f"[SUCCESS] Output saved to:")
-            self._log(output_path)
+    # -------------------------------------------------------------------------
+    # Event polling (Tk thread)
+    # -------------------------------------------------------------------------
 
-            # Show success message
-            self.root.after(0, lambda: messagebox.showinfo(
+    def _poll_events(self):
+        """Apply queued worker events to the widgets, then reschedule."""
+        try:
+            while True:
+                event = self._events.get_nowait()
+                if event[0] == "log":
+                    self._log(event[1])
+                elif event[0] == "stage":
+                    self._apply_stage(*event[1:])
+                else:
+                    job = self.jobs.get(event[1])
+                    if job is None:
+                        continue
+                    if event[2] == "running":
+                        job.status = "running"
+                        job.stage = PROGRESS_STAGES[0] + "..."
+                        self._update_row(job)
+                    else:
+                        self._finish_job(job, event[2], event[3])
+        except queue.Empty:
+            pass
+
+        self._refresh_progress()
+        self.root.after(POLL_INTERVAL_MS, self._poll_events)
+
+    def _apply_stage(self, input_path: str, stage: str, wall_s: float, ok: bool):
+        job = next(
+            (j for j in self.jobs.values() if j.path == input_path and j.status == "running"),
+            None,
+        )
+        if job is None:
+            return
+        name = "inpaint" if stage in INPAINT_STAGES else stage
+        if name in PROGRESS_STAGES:
+            job.stages_done = max(job.stages_done, PROGRESS_STAGES.index(name) + 1)
+        # Show the stage now running, not the one that just finished
+        if job.stages_done < len(PROGRESS_STAGES) and not job.cancel_event.is_set():
+            job.stage = PROGRESS_STAGES[job.stages_done] + "..."
+        self._update_row(job)
+        line = f"  {Path(input_path).name} - {stage}: {wall_s:.2f}s"
+        self._log(line if ok else line + " (failed)")
+
+    def _finish_job(self, job: Job, status: str, detail: Optional[str]):
+        job.status = status
+        job.stages_done = len(PROGRESS_STAGES)
+        job.stage = ""
+        if status == "done":
+            job.output_path = detail
+            self._log(f"[SUCCESS] {Path(job.path).name} -> {detail}")
+        elif status == "failed":
+            job.error = detail
+            self._log(f"[ERROR] {Path(job.path).name}: {detail}")
+        else:
+            self._log(f"[CANCELED] {Path(job.path).name}")
+        self._update_row(job)
+
+        if not any(j.active for j in self.jobs.values()):
+            self._on_queue_finished()
+
+    def _on_queue_finished(self):
+        """All submitted jobs finished: report and reset the buttons."""
+        self.cancel_btn.configure(state=tk.DISABLED)
+        batch = [self.jobs[i] for i in self._batch if i in self.jobs]
+        done = [j for j in batch if j.status == "done"]
+        failed = [j for j in batch if j.status == "failed"]
+        if failed:
+            messagebox.showerror(
+                "Error",
+                f"{len(failed)} photo(s) failed. First error:\n{failed[0].error}",
+            )
+        elif done:
+            messagebox.showinfo(
                 "Success",
-                f"Background replaced successfully!\n\nSaved to:\n{output_path}"
-            ))
-
+                f"Background replaced for {len(done)} photo(s)!\n\n"
+                f"Last saved to:\n{done[-1].output_path}",
+            )
             # Open output folder
-            self.root.after(0, lambda: os.startfile(Path(output_path).parent))
-
-        except Exception as e:
-            self._log(f"[ERROR] {str(e)}")
-            self.root.after(0, lambda: messagebox.showerror("Error", str(e)))
-
-        finally:
-            self.is_processing = False
-            self.root.after(0, lambda: self.run_btn.configure(state=tk.NORMAL))
-            self.root.after(0, self.progress_bar.stop)
+            if hasattr(os, "startfile"):
+                os.startfile(Path(done[-1].output_path).parent)
+
+    def _refresh_progress(self):
+        """Progress bar over the current submission; status line over the whole list."""
+        submitted = [self.jobs[i] for i in self._batch if i in self.jobs]
+        total = len(submitted) * len(PROGRESS_STAGES)
+        self.progress_bar.configure(maximum=max(total, 1), value=sum(j.stages_done for j in submitted))
+
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        if not self.jobs:
+            self.status_text.set("Add photos to begin.")
+        else:
+            order = ("running", "queued", "pending", "done", "failed", "canceled")
+            self.status_text.set(", ".join(f"{counts[s]} {s}" for s in order if counts.get(s)))
 
 
 def main():
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Wedding BG Generator - Batch Job Ledger
+=======================================
+Crash-safe record of batch jobs, so an interrupted album run can resume.
+
+A job is one input photo under one set of parameters (prompts, mask and
+inpainting settings). Its row holds the photo's content hash, the state
+(pending -> running -> done | failed, or skipped for duplicates), the
+output path, per-stage timings, attempts and the last error. The ledger
+is a SQLite database in WAL mode and every state change is its own short
+transaction, so a crash loses at most the jobs that were in flight.
+
+Re-running the same batch against the same ledger skips jobs that are
+done (same photo content, output still on disk) and runs everything
+else: pending and failed jobs, and jobs a dead process left `running`.
+
+Usage:
+    python wedding_bg_ledger.py results/
+    python wedding_bg_ledger.py results/wedding_bg_jobs.sqlite --state failed
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+
+# Ledger file created in the batch output directory
+LEDGER_NAME = "wedding_bg_jobs.sqlite"
+
+# Job states, in lifecycle order
+STATES = ("pending", "running", "done", "failed", "skipped")
+
+
+@dataclass
+class Job:
+    """One ledger row."""
+
+    input_path: str
+    params_key: str
+    input_sha256: str
+    state: str
+    output_path: Optional[str] = None
+    error: Optional[str] = None
+    duplicate_of: Optional[str] = None
+    attempts: int = 0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    mask_s: Optional[float] = None
+    inpaint_s: Optional[float] = None
+
+
+_COLUMNS = (
+    "input_path, params_key, input_sha256, state, output_path, error, duplicate_of,"
+    " attempts, started_at, finished_at, mask_s, inpaint_s"
+)
+
+
+def params_key(params: dict) -> str:
+    """Short stable hash of a parameter set (canonical JSON)."""
+    payload = json.dumps(params, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _key_path(input_path: Union[str, Path]) -> str:
+    return str(Path(input_path).resolve())
+
+
+class JobLedger:
+    """
+    Job ledger bound to one parameter set.
+
+    Rows are keyed by (resolved input path, params key), so the same
+    photo processed with other settings is a separate job, and identical
+    copies at different paths are tracked separately. Each operation opens
+    its own connection, as in ResultCache.
+
+    Args:
+        path: Ledger file, or a directory to create LEDGER_NAME in
+        params: Parameters that define the jobs (stored as JSON)
+    """
+
+    def __init__(self, path: Union[str, Path], params: dict):
+        path = Path(path)
+        self.path = path / LEDGER_NAME if path.is_dir() else path
+        self.params = params
+        self.params_key = params_key(params)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS params ("
+                " params_key TEXT PRIMARY KEY,"
+                " params TEXT NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " input_path TEXT NOT NULL,"
+                " params_key TEXT NOT NULL,"
+                " input_sha256 TEXT NOT NULL,"
+                " state TEXT NOT NULL,"
+                " output_path TEXT,"
+                " error TEXT,"
+                " duplicate_of TEXT,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " started_at REAL,"
+                " finished_at REAL,"
+                " mask_s REAL,"
+                " inpaint_s REAL,"
+                " PRIMARY KEY (input_path, params_key))"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO params VALUES (?, ?, ?)",
+                (self.params_key, json.dumps(params, sort_keys=True), time.time()),
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        # WAL makes each commit durable against a process crash without an
+        # fsync of the main database file per state change
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _update(self, input_path: str, **fields) -> None:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE input_path = ? AND params_key = ?",
+                (*fields.values(), _key_path(input_path), self.params_key),
+            )
+
+    def plan(self, digests: Dict[str, str], resume: bool = True) -> Dict[str, Job]:
+        """
+        Register inputs and return the done jobs that can be skipped.
+
+        A job counts as done only if the photo content is unchanged and its
+        output file still exists; every other input is (re)set to pending.
+
+        Args:
+            digests: Input path -> SHA-256 of its content
+            resume: False re-runs every input regardless of earlier runs
+
+        Returns:
+            Input path -> Job for inputs that need no work
+        """
+        done: Dict[str, Job] = {}
+        with closing(self._connect()) as conn, conn:
+            for input_path, sha256 in digests.items():
+                key = _key_path(input_path)
+                row = conn.execute(
+                    f"SELECT {_COLUMNS} FROM jobs WHERE input_path = ? AND params_key = ?",
+                    (key, self.params_key),
+                ).fetchone()
+                job = Job(*row) if row else None
+                if (
+                    resume and job and job.state == "done" and job.input_sha256 == sha256
+                    and job.output_path and Path(job.output_path).exists()
+                ):
+                    done[input_path] = job
+                    continue
+                conn.execute(
+                    "INSERT INTO jobs (input_path, params_key, input_sha256, state)"
+                    " VALUES (?, ?, ?, 'pending')"
+                    " ON CONFLICT (input_path, params_key) DO UPDATE SET"
+                    " input_sha256 = excluded.input_sha256, state = 'pending',"
+                    " duplicate_of = NULL",
+                    (key, self.params_key, sha256),
+                )
+        return done
+
+    def start(self, input_path: str) -> None:
+        """Mark a job running (one more attempt)."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET state = 'running', attempts = attempts + 1,"
+                " started_at = ?, finished_at = NULL, error = NULL"
+                " WHERE input_path = ? AND params_key = ?",
+                (time.time(), _key_path(input_path), self.params_key),
+            )
+
+    def finish(
+        self,
+        input_path: str,
+        output_path: str,
+        mask_s: Optional[float] = None,
+        inpaint_s: Optional[float] = None,
+    ) -> None:
+        """Mark a job done with its output and stage timings."""
+        self._update(
+            input_path, state="done", output_path=str(Path(output_path).resolve()),
+            finished_at=time.time(), mask_s=mask_s, inpaint_s=inpaint_s,
+        )
+
+    def fail(self, input_path: str, error: str, mask_s: Optional[float] = None) -> None:
+        """Mark a job failed; the next run retries it."""
+        self._update(
+            input_path, state="failed", error=error, finished_at=time.time(), mask_s=mask_s,
+        )
+
+    def skip(self, input_path: str, duplicate_of: str) -> None:
+        """Mark a job skipped as a duplicate of another input."""
+        self._update(
+            input_path, state="skipped", duplicate_of=_key_path(duplicate_of),
+            finished_at=time.time(),
+        )
+
+    def jobs(self, state: Optional[str] = None) -> List[Job]:
+        """Jobs of this parameter set, optionally only those in `state`."""
+        query = f"SELECT {_COLUMNS} FROM jobs WHERE params_key = ?"
+        args: tuple = (self.params_key,)
+        if state:
+            query += " AND state = ?"
+            args += (state,)
+        with closing(self._connect()) as conn:
+            return [Job(*row) for row in conn.execute(query + " ORDER BY input_path", args)]
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per state for this parameter set."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT state, COUNT(*) FROM jobs WHERE params_key = ? GROUP BY state",
+                (self.params_key,),
+            ).fetchall()
+        return dict(rows)
+
+    def summary(self) -> str:
+        """One-line job count summary for run reports."""
+        counts = self.counts()
+        parts = [f"{counts[state]} {state}" for state in STATES if counts.get(state)]
+        return f"job ledger: {', '.join(parts) or 'empty'} ({self.path})"
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+def _ledger_params(path: Path) -> List[dict]:
+    """Every parameter set recorded in a ledger file, newest first."""
+    with closing(sqlite3.connect(path, timeout=30)) as conn:
+        rows = conn.execute("SELECT params FROM params ORDER BY created DESC").fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+
+def main() -> int:
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Show the job ledger of a batch run")
+    parser.add_argument("ledger", help=f"Ledger file or batch output directory (containing {LEDGER_NAME})")
+    parser.add_argument("--state", choices=STATES, help="List jobs in this state")
+    args = parser.parse_args()
+
+    path = Path(args.ledger)
+    if path.is_dir():
+        path = path / LEDGER_NAME
+    if not path.exists():
+        print(f"[ERROR] No job ledger at {path}")
+        return 1
+
+    for params in _ledger_params(path):
+        ledger = JobLedger(path, params)
+        print(f"Parameters {ledger.params_key}:")
+        for name, value in sorted(params.items()):
+            print(f"  {name}: {value}")
+        print(f"  {ledger.summary()}")
+
+        for job in ledger.jobs(args.state) if args.state else []:
+            timing = " ".join(
+                f"{name} {value:.1f}s" for name, value in
+                (("mask", job.mask_s), ("inpaint", job.inpaint_s)) if value is not None
+            )
+            detail = job.error or job.output_path or job.duplicate_of or ""
+            print(f"    [{job.state}] {job.input_path} (attempts {job.attempts}"
+                  f"{', ' + timing if timing else ''}) {detail}")
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Wedding BG Generator - Pipeline Instrumentation
+===============================================
+Per-stage timing and resource records for the background pipeline.
+
+Pipeline functions are wrapped with @instrumented(stage). When at least
+one listener is registered, every call produces a record with wall time,
+CPU time, peak RSS and bytes uploaded/downloaded, delivered to listeners
+as a plain dict (and written as JSON lines by JsonLinesSink).
+
+Usage:
+    import wedding_bg_metrics as metrics
+    metrics.add_listener(lambda record: print(record["stage"], record["wall_s"]))
+
+With no listeners registered, instrumented calls add no measurement work.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO
+
+
+Listener = Callable[[Dict[str, Any]], None]
+
+_listeners: List[Listener] = []
+_listeners_lock = threading.Lock()
+
+# Photo currently being processed (set by the pipeline, read by records)
+current_input: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_input", default=None
+)
+
+# Record of the innermost running stage, for count_bytes()
+_current_record: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar(
+    "current_record", default=None
+)
+
+
+# =============================================================================
+# LISTENERS
+# =============================================================================
+
+def add_listener(listener: Listener) -> None:
+    """Subscribe to stage records (called from whichever thread ran the stage)."""
+    with _listeners_lock:
+        _listeners.append(listener)
+
+
+def remove_listener(listener: Listener) -> None:
+    """Unsubscribe a listener added with add_listener."""
+    with _listeners_lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def enabled() -> bool:
+    """True when at least one listener is registered."""
+    return bool(_listeners)
+
+
+def emit(record: Dict[str, Any]) -> None:
+    """Deliver a record to every listener; listener errors never break the pipeline."""
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        try:
+            listener(record)
+        except Exception as e:
+            print(f"[WARN] metrics listener failed: {e}", file=sys.stderr)
+
+
+class JsonLinesSink:
+    """Listener that appends each record as one JSON line to a file or stream."""
+
+    def __init__(self, target: str):
+        self._lock = threading.Lock()
+        if target == "-":
+            self._stream: TextIO = sys.stdout
+            self._owned = False
+        else:
+            self._stream = open(target, "a", encoding="utf-8")
+            self._owned = True
+
+    def __call__(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+    def close(self) -> None:
+        if self._owned:
+            self._stream.close()
+
+
+class Collector:
+    """Listener that keeps records in memory (used to ship them out of worker processes)."""
+
+    def __init__(self):
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self.records.append(record)
+
+
+@contextlib.contextmanager
+def capture() -> Iterator[Collector]:
+    """
+    Route records to a fresh Collector only, for the duration of the block.
+
+    Worker processes use this so records reach the parent exactly once,
+    even when listeners were inherited through fork.
+    """
+    global _listeners
+    collector = Collector()
+    with _listeners_lock:
+        saved, _listeners = _listeners, [collector]
+    try:
+        yield collector
+    finally:
+        with _listeners_lock:
+            _listeners = saved
+
+
+# =============================================================================
+# MEASUREMENT
+# =============================================================================
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process, or None if unavailable."""
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        # Windows exposes the true peak; elsewhere fall through to getrusage
+        if hasattr(info, "peak_wset"):
+            return int(info.peak_wset)
+    except ImportError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux but bytes on macOS
+    return int(peak if sys.platform == "darwin" else peak * 1024)
+
+
+def count_bytes(up: int = 0, down: int = 0) -> None:
+    """Attribute uploaded/downloaded bytes to the running stage (no-op outside one)."""
+    record = _current_record.get()
+    if record is not None:
+        record["bytes_up"] += up
+        record["bytes_down"] += down
+
+
+def _start(stage: str) -> Dict[str, Any]:
+    return {
+        "event": "stage",
+        "stage": stage,
+        "input": current_input.get(),
+        "time": time.time(),
+        "bytes_up": 0,
+        "bytes_down": 0,
+        "_wall": time.perf_counter(),
+    }
+
+
+def _finish(record: Dict[str, Any], cpu_s: float, error: Optional[BaseException]) -> None:
+    record["wall_s"] = round(time.perf_counter() - record.pop("_wall"), 6)
+    record["cpu_s"] = round(cpu_s, 6)
+    peak = peak_rss_bytes()
+    record["peak_rss_mb"] = round(peak / 2**20, 1) if peak else None
+    record["ok"] = error is None
+    record["error"] = f"{type(error).__name__}: {error}" if error else None
+    emit(record)
+
+
+def instrumented(stage: str) -> Callable:
+    """
+    Decorator recording one stage record per call (sync or async functions).
+
+    cpu_s is the CPU time of the thread running a sync stage; for async
+    stages, which hand work to other threads, it is process CPU time and
+    overlaps with any concurrent stages.
+    """
+    def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _listeners:
+                    return await func(*args, **kwargs)
+                record = _start(stage)
+                token = _current_record.set(record)
+                cpu_start = time.process_time()
+                error = None
+                try:
+                    return await func(*args, **kwargs)
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    _current_record.reset(token)
+                    _finish(record, time.process_time() - cpu_start, error)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _listeners:
+                return func(*args, **kwargs)
+            record = _start(stage)
+            token = _current_record.set(record)
+            cpu_start = time.thread_time()
+            error = None
+            try:
+                return func(*args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                _current_record.reset(token)
+                _finish(record, time.thread_time() - cpu_start, error)
+        return wrapper
+
+    return decorator